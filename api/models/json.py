@@ -1,63 +1,291 @@
-#!/usr/bin/python
-# -*- coding: utf-8 -*-
-import logging
-from sqlalchemy import or_
-from sqlalchemy.sql.functions import count
-from api.models.json_access_map import JsonAccessMap
-from api.models.team import Team
-from api.models.team_json_map import TeamJsonMap
-from api.models.team_member_map import TeamMemberMap
-from api.utils.database import db
-from marshmallow_sqlalchemy import ModelSchema
-from marshmallow import fields
-
-
-class Json(db.Model):
-    __tablename__ = 'json'
-
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
-    data = db.Column(db.String(10000))
-    created = db.Column(db.DateTime, server_default=db.func.now())
-    updated = db.Column(db.DateTime, onupdate=db.func.now())
-
-    def __init__(self, data):
-        self.data = data
-
-    def create(self):
-        db.session.add(self)
-        db.session.commit()
-        return self
-
-    @staticmethod
-    def count_json(uid):
-        """Count the number of JSONs a user has access to
-        :param uid:
-        :return: int
-        """
-        try:
-            # get json through user mapping path
-            query_user_json = db.session.query(Json.id).join(JsonAccessMap).filter(JsonAccessMap.user == uid)
-
-            # get json through team mapping path
-            teams = db.session.query(Team.id).join(TeamMemberMap).filter(TeamMemberMap.user == uid)
-            query_team_json = db.session.query(Json.id).join(TeamJsonMap).filter(TeamJsonMap.team.in_(teams))
-
-            # count distinct json in team and user path
-            json_count = db.session.query(count(Json.id.distinct()))\
-                .filter(or_(Json.id.in_(query_user_json),
-                            Json.id.in_(query_team_json))).scalar()
-            return json_count
-        except Exception as e:
-            logging.error(e)
-            raise
-
-
-class JsonSchema(ModelSchema):
-    class Meta(ModelSchema.Meta):
-        model = Json
-        sqla_session = db.session
-
-    id = fields.Integer(dump_only=True)
-    data = fields.String(required=True)
-    created = fields.String(dump_only=True)
-    updated = fields.String(dump_only=True)
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+from sqlalchemy import ForeignKey, and_, exists, literal, or_
+from sqlalchemy.sql.functions import count
+from api.models.json_access_map import JsonAccessMap
+from api.models.json_body import JsonBody
+from api.models.json_term import JsonTerm
+from api.models.json_version import JsonVersion
+from api.models.validation_schema import ValidationSchema
+from api.models.team import Team
+from api.models.team_json_map import TeamJsonMap
+from api.models.team_member_map import TeamMemberMap
+from api.utils import counters, json_backend
+from api.utils.cache import MISSING, deep_size, document_cache
+from api.utils.database import db
+from api.utils.enums import JsonAccessMapType
+from marshmallow_sqlalchemy import ModelSchema
+from marshmallow import fields
+
+# documents saved by one create_many
+BULK_LIMIT = 10000
+
+
+class Json(db.Model):
+    """Metadata of a stored JSON, the document itself lives in json_body,
+    shared with every json of the same content, and is only loaded when ``data`` is read"""
+    __tablename__ = 'json'
+    __table_args__ = (
+        db.Index('ix_json_updated_id', 'updated', 'id'),
+        db.Index('ix_json_body', 'body'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    body = db.Column(db.BigInteger, ForeignKey("json_body.id"))
+    size = db.Column(db.BigInteger)
+    hash = db.Column(db.String(64))
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    schema = db.Column(db.BigInteger, ForeignKey("validation_schema.id"))
+    created = db.Column(db.DateTime, server_default=db.func.now())
+    updated = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
+    content = db.relationship(JsonBody, lazy='select')
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def data(self):
+        if self.content is None:
+            return self._pending.decode('utf-8') if getattr(self, '_pending', None) is not None else None
+        return self.content.text
+
+    @data.setter
+    def data(self, data):
+        """Set the document, stored on create
+        :param data: str or utf-8 bytes, expected in the canonical form of api.utils.json_backend.canonical
+        """
+        self._pending = data if isinstance(data, bytes) else data.encode('utf-8')
+        self.size = len(self._pending)
+        self.hash = hashlib.sha256(self._pending).hexdigest()
+
+    def parsed(self):
+        """The parsed document, shared through the parsed-document cache, callers must not modify it
+        :return: parsed document
+        """
+        # a new document always comes with a new updated or hash
+        key = (self.id, self.updated, self.hash)
+        document = document_cache.get(key)
+        if document is MISSING:
+            document = json_backend.loads(self.content.decoded)
+            document_cache.set(key, document, deep_size(document))
+        return document
+
+    def create(self, author=None, document=None):
+        """
+        :param author: user id recorded on the first version
+        :param document: parsed data, parsed again when None
+        :return: Json
+        """
+        try:
+            self.body = JsonBody.acquire(self._pending, self.hash)
+            self.version = 1
+            db.session.add(self)
+            db.session.flush()
+            JsonVersion.record(self.id, self.version, self._pending, self.hash, author=author)
+            JsonTerm.index(self.id, document if document is not None else json_backend.loads(self._pending))
+            self._pending = None
+            db.session.flush()
+            return self
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def create_many(documents, owner):
+        """Save documents owned by a user in one transaction, with multi-row inserts
+        of their bodies, first versions, owner access and search postings
+        :param documents: [(bytes, parsed document)], canonical utf-8 encoded documents and their parsed form
+        :param owner: user id, owner of the jsons and author of their first versions
+        :return: [int] json ids, in the order of documents
+        """
+        try:
+            jsons = [Json(data) for data, _ in documents]
+
+            # every json references its body twice, from the row and from its first version
+            references = {}
+            for json in jsons:
+                references[json.hash] = (json._pending, references.get(json.hash, (None, 0))[1] + 2)
+            bodies = JsonBody.acquire_many(references)
+
+            for json in jsons:
+                json.body = bodies[json.hash]
+                json.version = 1
+                json._pending = None
+            # rows are flushed one by one, their ids are needed by every other insert
+            db.session.add_all(jsons)
+            db.session.flush()
+
+            JsonVersion.record_created(jsons, author=owner)
+            db.session.execute(JsonAccessMap.__table__.insert(), [
+                {'user': owner, 'json': json.id, 'type': JsonAccessMapType.OWNER.value} for json in jsons])
+            counters.jsons_created(db.session.connection(), owner, len(jsons))
+            JsonTerm.index_many([(json.id, document) for json, (_, document) in zip(jsons, documents)])
+            db.session.flush()
+            return [json.id for json in jsons]
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    def update(self, data, document=None, author=None):
+        """Replace the document, releasing the previous body, record the change as a new version
+        and update the search index
+        :param data: bytes, canonical utf-8 encoded document
+        :param document: parsed data, parsed again when None
+        :param author: user id recorded on the version
+        :return:
+        """
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            if digest != self.hash:
+                if document is None:
+                    document = json_backend.loads(data)
+                previous_document = self.parsed()
+                previous = self.body
+                self.body = JsonBody.acquire(data, digest)
+                self.size = len(data)
+                self.hash = digest
+                self.version += 1
+                JsonVersion.record(self.id, self.version, data, digest,
+                                   document=document, previous=previous_document, author=author)
+                JsonTerm.index(self.id, document, previous=previous_document)
+                JsonBody.release(previous)
+                db.session.flush()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    def attach_schema(self, schema_id):
+        """
+        :param schema_id: ValidationSchema id validating the document from now on, None to detach
+        :return:
+        """
+        try:
+            if schema_id != self.schema:
+                self.schema = schema_id
+                db.session.flush()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def validators(json_id):
+        """Validators of the schema attached to a json and of the teams it is shared with
+        :param json_id: int
+        :return: [api.utils.validation.Validator]
+        """
+        try:
+            own = db.session.query(Json.schema).filter(Json.id == json_id)
+            shared = db.session.query(Team.schema).join(TeamJsonMap, TeamJsonMap.team == Team.id)\
+                .filter(TeamJsonMap.json == json_id)
+            return ValidationSchema.validators(row[0] for row in own.union_all(shared))
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def count_json(uid):
+        """Count the number of JSONs a user has access to
+        :param uid:
+        :return: int
+        """
+        try:
+            # get json through user mapping path
+            query_user_json = db.session.query(Json.id).join(JsonAccessMap).filter(JsonAccessMap.user == uid)
+
+            # get json through team mapping path
+            teams = db.session.query(Team.id).join(TeamMemberMap).filter(TeamMemberMap.user == uid)
+            query_team_json = db.session.query(Json.id).join(TeamJsonMap).filter(TeamJsonMap.team.in_(teams))
+
+            # count distinct json in team and user path
+            json_count = db.session.query(count(Json.id.distinct()))\
+                .filter(or_(Json.id.in_(query_user_json),
+                            Json.id.in_(query_team_json))).scalar()
+            return json_count
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def list_json(uid, limit, after=None):
+        """Page of the JSONs a user has access to, newest first, without their data
+        :param uid:
+        :param limit: int, number of rows
+        :param after: (updated, id) of the last row of the previous page
+        :return: [(id, created, updated, permission)]
+        """
+        try:
+            def page(query):
+                if after is not None:
+                    query = query.filter(or_(Json.updated < after[0],
+                                             and_(Json.updated == after[0], Json.id < after[1])))
+                return query.order_by(Json.updated.desc(), Json.id.desc()).limit(limit).all()
+
+            # json through user mapping path
+            query_user_json = db.session.query(Json.id, Json.created, Json.updated,
+                                               JsonAccessMap.type.label('permission'))\
+                .join(JsonAccessMap).filter(JsonAccessMap.user == uid)
+
+            # json through team mapping path only, readable
+            direct = exists().where(and_(JsonAccessMap.json == Json.id, JsonAccessMap.user == uid))
+            query_team_json = db.session.query(Json.id, Json.created, Json.updated,
+                                               literal(JsonAccessMapType.READ.value).label('permission'))\
+                .join(TeamJsonMap).join(TeamMemberMap, TeamMemberMap.team == TeamJsonMap.team)\
+                .filter(TeamMemberMap.user == uid, ~direct).distinct()
+
+            # each path returns its own first rows, the page is the first rows of both
+            rows = page(query_user_json) + page(query_team_json)
+            rows.sort(key=lambda row: (row.updated, row.id), reverse=True)
+            return rows[:limit]
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def search(uid, terms, limit, after=None):
+        """Page of the JSONs a user has access to containing every given term, newest first, without their data
+        :param uid:
+        :param terms: set of str, see api.utils.search.query_terms
+        :param limit: int, number of rows
+        :param after: id of the last row of the previous page
+        :return: [(id, created, updated, permission)]
+        """
+        try:
+            # the same access set as count_json
+            query_user_json = db.session.query(JsonAccessMap.json).filter(JsonAccessMap.user == uid)
+            teams = db.session.query(TeamMemberMap.team).filter(TeamMemberMap.user == uid)
+            query_team_json = db.session.query(TeamJsonMap.json).filter(TeamJsonMap.team.in_(teams))
+
+            # postings only, no document is read
+            matched = db.session.query(JsonTerm.json.label('id'))\
+                .filter(JsonTerm.term.in_(list(terms)),
+                        or_(JsonTerm.json.in_(query_user_json), JsonTerm.json.in_(query_team_json)))
+            if after is not None:
+                matched = matched.filter(JsonTerm.json < after)
+            matched = matched.group_by(JsonTerm.json).having(count(JsonTerm.term) == len(terms))\
+                .order_by(JsonTerm.json.desc()).limit(limit).subquery()
+
+            # json only shared with the caller's teams is readable
+            return db.session.query(Json.id, Json.created, Json.updated,
+                                    db.func.coalesce(JsonAccessMap.type,
+                                                     JsonAccessMapType.READ.value).label('permission'))\
+                .join(matched, matched.c.id == Json.id)\
+                .outerjoin(JsonAccessMap, and_(JsonAccessMap.json == Json.id, JsonAccessMap.user == uid))\
+                .order_by(Json.id.desc()).all()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+
+class JsonSchema(ModelSchema):
+    class Meta(ModelSchema.Meta):
+        model = Json
+        sqla_session = db.session
+        exclude = ('content',)
+
+    id = fields.Integer(dump_only=True)
+    data = fields.String(required=True)
+    created = fields.String(dump_only=True)
+    updated = fields.String(dump_only=True)
@@ -1,14 +1,21 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import logging
 
 from sqlalchemy import ForeignKey
+from api.utils.cache import cache_key, json_access_cache
 from api.utils.database import db
+from api.utils.transaction import after_commit
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 
 class JsonAccessMap(db.Model):
     __tablename__ = 'json_access_map'
+    __table_args__ = (
+        db.Index('uq_json_access_map_user_json', 'user', 'json', unique=True),
+        db.Index('ix_json_access_map_json_type', 'json', 'type'),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     user = db.Column(db.BigInteger, ForeignKey("user.id"))
@@ -23,9 +30,15 @@ class JsonAccessMap(db.Model):
         self.type = _type
 
     def create(self):
-        db.session.add(self)
-        db.session.commit()
-        return self
+        try:
+            key = cache_key(self.user, self.json)
+            db.session.add(self)
+            db.session.flush()
+            after_commit(lambda: json_access_cache.invalidate(key))
+            return self
+        except Exception as e:
+            logging.error(e)
+            raise
 
 
 class JsonAccessMapSchema(ModelSchema):
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.functions import count
+from api.utils import codec
+from api.utils.database import db
+
+
+class JsonBody(db.Model):
+    """A stored document, shared by every json with the same content.
+
+    Bodies are addressed by the SHA-256 of their canonical form and counted by
+    ref_count; a body is deleted once nothing references it.
+    """
+    __tablename__ = 'json_body'
+    __table_args__ = (
+        db.Index('uq_json_body_hash', 'hash', unique=True),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    hash = db.Column(db.String(64))
+    ref_count = db.Column(db.Integer, nullable=False, server_default='0')
+    codec = db.Column(db.String(16), nullable=False, server_default='identity')
+    data = db.Column(db.LargeBinary().with_variant(LONGBLOB(), 'mysql'))
+    size = db.Column(db.BigInteger)
+    stored_size = db.Column(db.BigInteger)
+    created = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __init__(self, data, digest=None):
+        """
+        :param data: bytes, utf-8 encoded document
+        :param digest: str, SHA-256 hex digest of data
+        """
+        self.hash = digest or hashlib.sha256(data).hexdigest()
+        self.codec, self.data = codec.encode(data)
+        self.size = len(data)
+        self.stored_size = len(self.data)
+
+    @property
+    def decoded(self):
+        """The document, decompressed, utf-8 encoded"""
+        return codec.decode(self.data, self.codec)
+
+    @property
+    def text(self):
+        """The document, decompressed and decoded"""
+        return self.decoded.decode('utf-8')
+
+    @staticmethod
+    def acquire(data, digest=None):
+        """Reference the body holding data, storing it only if no body has the same hash
+        :param data: bytes, canonical utf-8 encoded document
+        :param digest: str, SHA-256 hex digest of data
+        :return: int, body id
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        table = JsonBody.__table__
+
+        def reference():
+            return db.session.execute(table.update()
+                                      .where(table.c.hash == digest)
+                                      .values(ref_count=table.c.ref_count + 1)).rowcount
+
+        try:
+            if not reference():
+                try:
+                    with db.session.begin_nested():
+                        body = JsonBody(data, digest)
+                        body.ref_count = 1
+                        db.session.add(body)
+                except IntegrityError:
+                    # a concurrent save stored the same content first
+                    reference()
+            return db.session.query(JsonBody.id).filter(JsonBody.hash == digest).scalar()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def acquire_many(references):
+        """Reference the bodies of many documents at once, storing the contents no body holds yet
+        :param references: dict, SHA-256 hex digest -> (canonical utf-8 encoded document, number of references taken)
+        :return: dict, digest -> body id
+        """
+        try:
+            table = JsonBody.__table__
+            digests = sorted(references)
+            existing = _stored_hashes(digests)
+
+            # one statement per distinct number of references
+            taken = {}
+            for digest in existing:
+                taken.setdefault(references[digest][1], []).append(digest)
+            for references_added, hashes in sorted(taken.items()):
+                for chunk in _chunks(sorted(hashes)):
+                    matched = db.session.execute(table.update().where(table.c.hash.in_(chunk))
+                                                 .values(ref_count=table.c.ref_count + references_added)).rowcount
+                    if matched < len(chunk):
+                        # a concurrent release deleted some of them since they were read, they are stored again
+                        existing.difference_update(set(chunk) - _stored_hashes(chunk, lock=True))
+
+            rows = []
+            for digest in digests:
+                if digest not in existing:
+                    data, references_added = references[digest]
+                    body_codec, stored = codec.encode(data)
+                    rows.append({'hash': digest, 'ref_count': references_added, 'codec': body_codec, 'data': stored,
+                                 'size': len(data), 'stored_size': len(stored)})
+            if rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert(), rows)
+                except IntegrityError:
+                    # a concurrent save stored some of them first
+                    for row in rows:
+                        JsonBody.acquire(references[row['hash']][0], row['hash'])
+                        db.session.execute(table.update().where(table.c.hash == row['hash'])
+                                           .values(ref_count=table.c.ref_count + row['ref_count'] - 1))
+
+            # a locking read sees the bodies as they are now rather than as the transaction first read them
+            bodies = {}
+            for chunk in _chunks(digests):
+                bodies.update(db.session.query(JsonBody.hash, JsonBody.id).filter(JsonBody.hash.in_(chunk))
+                              .with_for_update())
+            return bodies
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def release(body_id):
+        """Drop a reference to a body, deleting the body when it was the last one
+        :param body_id: int
+        :return:
+        """
+        try:
+            table = JsonBody.__table__
+            db.session.execute(table.update()
+                               .where(table.c.id == body_id)
+                               .values(ref_count=table.c.ref_count - 1))
+            db.session.execute(table.delete().where(db.and_(table.c.id == body_id, table.c.ref_count <= 0)))
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def collect_garbage(batch=1000):
+        """Delete unreferenced bodies left behind by interrupted writes
+        :param batch: int, bodies deleted per statement
+        :return: int, number of deleted bodies
+        """
+        try:
+            table = JsonBody.__table__
+            deleted = 0
+            while True:
+                ids = [row.id for row in db.session.query(JsonBody.id).filter(JsonBody.ref_count <= 0).limit(batch)]
+                if not ids:
+                    return deleted
+                deleted += db.session.execute(table.delete().where(db.and_(table.c.id.in_(ids),
+                                                                           table.c.ref_count <= 0))).rowcount
+                db.session.commit()
+        except Exception as e:
+            logging.error(e)
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def storage_report():
+        """Document and stored sizes per codec
+        :return: [(codec, documents, size, stored_size)]
+        """
+        try:
+            return db.session.query(JsonBody.codec, count(JsonBody.id), db.func.sum(JsonBody.size),
+                                    db.func.sum(JsonBody.stored_size))\
+                .group_by(JsonBody.codec).order_by(JsonBody.codec).all()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+
+def _stored_hashes(digests, lock=False):
+    """Hashes among digests a body is stored under
+    :param digests: [str]
+    :param lock: bool, read the rows as they are now and lock them until the transaction ends
+    :return: set of str
+    """
+    found = set()
+    for chunk in _chunks(digests):
+        query = db.session.query(JsonBody.hash).filter(JsonBody.hash.in_(chunk))
+        found.update(row.hash for row in (query.with_for_update() if lock else query))
+    return found
+
+
+def _chunks(values, size=500):
+    """Slices of values small enough for an IN list"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import logging
+from sqlalchemy import ForeignKey
+from api.utils.database import db
+from api.utils.search import document_terms
+
+# terms per statement, keeps IN lists and multi-row inserts bounded
+BATCH = 500
+
+
+class JsonTerm(db.Model):
+    """Posting of the search index: a json contains a term of api.utils.search"""
+    __tablename__ = 'json_term'
+    __table_args__ = (
+        db.Index('uq_json_term_term_json', 'term', 'json', unique=True),
+        db.Index('ix_json_term_json', 'json'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    term = db.Column(db.String(32), nullable=False)
+    json = db.Column(db.BigInteger, ForeignKey("json.id"), nullable=False)
+
+    @staticmethod
+    def index(json_id, document, previous=None):
+        """Stage the postings of a json's new document, only the terms that changed are written, the caller commits
+        :param json_id: int
+        :param document: parsed document
+        :param previous: parsed document indexed so far, None for a new json
+        :return:
+        """
+        try:
+            terms = document_terms(document)
+            indexed = document_terms(previous) if previous is not None else set()
+            table = JsonTerm.__table__
+
+            removed = list(indexed - terms)
+            for start in range(0, len(removed), BATCH):
+                db.session.execute(table.delete().where(db.and_(table.c.json == json_id,
+                                                                table.c.term.in_(removed[start:start + BATCH]))))
+            added = sorted(terms - indexed)
+            for start in range(0, len(added), BATCH):
+                db.session.execute(table.insert(), [{'term': t, 'json': json_id} for t in added[start:start + BATCH]])
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def index_many(documents):
+        """Stage the postings of new jsons in multi-row inserts, the caller commits
+        :param documents: [(json id, parsed document)]
+        :return:
+        """
+        try:
+            table = JsonTerm.__table__
+            rows = []
+            for json_id, document in documents:
+                rows.extend({'term': t, 'json': json_id} for t in sorted(document_terms(document)))
+                if len(rows) >= BATCH:
+                    db.session.execute(table.insert(), rows)
+                    rows = []
+            if rows:
+                db.session.execute(table.insert(), rows)
+        except Exception as e:
+            logging.error(e)
+            raise
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import logging
+from sqlalchemy import ForeignKey
+from sqlalchemy.dialects.mysql import LONGBLOB
+from api.models.json_body import JsonBody
+from api.utils import codec, json_backend
+from api.utils.cache import MISSING, deep_size, document_cache
+from api.utils.database import db
+from api.utils.diff import diff
+from api.utils.patch import json_patch
+
+_settings = {'snapshot_interval': 20}
+
+
+def configure(snapshot_interval):
+    """
+    :param snapshot_interval: int, every snapshot_interval-th version is stored in full,
+        so fetching a version applies at most snapshot_interval - 1 deltas
+    :return:
+    """
+    if snapshot_interval < 1:
+        raise ValueError("invalid snapshot interval {}".format(snapshot_interval))
+    _settings['snapshot_interval'] = snapshot_interval
+
+
+class JsonVersion(db.Model):
+    """A version of a json, stored either as a snapshot referencing a body
+    or as a compressed JSON Patch from the previous version"""
+    __tablename__ = 'json_version'
+    __table_args__ = (
+        db.Index('uq_json_version_json_version', 'json', 'version', unique=True),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    json = db.Column(db.BigInteger, ForeignKey("json.id"), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.BigInteger, ForeignKey("json_body.id"))
+    codec = db.Column(db.String(16))
+    delta = db.Column(db.LargeBinary().with_variant(LONGBLOB(), 'mysql'))
+    size = db.Column(db.BigInteger)
+    hash = db.Column(db.String(64))
+    author = db.Column(db.BigInteger, ForeignKey("user.id"))
+    created = db.Column(db.DateTime, server_default=db.func.now())
+
+    content = db.relationship(JsonBody, lazy='select')
+
+    @property
+    def snapshot(self):
+        return self.body is not None
+
+    def _set_delta(self, operations):
+        self.body = None
+        self.codec, self.delta = codec.encode(json_backend.canonical(operations))
+
+    def _operations(self):
+        return json_backend.loads(codec.decode(self.delta, self.codec))
+
+    @staticmethod
+    def record(json_id, version, data, digest, document=None, previous=None, author=None):
+        """Stage a new version of a json, the caller commits
+        :param json_id: int
+        :param version: int, 1 for a new json
+        :param data: bytes, canonical utf-8 encoded document
+        :param digest: str, SHA-256 hex digest of data
+        :param document: parsed data, needed unless the version is a snapshot
+        :param previous: parsed previous version, None for the first one
+        :param author: user id
+        :return: JsonVersion
+        """
+        try:
+            entry = JsonVersion(json=json_id, version=version, size=len(data), hash=digest, author=author)
+            if previous is None or (version - 1) % _settings['snapshot_interval'] == 0:
+                entry.body = JsonBody.acquire(data, digest)
+            else:
+                entry._set_delta(diff(previous, document))
+            db.session.add(entry)
+            return entry
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def record_created(jsons, author=None):
+        """Stage the first version of new jsons in one multi-row insert, the caller commits.
+        The first version is a snapshot, the caller has taken its reference on each body.
+        :param jsons: [Json] flushed new jsons
+        :param author: user id
+        :return:
+        """
+        try:
+            db.session.execute(JsonVersion.__table__.insert(), [
+                {'json': json.id, 'version': 1, 'body': json.body, 'size': json.size, 'hash': json.hash,
+                 'author': author} for json in jsons])
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def list_versions(json_id, limit, before=None):
+        """Page of the versions of a json, newest first
+        :param json_id: int
+        :param limit: int, number of rows
+        :param before: version number of the last row of the previous page
+        :return: [(version, size, hash, author, created, snapshot)]
+        """
+        try:
+            query = db.session.query(JsonVersion.version, JsonVersion.size, JsonVersion.hash, JsonVersion.author,
+                                     JsonVersion.created, JsonVersion.body.isnot(None).label('snapshot'))\
+                .filter(JsonVersion.json == json_id)
+            if before is not None:
+                query = query.filter(JsonVersion.version < before)
+            return query.order_by(JsonVersion.version.desc()).limit(limit).all()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def get_version(json_id, version):
+        """A version of a json and its document, rebuilt from the closest snapshot
+        :param json_id: int
+        :param version: int
+        :return: (JsonVersion, parsed document), None if the version does not exist
+        """
+        try:
+            entry = JsonVersion.query.filter_by(json=json_id, version=version).first()
+            if entry is None:
+                return None
+
+            key = ('version', entry.json, entry.version, entry.hash)
+            document = document_cache.get(key)
+            if document is MISSING:
+                snapshot = db.session.query(db.func.max(JsonVersion.version))\
+                    .filter(JsonVersion.json == json_id, JsonVersion.version <= version,
+                            JsonVersion.body.isnot(None)).scalar()
+                chain = JsonVersion.query\
+                    .filter(JsonVersion.json == json_id, JsonVersion.version.between(snapshot, version))\
+                    .order_by(JsonVersion.version).all()
+                document = json_backend.loads(chain[0].content.decoded)
+                for delta in chain[1:]:
+                    document = json_patch(document, delta._operations())
+                document_cache.set(key, document, deep_size(document))
+            return entry, document
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def compact(json_id, before):
+        """Drop the deltas of a json created before a date, the latest version and snapshots are kept.
+        The delta following dropped versions is rewritten against the version now preceding it.
+        :param json_id: int
+        :param before: datetime
+        :return: int, number of dropped versions
+        """
+        try:
+            chain = JsonVersion.query.filter(JsonVersion.json == json_id).order_by(JsonVersion.version).all()
+            dropped = 0
+            document = kept = None
+            rebase = False
+            for position, entry in enumerate(chain):
+                if entry.snapshot:
+                    document = json_backend.loads(entry.content.decoded)
+                else:
+                    document = json_patch(document, entry._operations())
+
+                latest = position == len(chain) - 1
+                if not entry.snapshot and not latest and entry.created < before:
+                    db.session.delete(entry)
+                    dropped += 1
+                    rebase = True
+                    continue
+                if rebase and not entry.snapshot:
+                    entry._set_delta(diff(kept, document))
+                rebase = False
+                kept = document
+            db.session.commit()
+            return dropped
+        except Exception as e:
+            logging.error(e)
+            db.session.rollback()
+            raise
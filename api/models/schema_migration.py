@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from api.utils.database import db
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migration'
+
+    name = db.Column(db.String(255), primary_key=True)
+    applied = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __init__(self, name):
+        self.name = name
@@ -1,18 +1,41 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 import logging
+from sqlalchemy import ForeignKey
 from sqlalchemy.sql.functions import count
+from api.models.team_json_map import TeamJsonMap
 from api.models.team_member_map import TeamMemberMap
+from api.utils import counters
+from api.utils.cache import cache_key, json_access_cache, team_access_cache
 from api.utils.database import db
+from api.utils.transaction import after_commit
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
+# users added or removed by one membership request
+MEMBERS_LIMIT = 1000
+# (json, team) pairs shared or unshared by one request
+SHARES_LIMIT = 10000
+# rows per multi-row insert
+BATCH = 500
+
+
+def _insert_rows(table, rows):
+    """Stage multi-row inserts of BATCH rows
+    :param table: Table
+    :param rows: [dict]
+    :return:
+    """
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert().values(rows[start:start + BATCH]))
+
 
 class Team(db.Model):
     __tablename__ = 'team'
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     name = db.Column(db.String(255), unique=True)
+    schema = db.Column(db.BigInteger, ForeignKey("validation_schema.id"))
     created = db.Column(db.DateTime, server_default=db.func.now())
     updated = db.Column(db.DateTime, onupdate=db.func.now())
 
@@ -22,33 +45,160 @@ class Team(db.Model):
     def create(self):
         try:
             db.session.add(self)
-            db.session.commit()
+            db.session.flush()
             return self
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
     def update(self, name):
         try:
             if name != self.name:
                 self.name = name
-                db.session.commit()
+                db.session.flush()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    def attach_schema(self, schema_id):
+        """
+        :param schema_id: ValidationSchema id validating the team's jsons from now on, None to detach
+        :return:
+        """
+        try:
+            if schema_id != self.schema:
+                self.schema = schema_id
+                db.session.flush()
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
     def delete(self):
         try:
+            team_id = cache_key(self.id)
+            counters.team_deleted(db.session.connection(), self.id)
+            db.session.query(TeamJsonMap).filter(TeamJsonMap.team == self.id).delete()
             db.session.query(TeamMemberMap).filter(TeamMemberMap.team == self.id).delete()
             db.session.delete(self)
-            db.session.commit()
+            db.session.flush()
+
+            # former members lose read access to the jsons shared with the team
+            after_commit(lambda: team_access_cache.invalidate_where(lambda key: key[1:] == team_id))
+            after_commit(json_access_cache.clear)
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
+    @staticmethod
+    def add_members(team_id, users, _type):
+        """Stage adding users to a team in one multi-row insert, users already in the team keep their role
+        :param team_id: int
+        :param users: [int] existing user ids
+        :param _type: TeamMemberType value of the new members
+        :return: [int] users added
+        :raises IntegrityError: if a concurrent request added one of the users first
+        """
+        try:
+            existing = {row.user for row in db.session.query(TeamMemberMap.user)
+                        .filter(TeamMemberMap.team == team_id, TeamMemberMap.user.in_(users))}
+            added = sorted(set(users) - existing)
+            if not added:
+                return []
+            _insert_rows(TeamMemberMap.__table__, [{'user': user, 'team': team_id, 'type': _type} for user in added])
+
+            counters.members_changed(db.session.connection(), added, team_id, 1)
+            Team._members_changed(team_id, added)
+            return added
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def remove_members(team_id, users):
+        """Stage removing users from a team in one delete
+        :param team_id: int
+        :param users: [int] user ids
+        :return: [int] users removed, the others were not members
+        """
+        try:
+            removed = sorted(row.user for row in db.session.query(TeamMemberMap.user)
+                             .filter(TeamMemberMap.team == team_id, TeamMemberMap.user.in_(users)))
+            if not removed:
+                return []
+
+            counters.members_changed(db.session.connection(), removed, team_id, -1)
+            db.session.query(TeamMemberMap)\
+                .filter(TeamMemberMap.team == team_id, TeamMemberMap.user.in_(removed))\
+                .delete(synchronize_session=False)
+            Team._members_changed(team_id, removed)
+            return removed
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def share(pairs):
+        """Stage sharing jsons with teams in multi-row inserts, pairs already shared are left as they are
+        :param pairs: [(json id, team id)]
+        :return: [(json id, team id)] pairs shared
+        :raises IntegrityError: if a concurrent request shared one of the pairs first
+        """
+        try:
+            added = sorted(set(pairs) - set(Team._shared(pairs)))
+            if not added:
+                return []
+            _insert_rows(TeamJsonMap.__table__, [{'json': json_id, 'team': team_id} for json_id, team_id in added])
+
+            Team._shares_changed(added)
+            return added
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def unshare(pairs):
+        """Stage unsharing jsons from teams in one delete
+        :param pairs: [(json id, team id)]
+        :return: [(json id, team id)] pairs unshared, the others were not shared
+        """
+        try:
+            shared = Team._shared(pairs)
+            if not shared:
+                return []
+
+            db.session.query(TeamJsonMap).filter(TeamJsonMap.id.in_(list(shared.values())))\
+                .delete(synchronize_session=False)
+            removed = sorted(shared)
+            Team._shares_changed(removed)
+            return removed
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def _shared(pairs):
+        # one query over the teams and jsons of the pairs, other combinations are dropped
+        pairs = set(pairs)
+        rows = db.session.query(TeamJsonMap.id, TeamJsonMap.json, TeamJsonMap.team)\
+            .filter(TeamJsonMap.team.in_(sorted({team_id for _, team_id in pairs})),
+                    TeamJsonMap.json.in_(sorted({json_id for json_id, _ in pairs})))
+        return {(row.json, row.team): row.id for row in rows if (row.json, row.team) in pairs}
+
+    @staticmethod
+    def _shares_changed(pairs):
+        counters.teams_shared(db.session.connection(), sorted({team_id for _, team_id in pairs}))
+        # members of the teams gain or lose read access to the jsons, one pass over the cache
+        jsons = {cache_key(json_id) for json_id, _ in pairs}
+        after_commit(lambda: json_access_cache.invalidate_where(lambda key: key[1:] in jsons))
+
+    @staticmethod
+    def _members_changed(team_id, users):
+        # the members gain or lose read access to every json shared with the team, one pass over each cache
+        keys = {cache_key(user, team_id) for user in users}
+        users = {key[:1] for key in keys}
+        after_commit(lambda: team_access_cache.invalidate_where(lambda key: key in keys))
+        after_commit(lambda: json_access_cache.invalidate_where(lambda key: key[:1] in users))
+
     @staticmethod
     def count_teams(uid):
         """Counts the number of teams a user has access to
@@ -63,6 +213,27 @@ class Team(db.Model):
             logging.error(e)
             raise
 
+    @staticmethod
+    def list_teams(uid, limit, after=None, _type=None):
+        """Page of the teams a user belongs to, ordered by id
+        :param uid:
+        :param limit: int, number of rows
+        :param after: id of the last team of the previous page
+        :param _type: TeamMemberType value to filter on
+        :return: [(id, name, type, created, updated)]
+        """
+        try:
+            query = db.session.query(Team.id, Team.name, TeamMemberMap.type, Team.created, Team.updated)\
+                .join(TeamMemberMap).filter(TeamMemberMap.user == uid)
+            if _type is not None:
+                query = query.filter(TeamMemberMap.type == _type)
+            if after is not None:
+                query = query.filter(TeamMemberMap.team > after)
+            return query.order_by(TeamMemberMap.team).limit(limit).all()
+        except Exception as e:
+            logging.error(e)
+            raise
+
 
 class TeamSchema(ModelSchema):
     class Meta(ModelSchema.Meta):
@@ -3,13 +3,19 @@
 import logging
 
 from sqlalchemy import ForeignKey
+from api.utils.cache import cache_key, json_access_cache
 from api.utils.database import db
+from api.utils.transaction import after_commit
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 
 class TeamJsonMap(db.Model):
     __tablename__ = 'team_json_map'
+    __table_args__ = (
+        db.Index('uq_team_json_map_team_json', 'team', 'json', unique=True),
+        db.Index('ix_team_json_map_json', 'json'),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     team = db.Column(db.BigInteger, ForeignKey("team.id"))
@@ -22,18 +28,31 @@ class TeamJsonMap(db.Model):
         self.json = json
 
     def create(self):
-        db.session.add(self)
-        db.session.commit()
-        return self
+        try:
+            json_id = cache_key(self.json)
+            db.session.add(self)
+            db.session.flush()
+            after_commit(lambda: self._invalidate(json_id))
+            return self
+        except Exception as e:
+            logging.error(e)
+            raise
 
     def delete(self):
         try:
+            json_id = cache_key(self.json)
             db.session.delete(self)
-            db.session.commit()
+            db.session.flush()
+            after_commit(lambda: self._invalidate(json_id))
         except Exception as e:
             logging.error(e)
             raise
 
+    @staticmethod
+    def _invalidate(json_id):
+        # every member of the team may gain or lose read access to the json
+        json_access_cache.invalidate_where(lambda key: key[1:] == json_id)
+
 
 class TeamJsonMapSchema(ModelSchema):
     class Meta(ModelSchema.Meta):
@@ -2,13 +2,20 @@
 # -*- coding: utf-8 -*-
 import logging
 from sqlalchemy import ForeignKey
+from api.models.user import User
+from api.utils.cache import cache_key, json_access_cache, team_access_cache
 from api.utils.database import db
+from api.utils.transaction import after_commit
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 
 class TeamMemberMap(db.Model):
     __tablename__ = 'team_member_map'
+    __table_args__ = (
+        db.Index('uq_team_member_map_user_team', 'user', 'team', unique=True),
+        db.Index('ix_team_member_map_team_user_type', 'team', 'user', 'type'),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     user = db.Column(db.BigInteger, ForeignKey("user.id"))
@@ -24,22 +31,52 @@ class TeamMemberMap(db.Model):
 
     def create(self):
         try:
+            key = cache_key(self.user, self.team)
             db.session.add(self)
-            db.session.commit()
+            db.session.flush()
+            after_commit(lambda: self._invalidate(key))
             return self
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
     def delete(self):
         try:
+            key = cache_key(self.user, self.team)
             db.session.delete(self)
-            db.session.commit()
+            db.session.flush()
+            after_commit(lambda: self._invalidate(key))
         except Exception as e:
             logging.error(e)
             raise
 
+    @staticmethod
+    def list_members(team, limit, after=None, _type=None):
+        """Page of the members of a team with their display fields, ordered by user id
+        :param team: team id
+        :param limit: int, number of rows
+        :param after: id of the last user of the previous page
+        :param _type: TeamMemberType value to filter on
+        :return: [(id, name, surname, login, type)]
+        """
+        try:
+            query = db.session.query(User.id, User.name, User.surname, User.login, TeamMemberMap.type)\
+                .join(TeamMemberMap, TeamMemberMap.user == User.id).filter(TeamMemberMap.team == team)
+            if _type is not None:
+                query = query.filter(TeamMemberMap.type == _type)
+            if after is not None:
+                query = query.filter(TeamMemberMap.user > after)
+            return query.order_by(TeamMemberMap.user).limit(limit).all()
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def _invalidate(key):
+        # the member gains or loses read access to every json shared with the team
+        team_access_cache.invalidate(key)
+        json_access_cache.invalidate_where(lambda k: k[:1] == key[:1])
+
 
 class TeamMemberMapSchema(ModelSchema):
     class Meta(ModelSchema.Meta):
@@ -17,6 +17,8 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True)
     login = db.Column(db.String(255), unique=True)
     password = db.Column(db.String(255))
+    json_count = db.Column(db.Integer, nullable=False, server_default='0')
+    team_count = db.Column(db.Integer, nullable=False, server_default='0')
     created = db.Column(db.DateTime, server_default=db.func.now())
     updated = db.Column(db.DateTime, onupdate=db.func.now())
 
@@ -30,30 +32,28 @@ class User(db.Model):
     def create(self):
         try:
             db.session.add(self)
-            db.session.commit()
+            db.session.flush()
             return self
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
     def update(self, name, surname, email):
         try:
-            commit = False
+            changed = False
             if name != self.name:
                 self.name = name
-                commit = True
+                changed = True
             if surname != self.surname:
                 self.surname = surname
-                commit = True
+                changed = True
             if email != self.email:
                 self.email = email
-                commit = True
-            if commit:
-                db.session.commit()
+                changed = True
+            if changed:
+                db.session.flush()
         except Exception as e:
             logging.error(e)
-            db.session.rollback()
             raise
 
     @staticmethod
@@ -88,5 +88,7 @@ class UserSchema(ModelSchema):
     email = fields.String(required=True)
     login = fields.String(required=True)
     password = fields.String(required=True)
+    json_count = fields.Integer(dump_only=True)
+    team_count = fields.Integer(dump_only=True)
     created = fields.String(dump_only=True)
     updated = fields.String(dump_only=True)
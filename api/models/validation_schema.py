@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+from sqlalchemy.exc import IntegrityError
+from api.utils import json_backend, validation
+from api.utils.database import db
+
+
+class ValidationSchema(db.Model):
+    """A JSON Schema attached to jsons or teams, stored once per content and addressed by its SHA-256"""
+    __tablename__ = 'validation_schema'
+    __table_args__ = (
+        db.Index('uq_validation_schema_hash', 'hash', unique=True),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    hash = db.Column(db.String(64), nullable=False)
+    data = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=False)
+    created = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __init__(self, data, digest):
+        """
+        :param data: str, canonical form of the schema
+        :param digest: str, SHA-256 hex digest of data
+        """
+        self.data = data
+        self.hash = digest
+
+    def validator(self):
+        """
+        :return: api.utils.validation.Validator
+        """
+        return validation.compile_schema(self.hash, lambda: json_backend.loads(self.data))
+
+    @staticmethod
+    def acquire(data):
+        """The schema holding data, stored if no schema has the same hash
+        :param data: bytes, canonical utf-8 encoded schema
+        :return: ValidationSchema
+        """
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            schema = ValidationSchema.query.filter_by(hash=digest).first()
+            if schema is None:
+                try:
+                    with db.session.begin_nested():
+                        schema = ValidationSchema(data.decode('utf-8'), digest)
+                        db.session.add(schema)
+                except IntegrityError:
+                    # a concurrent request stored the same schema first
+                    schema = ValidationSchema.query.filter_by(hash=digest).one()
+            return schema
+        except Exception as e:
+            logging.error(e)
+            raise
+
+    @staticmethod
+    def validators(ids):
+        """Validators of schemas, the schemas are only loaded when their validator is not cached
+        :param ids: [int] schema ids, None entries are skipped
+        :return: [api.utils.validation.Validator]
+        """
+        try:
+            ids = {i for i in ids if i is not None}
+            if not ids:
+                return []
+            rows = db.session.query(ValidationSchema.id, ValidationSchema.hash)\
+                .filter(ValidationSchema.id.in_(ids)).order_by(ValidationSchema.id).all()
+
+            def load(schema_id):
+                # only read when the validator is not cached yet
+                data = db.session.query(ValidationSchema.data).filter(ValidationSchema.id == schema_id).scalar()
+                return json_backend.loads(data)
+
+            return [validation.compile_schema(row.hash, lambda schema_id=row.id: load(schema_id)) for row in rows]
+        except Exception as e:
+            logging.error(e)
+            raise
@@ -1,26 +1,63 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import json
 import logging
+from datetime import datetime
 from flask import Blueprint
 from flask import request
 from sqlalchemy.exc import IntegrityError
 from api.models.user import UserSchema, User
-from api.models.json import JsonSchema, Json
+from api.models.json import BULK_LIMIT, Json
+from api.models.json_body import JsonBody
+from api.models.json_version import JsonVersion
+from api.models.validation_schema import ValidationSchema
 from api.models.json_access_map import JsonAccessMapSchema, JsonAccessMap
-from api.models.team import TeamSchema, Team
+from api.models.team import MEMBERS_LIMIT, SHARES_LIMIT, TeamSchema, Team
 from api.models.team_member_map import TeamMemberMapSchema, TeamMemberMap
 from api.models.team_json_map import TeamJsonMapSchema, TeamJsonMap
 from api.utils.auth import authenticate_jwt, generate_jwt, JWT
-from api.utils.constants import notFound, permission, required, exists, invalid
+from api.utils.authorization import authorize, resolve_access
+from api.utils.cache import document_cache, json_access_cache, query_expression_cache, schema_validator_cache, \
+    team_access_cache
+from api.utils.constants import notFound, permission, required, exists, invalid, tooMany
+from api.utils.database import db
+from api.utils.diff import diff
 from api.utils.enums import TeamMemberType, JsonAccessMapType
-from api.utils.responses import response_with
+from api.utils.pagination import decode_cursor, page_limit, pagination
+from api.utils.responses import entity_tag, not_modified, precondition_failed, raw_response, response_with
+from api.utils import codec, json_backend, patch, query, search, serializers, validation
 from api.utils import responses as resp
 
 route_path_general = Blueprint("route_path_general", __name__)
 
 
+def _member_type(name):
+    """TeamMemberType value of a role filter argument
+    :param name: str, TeamMemberType name or None
+    :return: int or None
+    :raises ValueError: if the name is not a TeamMemberType
+    """
+    if name is None:
+        return None
+    value = TeamMemberType.get_value(name.upper())
+    if value is None:
+        raise ValueError("invalid type")
+    return value
+
+
+def _ids(data, name):
+    """Ids of a bulk request body field
+    :param data: dict, request body
+    :param name: str, field name
+    :return: [int]
+    :raises ValueError: if the field is not a list of ids
+    """
+    ids = data.get(name, [])
+    if not isinstance(ids, list) or any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+        raise ValueError("invalid ids")
+    return ids
+
+
 """
 USER
 """
@@ -70,25 +107,15 @@ def get_user_details(uid):
             message = notFound.format("User")
             return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
 
-        user_schema = UserSchema()
-        user_data, error = user_schema.dump(user)
+        val = serializers.user_details(user)
 
-        json_count = Json.count_json(uid)
-        team_count = Team.count_teams(uid)
-
-        val = {
-            'id': user_data['id'],
-            'name': user_data['name'],
-            'surname': user_data['surname'],
-            'email': user_data['email'],
-            'login': user_data['login'],
-            'created': user_data['created'],
-            'updated': user_data['updated'],
-            'json_count': json_count,
-            'team_count': team_count
-        }
+        # counters change without touching updated, the tag covers every field
+        etag = entity_tag(*sorted(val.items()))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
 
-        return response_with(resp.SUCCESS_200, value=val)
+        return response_with(resp.SUCCESS_200, value=val, etag=etag)
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
@@ -145,33 +172,57 @@ JSON
 """
 
 
+def _invalid_document(errors):
+    """422 response listing a document's validation errors
+    :param errors: [dict] see api.utils.validation.errors
+    :return:
+    """
+    message = invalid.format("JSON")
+    return response_with(resp.INVALID_INPUT_422, message=message, error=errors)
+
+
 @route_path_general.route('/v1.0/json/save', methods=['POST'])
 @authenticate_jwt
 def save_json():
 
     try:
-        data = request.get_json()
-
-        # validate json syntax
-        json.loads(data['data'])
-
-        # save json in json table
-        json_schema = JsonSchema()
-        _json, error = json_schema.load(data)
-        result = json_schema.dump(_json.create()).data
+        if request.args.get('raw') in ('1', 'true'):
+            # the request body is the document itself, parsed once
+            document = json_backend.loads(request.get_data())
+            schema = None
+        else:
+            data = request.get_json()
+            document = json_backend.loads(data['data'])
+            schema = data.get('schema')
+
+        # a schema sent along is attached once the document is valid against it
+        _json = Json(data=json_backend.canonical(document))
+        if schema is not None:
+            try:
+                schema, validator = validation.load_schema(schema)
+            except ValueError:
+                message = invalid.format("Schema")
+                return response_with(resp.INVALID_INPUT_422, message=message)
+            errors = validation.errors([validator], document)
+            if errors:
+                return _invalid_document(errors)
+            _json.schema = ValidationSchema.acquire(schema).id
+
+        # save the validated document in its canonical form
+        _json.create(author=JWT.details['user_id'], document=document)
 
         # save an entry in json_access_map
         json_access_schema = JsonAccessMapSchema()
         json_access_data = {
             "user": JWT.details['user_id'],
-            "json": result['id'],
+            "json": _json.id,
             "_type": JsonAccessMapType.OWNER.value
         }
         json_access, error = json_access_schema.load(json_access_data)
         json_access.create()
 
         val = {
-            "id": result['id'],
+            "id": _json.id,
             "message": "Success"
         }
 
@@ -186,69 +237,613 @@ def save_json():
         return response_with(resp.SERVER_ERROR_500)
 
 
+@route_path_general.route('/v1.0/json/bulk', methods=['POST'])
+@authenticate_jwt
+def save_json_bulk():
+    try:
+        # an array of documents, or one document per line
+        if request.mimetype == 'application/x-ndjson':
+            items = []
+            for line in request.get_data().splitlines():
+                if line.strip():
+                    try:
+                        items.append(json_backend.loads(line))
+                    except ValueError as e:
+                        items.append(e)
+        else:
+            try:
+                items = json_backend.loads(request.get_data())
+            except ValueError:
+                message = invalid.format("JSON")
+                return response_with(resp.INVALID_INPUT_422, message=message)
+            if not isinstance(items, list):
+                message = invalid.format("Array")
+                return response_with(resp.INVALID_INPUT_422, message=message)
+
+        if not items:
+            message = required.format("Document")
+            return response_with(resp.MISSING_PARAMETERS_422, message=message)
+        if len(items) > BULK_LIMIT:
+            message = tooMany.format(BULK_LIMIT, "documents")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        # valid documents are saved together, invalid lines are reported
+        saved = [(index, item) for index, item in enumerate(items) if not isinstance(item, ValueError)]
+        ids = Json.create_many([(json_backend.canonical(document), document) for _, document in saved],
+                               JWT.details['user_id']) if saved else []
+
+        results = [{'index': index, 'error': invalid.format("JSON")} for index, item in enumerate(items)
+                   if isinstance(item, ValueError)]
+        results.extend({'index': index, 'id': json_id} for (index, _), json_id in zip(saved, ids))
+        results.sort(key=lambda result: result['index'])
+
+        val = {
+            'saved': len(ids),
+            'failed': len(items) - len(ids),
+            'json': results
+        }
+
+        return response_with(resp.SUCCESS_200, value=val)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/validate', methods=['POST'])
+@authenticate_jwt
+def validate_json():
+    try:
+        try:
+            limit = page_limit(request.args.get('limit'), default=validation.MAX_ERRORS,
+                               maximum=10 * validation.MAX_ERRORS)
+        except ValueError:
+            message = invalid.format("Limit")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        if request.args.get('raw') in ('1', 'true'):
+            # the request body is the document, the schema is named by the query
+            options = request.args
+            data = request.get_data()
+        else:
+            options = request.get_json()
+            data = options['data']
+        try:
+            document = json_backend.loads(data)
+        except ValueError:
+            message = invalid.format("JSON")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        if options.get('schema') is not None:
+            try:
+                validators = [validation.load_schema(options['schema'])[1]]
+            except ValueError:
+                message = invalid.format("Schema")
+                return response_with(resp.INVALID_INPUT_422, message=message)
+        elif options.get('json') is not None or options.get('team') is not None:
+            json_id, team_id = options.get('json'), options.get('team')
+            error = resolve_access(JWT.details['user_id'], json=json_id, team=team_id).error()
+            if error is not None:
+                return error
+            if json_id is not None:
+                validators = Json.validators(json_id)
+            else:
+                validators = ValidationSchema.validators(
+                    [db.session.query(Team.schema).filter(Team.id == team_id).scalar()])
+        else:
+            message = required.format("Schema, json or team")
+            return response_with(resp.MISSING_PARAMETERS_422, message=message)
+
+        errors = validation.errors(validators, document, limit)
+        val = {
+            'valid': not errors,
+            'errors': errors
+        }
+
+        return response_with(resp.SUCCESS_200, value=val)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json', methods=['GET'])
+@authenticate_jwt
+def list_json():
+    try:
+        try:
+            limit = page_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, datetime, int) if cursor else None
+        except ValueError:
+            message = invalid.format("Pagination")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        rows = Json.list_json(JWT.details['user_id'], limit + 1, after)
+        rows, page = pagination(rows, limit, lambda row: (row.updated, row.id))
+
+        val = {
+            'json': [serializers.listed_json(row) for row in rows]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, pagination=page)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/search', methods=['GET'])
+@authenticate_jwt
+def search_json():
+    try:
+        try:
+            limit = page_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, int)[0] if cursor else None
+        except ValueError:
+            message = invalid.format("Pagination")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        try:
+            terms = search.query_terms(keys=request.args.getlist('key'), paths=request.args.getlist('path'),
+                                       values=request.args.getlist('value'))
+        except ValueError:
+            message = invalid.format("Search")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+        if not terms:
+            message = required.format("Key, path or value")
+            return response_with(resp.MISSING_PARAMETERS_422, message=message)
+
+        rows = Json.search(JWT.details['user_id'], terms, limit + 1, after)
+        rows, page = pagination(rows, limit, lambda row: (row.id,))
+
+        val = {
+            'json': [serializers.listed_json(row) for row in rows]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, pagination=page)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
 @route_path_general.route('/v1.0/json/<json_id>', methods=['GET'])
 @authenticate_jwt
-def get_json(json_id):
+@authorize(json='json_id')
+def get_json(json_id, access):
     try:
-        # validate json exists
-        json = Json.query.filter_by(id=json_id).first()
-        if not json:
-            message = notFound.format("JSON")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        json = Json.query.get(json_id)
+        if request.args.get('raw') in ('1', 'true'):
+            return _raw_json(json, access)
 
-        # validate access to json
-        access = JsonAccessMap.query.filter_by(json=json_id, user=JWT.details['user_id']).first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        # the document is only loaded when the client's copy is stale
+        etag = entity_tag(json.hash, json.updated, access.json_type)
+        cached = not_modified(etag, json.updated)
+        if cached is not None:
+            return cached
 
         # response details
-        access_schema = JsonAccessMapSchema()
-        json_access_data, error = access_schema.dump(access)
-        json_schema = JsonSchema()
-        json_data, error = json_schema.dump(json)
+        val = serializers.json_details(json)
+        val['permission'] = access.json_type
+
+        return response_with(resp.SUCCESS_200, value=val, etag=etag, last_modified=json.updated)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+def _raw_json(json, access):
+    """The stored document as the response body and its details in headers,
+    sent compressed as stored when the client accepts the codec's encoding
+    """
+    body_codec = db.session.query(JsonBody.codec).filter(JsonBody.id == json.body).scalar()
+    encoding = codec.content_encoding(body_codec)
+    if encoding is not None and not request.accept_encodings[encoding]:
+        encoding = None
+
+    headers = {
+        'X-Json-Id': json.id,
+        'X-Json-Permission': access.json_type,
+        'X-Json-Version': json.version,
+        'X-Json-Created': json.created.isoformat(),
+        'X-Json-Updated': json.updated.isoformat(),
+        'Vary': 'Accept-Encoding'
+    }
+    etag = entity_tag(json.hash, json.updated, access.json_type, 'raw', encoding)
+    cached = not_modified(etag, json.updated)
+    if cached is not None:
+        cached.headers['Vary'] = headers['Vary']
+        return cached
+
+    data, size = db.session.query(JsonBody.data, JsonBody.size).filter(JsonBody.id == json.body).one()
+    if encoding is not None:
+        headers.update({'Content-Encoding': encoding, 'Content-Length': len(data)})
+        return raw_response(data, headers=headers, etag=etag, last_modified=json.updated)
+
+    headers.update({'Content-Length': size})
+    return raw_response(codec.iter_decode(data, body_codec), headers=headers, etag=etag, last_modified=json.updated)
+
+
+@route_path_general.route('/v1.0/json/<json_id>', methods=['PATCH'])
+@authenticate_jwt
+@authorize(json='json_id', json_roles=[JsonAccessMapType.OWNER.value, JsonAccessMapType.WRITE.value])
+def patch_json(json_id, access):
+    try:
+        if request.mimetype not in patch.MEDIA_TYPES:
+            return response_with(resp.UNSUPPORTED_MEDIA_TYPE_415)
+
+        try:
+            operations = json_backend.loads(request.get_data())
+        except ValueError:
+            message = invalid.format("Patch")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        # the row stays locked until the patched document is committed
+        json = Json.query.with_for_update().get(json_id)
+        failed = precondition_failed(entity_tag(json.hash, json.updated, access.json_type))
+        if failed is not None:
+            return failed
+
+        try:
+            document = patch.apply(request.mimetype, json.parsed(), operations)
+        except ValueError as e:
+            message = invalid.format("Patch")
+            return response_with(resp.INVALID_INPUT_422, message=message, error=str(e))
+
+        errors = validation.errors(Json.validators(json.id), document)
+        if errors:
+            return _invalid_document(errors)
+
+        json.update(json_backend.canonical(document), document=document, author=JWT.details['user_id'])
 
         val = {
-            'id': json_data['id'],
-            'data': json_data['data'],
-            'permission': json_access_data['type'],
-            'created': json_data['created'],
-            'updated': json_data['updated']
+            'id': json.id,
+            'version': json.version,
+            'size': json.size,
+            'updated': serializers.text(json.updated)
         }
 
-        return response_with(resp.SUCCESS_200, value=val)
+        return response_with(resp.SUCCESS_200, value=val, etag=entity_tag(json.hash, json.updated, access.json_type))
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
 
 
-@route_path_general.route('/v1.0/json/<json_id>/team/<team_id>', methods=['POST'])
+@route_path_general.route('/v1.0/json/<json_id>/query', methods=['GET'])
+@authenticate_jwt
+@authorize(json='json_id')
+def query_json(json_id, access):
+    try:
+        expr = request.args.get('expr')
+        if not expr:
+            message = required.format("Expression")
+            return response_with(resp.MISSING_PARAMETERS_422, message=message)
+
+        try:
+            query.compile_expression(expr)
+        except ValueError:
+            message = invalid.format("Expression")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        json = Json.query.get(json_id)
+        etag = entity_tag(json.hash, json.updated, access.json_type, expr)
+        cached = not_modified(etag, json.updated)
+        if cached is not None:
+            return cached
+
+        try:
+            result = query.search(expr, json.parsed())
+        except ValueError:
+            message = invalid.format("Expression")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        val = {
+            'id': json.id,
+            'expr': expr,
+            'result': result,
+            'permission': access.json_type
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, etag=etag, last_modified=json.updated)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/versions', methods=['GET'])
+@authenticate_jwt
+@authorize(json='json_id')
+def list_json_versions(json_id, access):
+    try:
+        try:
+            limit = page_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            before = decode_cursor(cursor, int)[0] if cursor else None
+        except ValueError:
+            message = invalid.format("Pagination")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        rows = JsonVersion.list_versions(json_id, limit + 1, before)
+        rows, page = pagination(rows, limit, lambda row: (row.version,))
+
+        val = {
+            'version': [serializers.listed_version(row) for row in rows]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, pagination=page)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/versions/<version>', methods=['GET'])
 @authenticate_jwt
-def give_team_json_access(json_id, team_id):
+@authorize(json='json_id')
+def get_json_version(json_id, version, access):
     try:
-        # validate json exists
-        json = Json.query.filter_by(id=json_id).first()
-        if not json:
-            message = notFound.format("JSON")
+        try:
+            version = int(version)
+        except ValueError:
+            message = notFound.format("Version")
             return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
 
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
+        found = JsonVersion.get_version(json_id, version)
+        if found is None:
+            message = notFound.format("Version")
             return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        entry, document = found
 
-        # validate access to json
-        access = JsonAccessMap.query\
-            .filter_by(json=json_id, user=JWT.details['user_id'], type=JsonAccessMapType.OWNER.value)\
-            .first()
-        if not access:
-            message = permission
+        # versions never change
+        etag = entity_tag(entry.json, entry.version, entry.hash)
+        cached = not_modified(etag, entry.created)
+        if cached is not None:
+            return cached
+
+        val = serializers.version_details(entry)
+        val['data'] = json_backend.canonical(document).decode('utf-8')
+
+        return response_with(resp.SUCCESS_200, value=val, etag=etag, last_modified=entry.created)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+def _diff_side(json_id, version):
+    """Hash and parsed document of a json, or of one of its versions
+    :param json_id: int
+    :param version: str, version number, None for the current document
+    :return: (hash, document), None if the version does not exist
+    :raises ValueError: if version is not a number
+    """
+    if version is None:
+        json = Json.query.get(json_id)
+        return json.hash, json.parsed()
+    found = JsonVersion.get_version(json_id, int(version))
+    if found is None:
+        return None
+    entry, document = found
+    return entry.hash, document
+
+
+@route_path_general.route('/v1.0/json/<json_id>/diff/<other_id>', methods=['GET'])
+@authenticate_jwt
+@authorize(json='json_id')
+def diff_json(json_id, other_id, access):
+    try:
+        # both documents have to be readable
+        error = resolve_access(JWT.details['user_id'], json=other_id).error()
+        if error is not None:
+            return error
+
+        try:
+            source = _diff_side(json_id, request.args.get('from_version'))
+            target = _diff_side(other_id, request.args.get('to_version'))
+        except ValueError:
+            message = invalid.format("Version")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+        if source is None or target is None:
+            message = notFound.format("Version")
             return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
 
-        # if user does not have access, grant access
-        access_already_exists = TeamJsonMap.query.filter_by(team=team_id, json=json_id).first()
-        if not access_already_exists:
+        # the patch only depends on the two documents
+        raw = request.args.get('raw') in ('1', 'true')
+        etag = entity_tag('diff', source[0], target[0], raw)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        operations = diff(source[1], target[1])
+        if raw:
+            return raw_response(json_backend.dumps(operations), content_type=patch.JSON_PATCH, etag=etag)
+
+        val = {
+            'from': json_id,
+            'to': other_id,
+            'patch': operations
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, etag=etag)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+def _schema_response(owner, schema_id):
+    """The schema attached to a json or a team, 404 when there is none
+    :param owner: dict, id of the json or team
+    :param schema_id: ValidationSchema id or None
+    :return:
+    """
+    schema = ValidationSchema.query.get(schema_id) if schema_id is not None else None
+    if schema is None:
+        message = notFound.format("Schema")
+        return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+
+    # a schema never changes, its hash identifies it
+    etag = entity_tag(schema.hash)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    val = dict(owner, hash=schema.hash, schema=schema.data)
+    return response_with(resp.SUCCESS_200, value=val, etag=etag)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/schema', methods=['GET'])
+@authenticate_jwt
+@authorize(json='json_id')
+def get_json_schema(json_id, access):
+    try:
+        return _schema_response({'json': json_id}, db.session.query(Json.schema).filter(Json.id == json_id).scalar())
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/schema', methods=['PUT'])
+@authenticate_jwt
+@authorize(json='json_id', json_roles=[JsonAccessMapType.OWNER.value])
+def set_json_schema(json_id, access):
+    try:
+        try:
+            schema, validator = validation.load_schema(request.get_data())
+        except ValueError:
+            message = invalid.format("Schema")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        # the current document has to be valid against it
+        json = Json.query.get(json_id)
+        errors = validation.errors([validator], json.parsed())
+        if errors:
+            return _invalid_document(errors)
+
+        json.attach_schema(ValidationSchema.acquire(schema).id)
+
+        return get_json_schema(json_id)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/schema', methods=['DELETE'])
+@authenticate_jwt
+@authorize(json='json_id', json_roles=[JsonAccessMapType.OWNER.value])
+def remove_json_schema(json_id, access):
+    try:
+        Json.query.get(json_id).attach_schema(None)
+        return response_with(resp.SUCCESS_200)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+def _bulk_shares():
+    """Pairs of a bulk share body, the caller owning every json and every team existing
+    :return: ([(json id, team id)], None) or (None, error response)
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, response_with(resp.INVALID_INPUT_422, message=invalid.format("JSON"))
+
+    try:
+        jsons, teams = sorted(set(_ids(data, 'json'))), sorted(set(_ids(data, 'team')))
+    except ValueError:
+        return None, response_with(resp.INVALID_INPUT_422, message=invalid.format("Id"))
+    if not jsons:
+        return None, response_with(resp.MISSING_PARAMETERS_422, message=required.format("JSON"))
+    if not teams:
+        return None, response_with(resp.MISSING_PARAMETERS_422, message=required.format("Team"))
+    if len(jsons) * len(teams) > SHARES_LIMIT:
+        return None, response_with(resp.INVALID_INPUT_422, message=tooMany.format(SHARES_LIMIT, "shares"))
+
+    # one ownership check over every json, one existence check over every team
+    found = {row.id for row in db.session.query(Team.id).filter(Team.id.in_(teams))}
+    if len(found) < len(teams):
+        return None, response_with(resp.NOT_FOUND_HANDLER_404, message=notFound.format("Team"),
+                                   value={'team': [team for team in teams if team not in found]})
+    owned = {row.json for row in db.session.query(JsonAccessMap.json)
+             .filter(JsonAccessMap.user == JWT.details['user_id'], JsonAccessMap.json.in_(jsons),
+                     JsonAccessMap.type == JsonAccessMapType.OWNER.value)}
+    if len(owned) < len(jsons):
+        return None, response_with(resp.NOT_FOUND_HANDLER_404, message=permission,
+                                   value={'json': [json_id for json_id in jsons if json_id not in owned]})
+
+    return [(json_id, team) for json_id in jsons for team in teams], None
+
+
+@route_path_general.route('/v1.0/json/team/bulk', methods=['POST'])
+@authenticate_jwt
+def share_json_bulk():
+    try:
+        pairs, error = _bulk_shares()
+        if error is not None:
+            return error
+
+        # documents have to be valid against the schemas of the teams they are shared with
+        failed = []
+        teams = {team for _, team in pairs}
+        schemas = dict(db.session.query(Team.id, Team.schema).filter(Team.id.in_(teams), Team.schema.isnot(None)))
+        if schemas:
+            validators = {team: ValidationSchema.validators([schema]) for team, schema in schemas.items()}
+            checked = sorted({json_id for json_id, team in pairs if team in validators})
+            documents = {json.id: json.parsed() for json in Json.query.filter(Json.id.in_(checked))}
+            for json_id, team in pairs:
+                if team in validators:
+                    errors = validation.errors(validators[team], documents[json_id])
+                    if errors:
+                        failed.append({'json': json_id, 'team': team, 'errors': errors})
+            rejected = {(result['json'], result['team']) for result in failed}
+            pairs = [pair for pair in pairs if pair not in rejected]
+
+        shared = Team.share(pairs) if pairs else []
+
+        val = {
+            'shared': [{'json': json_id, 'team': team} for json_id, team in shared],
+            'unchanged': [{'json': json_id, 'team': team} for json_id, team in sorted(set(pairs) - set(shared))],
+            'failed': failed
+        }
+
+        return response_with(resp.SUCCESS_200, value=val)
+    except IntegrityError:
+        # a concurrent request shared some of the pairs first, nothing was applied
+        return response_with(resp.CONFLICT_409)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/team/bulk', methods=['DELETE'])
+@authenticate_jwt
+def unshare_json_bulk():
+    try:
+        pairs, error = _bulk_shares()
+        if error is not None:
+            return error
+
+        unshared = Team.unshare(pairs)
+
+        val = {
+            'unshared': [{'json': json_id, 'team': team} for json_id, team in unshared],
+            'unchanged': [{'json': json_id, 'team': team} for json_id, team in sorted(set(pairs) - set(unshared))]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/json/<json_id>/team/<team_id>', methods=['POST'])
+@authenticate_jwt
+@authorize(json='json_id', team='team_id', json_roles=[JsonAccessMapType.OWNER.value], team_roles=None)
+def give_team_json_access(json_id, team_id, access):
+    try:
+        # if team does not have access, grant access
+        if not access.team_json:
+            # the document has to be valid against the team's schema
+            schema = db.session.query(Team.schema).filter(Team.id == team_id).scalar()
+            errors = validation.errors(ValidationSchema.validators([schema]), Json.query.get(json_id).parsed())
+            if errors:
+                return _invalid_document(errors)
+
             # add access
             team_access_data = {
                 "team": team_id,
@@ -265,6 +860,9 @@ def give_team_json_access(json_id, team_id):
         }
 
         return response_with(resp.SUCCESS_200, value=val)
+    except IntegrityError:
+        # a concurrent request granted the same access first
+        return response_with(resp.SUCCESS_200, value={"team": team_id, "json": json_id})
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
@@ -272,32 +870,12 @@ def give_team_json_access(json_id, team_id):
 
 @route_path_general.route('/v1.0/json/<json_id>/team/<team_id>', methods=['DELETE'])
 @authenticate_jwt
-def remove_team_json_access(json_id, team_id):
+@authorize(json='json_id', team='team_id', json_roles=[JsonAccessMapType.OWNER.value], team_roles=None)
+def remove_team_json_access(json_id, team_id, access):
     try:
-        # validate json exists
-        json = Json.query.filter_by(id=json_id).first()
-        if not json:
-            message = notFound.format("JSON")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate access to json
-        access = JsonAccessMap.query\
-            .filter_by(json=json_id, user=JWT.details['user_id'], type=TeamMemberType.OWNER.value)\
-            .first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
         # if team has access, remove access
-        json_access = TeamJsonMap.query.filter_by(team=team_id, json=json_id).first()
-        if json_access:
-            json_access.delete()
+        if access.team_json:
+            TeamJsonMap.query.get(access.team_json).delete()
 
         return response_with(resp.SUCCESS_200)
     except Exception as e:
@@ -338,37 +916,55 @@ def create_team():
         return response_with(resp.INVALID_INPUT_422)
 
 
-@route_path_general.route('/v1.0/team/<team_id>', methods=['GET'])
+@route_path_general.route('/v1.0/team', methods=['GET'])
 @authenticate_jwt
-def get_team(team_id):
+def list_teams():
     try:
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        try:
+            limit = page_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, int)[0] if cursor else None
+        except ValueError:
+            message = invalid.format("Pagination")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        try:
+            _type = _member_type(request.args.get('type'))
+        except ValueError:
+            message = invalid.format("Type")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        rows = Team.list_teams(JWT.details['user_id'], limit + 1, after, _type)
+        rows, page = pagination(rows, limit, lambda row: (row.id,))
 
-        # validate access to team
-        access = TeamMemberMap.query.filter_by(team=team_id, user=JWT.details['user_id']).first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        val = {
+            'team': [serializers.listed_team(row) for row in rows]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, pagination=page)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/team/<team_id>', methods=['GET'])
+@authenticate_jwt
+@authorize(team='team_id')
+def get_team(team_id, access):
+    try:
+        team = Team.query.get(team_id)
 
         # response details
-        team_schema = TeamSchema()
-        team_data, error = team_schema.dump(team)
-        team_member_schema = TeamMemberMapSchema()
-        team_member_data, error = team_member_schema.dump(access)
+        val = serializers.team_details(team)
+        val['type'] = access.team_type
 
-        val = {
-            'id': team_data['id'],
-            'name': team_data['name'],
-            'type': team_member_data['type'],
-            'created': team_data['created'],
-            'updated': team_data['updated']
-        }
+        # the caller's role changes without touching updated, the tag covers every field
+        etag = entity_tag(*sorted(val.items()))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
 
-        return response_with(resp.SUCCESS_200, value=val)
+        return response_with(resp.SUCCESS_200, value=val, etag=etag)
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
@@ -385,19 +981,13 @@ def update_team(team_id):
             message = required.format("Name")
             return response_with(resp.MISSING_PARAMETERS_422, message=message)
 
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate access to team
-        access = TeamMemberMap.query.filter_by(team=team_id, user=JWT.details['user_id']).first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        # validate team exists and access to team
+        error = resolve_access(JWT.details['user_id'], team=team_id).error()
+        if error is not None:
+            return error
 
         # update team
+        team = Team.query.get(team_id)
         team.update(name)
 
         # response details
@@ -415,24 +1005,11 @@ def update_team(team_id):
 
 @route_path_general.route('/v1.0/team/<team_id>', methods=['DELETE'])
 @authenticate_jwt
-def delete_team(team_id):
+@authorize(team='team_id', team_roles=[TeamMemberType.OWNER.value])
+def delete_team(team_id, access):
     try:
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate access to team
-        access = TeamMemberMap.query\
-            .filter_by(team=team_id, user=JWT.details['user_id'], type=TeamMemberType.OWNER.value)\
-            .first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
         # delete team
-        team.delete()
+        Team.query.get(team_id).delete()
 
         return response_with(resp.SUCCESS_200)
     except Exception as e:
@@ -452,29 +1029,14 @@ def add_team_member(team_id):
             message = required.format("User")
             return response_with(resp.MISSING_PARAMETERS_422, message=message)
 
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate user exists
-        user_exists = User.query.filter_by(id=user).first()
-        if not user_exists:
-            message = notFound.format("User")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
-
-        # validate access to team
-        access = TeamMemberMap.query\
-            .filter_by(team=team_id, user=JWT.details['user_id'], type=TeamMemberType.OWNER.value)\
-            .first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        # validate team and user exist and access to team
+        access = resolve_access(JWT.details['user_id'], team=team_id, user=user)
+        error = access.error(team_roles=[TeamMemberType.OWNER.value])
+        if error is not None:
+            return error
 
         # if user does not have access, grant access
-        access_already_exists = TeamMemberMap.query.filter_by(team=team_id, user=user).first()
-        if not access_already_exists:
+        if not access.member:
             # add access
             team_member_data = {
                 "user": user,
@@ -486,42 +1048,174 @@ def add_team_member(team_id):
             team_member, error = team_member_map.load(team_member_data)
             team_member.create()
 
+        return response_with(resp.SUCCESS_200)
+    except IntegrityError:
+        # a concurrent request added the same member first
         return response_with(resp.SUCCESS_200)
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
 
 
-@route_path_general.route('/v1.0/team/<team_id>/access/<user_id>', methods=['DELETE'])
+@route_path_general.route('/v1.0/team/<team_id>/access/bulk', methods=['POST'])
 @authenticate_jwt
-def remove_team_member(team_id, user_id):
+@authorize(team='team_id', team_roles=[TeamMemberType.OWNER.value])
+def bulk_team_members(team_id, access):
     try:
-        # validate team exists
-        team = Team.query.filter_by(id=team_id).first()
-        if not team:
-            message = notFound.format("Team")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            message = invalid.format("JSON")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        try:
+            add, remove = _ids(data, 'add'), _ids(data, 'remove')
+        except ValueError:
+            message = invalid.format("User")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        users = set(add) | set(remove)
+        if not users:
+            message = required.format("User")
+            return response_with(resp.MISSING_PARAMETERS_422, message=message)
+        if len(users) > MEMBERS_LIMIT:
+            message = tooMany.format(MEMBERS_LIMIT, "users")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+        if set(add) & set(remove):
+            message = invalid.format("User")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        # every user is checked in one query, unknown users are reported and skipped
+        found = {row.id for row in db.session.query(User.id).filter(User.id.in_(users))}
+        added = Team.add_members(int(team_id), [user for user in add if user in found], TeamMemberType.MEMBER.value)
+        removed = Team.remove_members(int(team_id), [user for user in remove if user in found])
 
-        # validate user exists
-        user_exists = User.query.filter_by(id=user_id).first()
-        if not user_exists:
-            message = notFound.format("User")
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        val = {
+            'team': int(team_id),
+            'added': added,
+            'removed': removed,
+            'unchanged': sorted((users & found) - set(added) - set(removed)),
+            'not_found': sorted(users - found)
+        }
 
-        # validate access to team
-        access = TeamMemberMap.query\
-            .filter_by(team=team_id, user=JWT.details['user_id'], type=TeamMemberType.OWNER.value) \
-            .first()
-        if not access:
-            message = permission
-            return response_with(resp.NOT_FOUND_HANDLER_404, message=message)
+        return response_with(resp.SUCCESS_200, value=val)
+    except IntegrityError:
+        # a concurrent request added some of the users first, nothing was applied
+        return response_with(resp.CONFLICT_409)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/team/<team_id>/access', methods=['GET'])
+@authenticate_jwt
+@authorize(team='team_id')
+def list_team_members(team_id, access):
+    try:
+        try:
+            limit = page_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, int)[0] if cursor else None
+        except ValueError:
+            message = invalid.format("Pagination")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        try:
+            _type = _member_type(request.args.get('type'))
+        except ValueError:
+            message = invalid.format("Type")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        rows = TeamMemberMap.list_members(team_id, limit + 1, after, _type)
+        rows, page = pagination(rows, limit, lambda row: (row.id,))
+
+        val = {
+            'user': [serializers.listed_member(row) for row in rows]
+        }
+
+        return response_with(resp.SUCCESS_200, value=val, pagination=page)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
 
+
+@route_path_general.route('/v1.0/team/<team_id>/access/<user_id>', methods=['DELETE'])
+@authenticate_jwt
+@authorize(team='team_id', user='user_id', team_roles=[TeamMemberType.OWNER.value])
+def remove_team_member(team_id, user_id, access):
+    try:
         # if team member exists, delete
-        team_member = TeamMemberMap.query.filter_by(team=team_id, user=user_id).first()
-        if team_member:
-            team_member.delete()
+        if access.member:
+            TeamMemberMap.query.get(access.member).delete()
 
         return response_with(resp.SUCCESS_200)
     except Exception as e:
         logging.error(e)
         return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/team/<team_id>/schema', methods=['GET'])
+@authenticate_jwt
+@authorize(team='team_id')
+def get_team_schema(team_id, access):
+    try:
+        return _schema_response({'team': team_id}, db.session.query(Team.schema).filter(Team.id == team_id).scalar())
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/team/<team_id>/schema', methods=['PUT'])
+@authenticate_jwt
+@authorize(team='team_id', team_roles=[TeamMemberType.OWNER.value])
+def set_team_schema(team_id, access):
+    try:
+        try:
+            schema, validator = validation.load_schema(request.get_data())
+        except ValueError:
+            message = invalid.format("Schema")
+            return response_with(resp.INVALID_INPUT_422, message=message)
+
+        # jsons already shared are validated on their next update
+        Team.query.get(team_id).attach_schema(ValidationSchema.acquire(schema).id)
+
+        return get_team_schema(team_id)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+@route_path_general.route('/v1.0/team/<team_id>/schema', methods=['DELETE'])
+@authenticate_jwt
+@authorize(team='team_id', team_roles=[TeamMemberType.OWNER.value])
+def remove_team_schema(team_id, access):
+    try:
+        Team.query.get(team_id).attach_schema(None)
+        return response_with(resp.SUCCESS_200)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+
+"""
+STATS
+"""
+
+
+@route_path_general.route('/v1.0/stats', methods=['GET'])
+@authenticate_jwt
+def get_stats():
+    try:
+        val = {
+            'cache': {
+                'json_access': json_access_cache.stats(),
+                'team_access': team_access_cache.stats(),
+                'query_expression': query_expression_cache.stats(),
+                'schema_validator': schema_validator_cache.stats(),
+                'document': document_cache.stats()
+            }
+        }
+
+        return response_with(resp.SUCCESS_200, value=val)
+    except Exception as e:
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
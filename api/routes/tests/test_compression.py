@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+from api.routes.tests.utils.db_operation import create_users, delete_users
+from api.utils import compression
+from api.utils.test_base import BaseTestCase
+from faker import Faker
+
+fake = Faker()
+
+
+class TestCompression(BaseTestCase):
+    users = None
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+        self.users = create_users()
+        login = {
+            "login": self.users[0]["login"],
+            "password": self.users[0]["password"]
+        }
+        response = self.app.post("/api/v1.0/login", data=json.dumps(login), content_type="application/json")
+        data = json.loads(response.data)
+        self.headers = {'Authorization': data['token']}
+        self.uid = data['user']['id']
+
+    def tearDown(self):
+        delete_users(self.users)
+        super(TestCompression, self).tearDown()
+
+    def _save(self, document):
+        response = self.app.post("/api/v1.0/json/save", headers=self.headers, content_type="application/json",
+                                 data=json.dumps({"data": json.dumps(document)}))
+        return json.loads(response.data)['id']
+
+    def test_gzip(self):
+        document = {"items": [{"id": i, "name": fake.first_name()} for i in range(500)]}
+        url = "/api/v1.0/json/{}".format(self._save(document))
+
+        response = self.app.get(url, headers=dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(document, json.loads(json.loads(gzip.decompress(response.data).decode('utf-8'))['data']))
+
+        # the compressed representation has its own tag, and revalidates
+        etag = response.headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        response = self.app.get(url, headers=dict(self.headers, **{'Accept-Encoding': 'gzip', 'If-None-Match': etag}))
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+
+        response = self.app.get(url, headers=self.headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed(self):
+        document = {"items": [{"id": i, "name": fake.first_name()} for i in range(500)]}
+        url = "/api/v1.0/json/{}?raw=true".format(self._save(document))
+
+        response = self.app.get(url, headers=dict(self.headers, **{'Accept-Encoding': 'br;q=1.0, gzip;q=0.5'}))
+        encoding = 'br' if compression.brotli is not None else 'gzip'
+        self.assertEqual(encoding, response.headers['Content-Encoding'])
+        self.assertNotIn('Content-Length', response.headers)
+        if encoding == 'gzip':
+            self.assertEqual(document, json.loads(gzip.decompress(response.data).decode('utf-8')))
+
+    def test_small_response(self):
+        response = self.app.get("/api/v1.0/user/{}".format(self.uid),
+                                headers=dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn('Content-Encoding', response.headers)
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import inspect
+from api.models.json import Json
+from api.models.json_access_map import JsonAccessMap
+from api.models.json_version import JsonVersion
+from api.models.team_json_map import TeamJsonMap
+from api.models.team_member_map import TeamMemberMap
+from api.models.user import User
+from api.routes.tests.utils.db_operation import create_users, create_json
+from api.utils import migrations
+from api.utils.database import db
+from api.utils.enums import JsonAccessMapType, TeamMemberType
+from api.utils.search import query_terms
+from api.utils.test_base import BaseTestCase
+
+
+class TestMigrations(BaseTestCase):
+    users = None
+    _json = None
+
+    def setUp(self):
+        super(TestMigrations, self).setUp()
+        self.users = create_users()
+        self._json = create_json()
+
+    def test_access_map_indexes(self):
+        table = JsonAccessMap.__table__
+        for index in table.indexes:
+            index.drop(db.engine)
+
+        uid = db.session.query(User.id).filter(User.login == self.users[0]['login']).scalar()
+        json_id = db.session.query(Json.id).filter(Json.id == self._json[0]['id']).scalar()
+        for _type in (JsonAccessMapType.READ, JsonAccessMapType.OWNER, JsonAccessMapType.WRITE):
+            db.session.execute(table.insert(), {'user': uid, 'json': json_id, 'type': _type.value})
+        db.session.commit()
+
+        self.assertIn('0001_access_map_indexes', migrations.upgrade())
+
+        rows = JsonAccessMap.query.filter_by(user=uid, json=json_id).all()
+        self.assertEqual(1, len(rows))
+        self.assertEqual(JsonAccessMapType.OWNER.value, rows[0].type)
+
+        names = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+        self.assertTrue({index.name for index in table.indexes} <= names)
+
+        # applied steps are recorded and not run twice
+        self.assertEqual([], migrations.upgrade())
+
+    def test_upgrade_baseline_schema(self):
+        # the schema as it was before any migration, with the rows a deployment had
+        db.session.close_all()
+        db.drop_all()
+        baseline = db.MetaData()
+
+        def table(name, *columns):
+            return db.Table(name, baseline, db.Column('id', db.BigInteger, primary_key=True), *columns,
+                            db.Column('created', db.DateTime, server_default=db.func.now()),
+                            db.Column('updated', db.DateTime))
+        user = table('user', *[db.Column(name, db.String(255)) for name in
+                               ('name', 'surname', 'email', 'login', 'password')])
+        json = table('json', db.Column('data', db.String(10000)))
+        team = table('team', db.Column('name', db.String(255)))
+        json_access_map = table('json_access_map', db.Column('user', db.BigInteger), db.Column('json', db.BigInteger),
+                                db.Column('type', db.Integer))
+        team_member_map = table('team_member_map', db.Column('user', db.BigInteger), db.Column('team', db.BigInteger),
+                                db.Column('type', db.Integer))
+        team_json_map = table('team_json_map', db.Column('team', db.BigInteger), db.Column('json', db.BigInteger))
+        baseline.create_all(db.engine)
+
+        documents = ['{"name":"a"}', '{"name":"b","items":[1,2]}', '{"name":"a"}']
+        with db.engine.begin() as connection:
+            connection.execute(user.insert(), [{'id': i, 'login': str(i), 'email': str(i)} for i in (1, 2)])
+            connection.execute(json.insert(), [{'id': i + 1, 'data': data} for i, data in enumerate(documents)])
+            connection.execute(json_access_map.insert(), [
+                {'user': 1, 'json': 1, 'type': JsonAccessMapType.READ.value},
+                {'user': 1, 'json': 1, 'type': JsonAccessMapType.OWNER.value},
+                {'user': 1, 'json': 2, 'type': JsonAccessMapType.OWNER.value},
+                {'user': 2, 'json': 3, 'type': JsonAccessMapType.OWNER.value}])
+            connection.execute(team.insert(), {'id': 1, 'name': 'team'})
+            connection.execute(team_member_map.insert(), [{'user': 1, 'team': 1, 'type': TeamMemberType.OWNER.value},
+                                                          {'user': 2, 'team': 1, 'type': TeamMemberType.MEMBER.value}])
+            connection.execute(team_json_map.insert(), {'team': 1, 'json': 2})
+
+        self.assertEqual([name for name, _ in migrations.MIGRATIONS], migrations.upgrade())
+        self.assertEqual([], migrations.upgrade())
+
+        for json_id, data in enumerate(documents, 1):
+            self.assertEqual(data, Json.query.get(json_id).data)
+        # identical documents share a body, every json has its first version and is searchable
+        self.assertEqual(Json.query.get(1).body, Json.query.get(3).body)
+        self.assertEqual(3, JsonVersion.query.count())
+        self.assertEqual([1, 3], [row.id for row in Json.search(1, query_terms([], [], ['"a"']), 10)] +
+                         [row.id for row in Json.search(2, query_terms([], [], ['"a"']), 10)])
+        self.assertEqual([(2, 1), (2, 1)], [(u.json_count, u.team_count) for u in User.query.order_by(User.id)])
+        for model in (Json, JsonAccessMap, TeamMemberMap, TeamJsonMap):
+            names = {index['name'] for index in inspect(db.engine).get_indexes(model.__tablename__)}
+            self.assertTrue({index.name for index in model.__table__.indexes} <= names)
@@ -1,10 +1,28 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import base64
+import hashlib
 import json
+import zlib
+from datetime import datetime
+from unittest import mock
+from sqlalchemy.exc import IntegrityError
+from api.models.json import Json
+from api.models.json_access_map import JsonAccessMap
+from api.models import json_version
+from api.models.json_body import JsonBody
+from api.models.json_version import JsonVersion
+from api.models.team import Team
 from api.routes.tests.utils.db_operation import create_users, create_json, delete_users, delete_json
 from api.utils.constants import notFound, permission
+from api.utils.diff import diff
+from api.utils.database import db
+from api.utils.enums import JsonAccessMapType
+from api.utils import json_backend, patch
+from api.utils.cache import document_cache
 from api.utils.test_base import BaseTestCase
+from api.utils.transaction import unit_of_work
 from faker import Faker
 
 fake = Faker()
@@ -137,3 +155,793 @@ class TestJson(BaseTestCase):
         self.assertIn('code', data)
         self.assertIn('message', data)
         self.assertEqual(permission, data['message'])
+
+
+class TestJsonAccess(BaseTestCase):
+    users = None
+
+    def setUp(self):
+        super(TestJsonAccess, self).setUp()
+        self.users = create_users(2)
+
+    def _headers(self, user):
+        login = {
+            "login": user["login"],
+            "password": user["password"]
+        }
+        response = self.app.post(
+            "/api/v1.0/login",
+            data=json.dumps(login),
+            content_type="application/json",
+        )
+        data = json.loads(response.data)
+        return {'Authorization': data['token']}, data['user']['id']
+
+    def _save(self, headers, document):
+        response = self.app.post(
+            "/api/v1.0/json/save",
+            headers=headers,
+            content_type="application/json",
+            data=json.dumps({"data": json.dumps(document)})
+        )
+        return json.loads(response.data)['id']
+
+    def test_json_owner(self):
+        headers, _ = self._headers(self.users[0])
+        json_id = self._save(headers, {"name": fake.first_name()})
+
+        response = self.app.get(
+            "/api/v1.0/json/{}".format(json_id),
+            headers=headers,
+            content_type="application/json",
+        )
+
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(JsonAccessMapType.OWNER.value, data['permission'])
+
+    def test_json_team_read(self):
+        headers_0, _ = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        json_id = self._save(headers_0, {"name": fake.first_name()})
+
+        response = self.app.post(
+            "/api/v1.0/team",
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"name": fake.company()})
+        )
+        team_id = json.loads(response.data)['team']['id']
+        self.app.post(
+            "/api/v1.0/team/{}/access".format(team_id),
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"user": uid_1})
+        )
+
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers_1)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(permission, json.loads(response.data)['message'])
+
+        response = self.app.post("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_0)
+        self.assertEqual(200, response.status_code)
+
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers_1)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(JsonAccessMapType.READ.value, data['permission'])
+
+        # only owners manage team access
+        response = self.app.delete("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_1)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(permission, json.loads(response.data)['message'])
+
+        response = self.app.delete("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_0)
+        self.assertEqual(200, response.status_code)
+
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers_1)
+        self.assertEqual(404, response.status_code)
+
+    def test_permission_cache(self):
+        headers, _ = self._headers(self.users[0])
+        json_id = self._save(headers, {"name": fake.first_name()})
+
+        for _ in range(3):
+            response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers)
+            self.assertEqual(200, response.status_code)
+
+        response = self.app.get("/api/v1.0/stats", headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, data['cache']['json_access']['misses'])
+        self.assertEqual(2, data['cache']['json_access']['hits'])
+
+    def test_user_counters(self):
+        headers_0, uid_0 = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        json_ids = [self._save(headers_0, {"name": fake.first_name()}) for _ in range(2)]
+        self._save(headers_1, {"name": fake.first_name()})
+
+        response = self.app.post(
+            "/api/v1.0/team",
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"name": fake.company()})
+        )
+        team_id = json.loads(response.data)['team']['id']
+        self.app.post(
+            "/api/v1.0/team/{}/access".format(team_id),
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"user": uid_1})
+        )
+        for json_id in json_ids:
+            self.app.post("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_0)
+
+        def counts(uid):
+            response = self.app.get("/api/v1.0/user/{}".format(uid), headers=headers_0)
+            data = json.loads(response.data)
+            self.assertEqual(Json.count_json(uid), data['json_count'])
+            self.assertEqual(Team.count_teams(uid), data['team_count'])
+            return data['json_count'], data['team_count']
+
+        self.assertEqual((2, 1), counts(uid_0))
+        self.assertEqual((3, 1), counts(uid_1))
+
+        self.app.delete("/api/v1.0/json/{}/team/{}".format(json_ids[0], team_id), headers=headers_0)
+        self.assertEqual((2, 1), counts(uid_0))
+        self.assertEqual((2, 1), counts(uid_1))
+
+        self.app.delete("/api/v1.0/team/{}/access/{}".format(team_id, uid_1), headers=headers_0)
+        self.assertEqual((1, 0), counts(uid_1))
+
+        self.app.post(
+            "/api/v1.0/team/{}/access".format(team_id),
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"user": uid_1})
+        )
+        self.assertEqual((2, 1), counts(uid_1))
+
+        self.app.delete("/api/v1.0/team/{}".format(team_id), headers=headers_0)
+        self.assertEqual((2, 0), counts(uid_0))
+        self.assertEqual((1, 0), counts(uid_1))
+
+    def test_list_json(self):
+        headers_0, _ = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        own = [self._save(headers_1, {"index": i}) for i in range(3)]
+        shared = self._save(headers_0, {"name": fake.first_name()})
+        self._save(headers_0, {"name": fake.first_name()})
+
+        response = self.app.post(
+            "/api/v1.0/team",
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"name": fake.company()})
+        )
+        team_id = json.loads(response.data)['team']['id']
+        self.app.post(
+            "/api/v1.0/team/{}/access".format(team_id),
+            headers=headers_0,
+            content_type="application/json",
+            data=json.dumps({"user": uid_1})
+        )
+        self.app.post("/api/v1.0/json/{}/team/{}".format(shared, team_id), headers=headers_0)
+
+        listed = []
+        url = "/api/v1.0/json?limit=3"
+        for _ in range(3):
+            response = self.app.get(url, headers=headers_1)
+            data = json.loads(response.data)
+            self.assertEqual(200, response.status_code)
+            self.assertLessEqual(len(data['json']), 3)
+            for item in data['json']:
+                self.assertNotIn('data', item)
+            listed.extend(data['json'])
+            cursor = data['pagination']['next']
+            if not cursor:
+                break
+            url = "/api/v1.0/json?limit=3&cursor={}".format(cursor)
+
+        self.assertEqual(sorted(own + [shared], reverse=True), [item['id'] for item in listed])
+        permissions = {item['id']: item['permission'] for item in listed}
+        self.assertEqual(JsonAccessMapType.READ.value, permissions[shared])
+        self.assertEqual(JsonAccessMapType.OWNER.value, permissions[own[0]])
+
+    def test_list_json_invalid_cursor(self):
+        headers, _ = self._headers(self.users[0])
+        response = self.app.get("/api/v1.0/json?cursor=invalid", headers=headers)
+        self.assertEqual(422, response.status_code)
+
+        # well-formed cursors holding values of the wrong type
+        for values in ([{}, 1], [None, {}], ["2020-01-01T00:00:00", [1]]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+            response = self.app.get("/api/v1.0/json?cursor=" + cursor, headers=headers)
+            self.assertEqual(422, response.status_code)
+        cursor = base64.urlsafe_b64encode(b'[{}]').decode('ascii')
+        self.assertEqual(422, self.app.get("/api/v1.0/team?cursor=" + cursor, headers=headers).status_code)
+        self.assertEqual(422, self.app.get("/api/v1.0/json/search?key=a&cursor=" + cursor,
+                                           headers=headers).status_code)
+
+    def test_large_document(self):
+        headers, _ = self._headers(self.users[0])
+        document = {"items": [{"id": i, "name": fake.first_name()} for i in range(2000)]}
+        json_id = self._save(headers, document)
+
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(document, json.loads(data['data']))
+
+        body = Json.query.get(json_id).content
+        self.assertEqual('zlib', body.codec)
+        self.assertGreater(body.size, 10000)
+        self.assertLess(body.stored_size, body.size)
+
+    def test_deduplicated_document(self):
+        headers, _ = self._headers(self.users[0])
+        other_headers, _ = self._headers(self.users[1])
+        document = {"name": fake.first_name(), "items": [fake.first_name() for _ in range(10)]}
+        json_id = self._save(headers, document)
+        response = self.app.post(
+            "/api/v1.0/json/save",
+            headers=other_headers,
+            content_type="application/json",
+            data=json.dumps({"data": json.dumps(document, indent=4)})
+        )
+        other_id = json.loads(response.data)['id']
+
+        first, second = Json.query.get(json_id), Json.query.get(other_id)
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.hash, second.content.hash)
+        # referenced by both jsons and their first versions
+        self.assertEqual(4, first.content.ref_count)
+
+        response = self.app.get("/api/v1.0/json/{}".format(other_id), headers=other_headers)
+        self.assertEqual(document, json.loads(json.loads(response.data)['data']))
+
+        body = first.body
+        delete_json([{'id': json_id}])
+        self.assertEqual(2, JsonBody.query.get(body).ref_count)
+        delete_json([{'id': other_id}])
+        self.assertIsNone(JsonBody.query.get(body))
+
+    def test_raw_document(self):
+        headers, _ = self._headers(self.users[0])
+        document = {"items": [{"id": i, "name": fake.first_name()} for i in range(500)]}
+        json_id = self._save(headers, document)
+
+        response = self.app.get("/api/v1.0/json/{}?raw=true".format(json_id), headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(document, json.loads(response.data.decode('utf-8')))
+        self.assertEqual(str(json_id), response.headers['X-Json-Id'])
+        self.assertEqual(str(JsonAccessMapType.OWNER.value), response.headers['X-Json-Permission'])
+        self.assertIn('X-Json-Updated', response.headers['Access-Control-Expose-Headers'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        # the stored zlib stream is sent as it is to clients accepting deflate
+        response = self.app.get("/api/v1.0/json/{}?raw=true".format(json_id),
+                                headers=dict(headers, **{'Accept-Encoding': 'gzip, deflate'}))
+        self.assertEqual('deflate', response.headers['Content-Encoding'])
+        self.assertEqual(Json.query.get(json_id).content.data, response.data)
+        self.assertEqual(document, json.loads(zlib.decompress(response.data).decode('utf-8')))
+
+    def test_conditional_get(self):
+        headers, uid = self._headers(self.users[0])
+        json_id = self._save(headers, {"name": fake.first_name()})
+        url = "/api/v1.0/json/{}".format(json_id)
+
+        response = self.app.get(url, headers=headers)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        self.assertEqual(200, response.status_code)
+
+        response = self.app.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.data)
+        self.assertEqual(etag, response.headers['ETag'])
+
+        response = self.app.get(url, headers=dict(headers, **{'If-Modified-Since': last_modified}))
+        self.assertEqual(304, response.status_code)
+
+        response = self.app.get(url, headers=dict(headers, **{'If-None-Match': '"stale"',
+                                                              'If-Modified-Since': last_modified}))
+        self.assertEqual(200, response.status_code)
+
+        # raw and enveloped documents are different representations
+        response = self.app.get(url + "?raw=true", headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+        # user details change with the counters
+        url = "/api/v1.0/user/{}".format(uid)
+        etag = self.app.get(url, headers=headers).headers['ETag']
+        response = self.app.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(304, response.status_code)
+        self._save(headers, {"name": fake.first_name()})
+        response = self.app.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(200, response.status_code)
+
+    def test_raw_upload(self):
+        headers, _ = self._headers(self.users[0])
+        document = {"name": fake.first_name(), "tags": ["a", "b"], "nested": {"x": 1.5, "y": None}}
+        response = self.app.post("/api/v1.0/json/save?raw=true", headers=headers,
+                                 content_type="application/json", data=json.dumps(document, indent=2))
+        self.assertEqual(200, response.status_code)
+        json_id = json.loads(response.data)['id']
+
+        # stored minified, in the same form as an enveloped upload of the document
+        stored = Json.query.get(json_id)
+        self.assertEqual(json_backend.canonical(document).decode('utf-8'), stored.data)
+        self.assertEqual(stored.body, Json.query.get(self._save(headers, document)).body)
+
+        response = self.app.post("/api/v1.0/json/save?raw=true", headers=headers,
+                                 content_type="application/json", data='{"name": ')
+        self.assertEqual(422, response.status_code)
+
+    def test_big_integers(self):
+        text = '{"a":12345678901234567890,"b":123456789012345678901234567890,"c":-9223372036854775809,"d":1.5}'
+        previous = json_backend.backend()
+        for backend in sorted(json_backend.BACKENDS):
+            json_backend.configure(backend)
+            try:
+                self.assertEqual(text, json_backend.canonical(json_backend.loads(text)).decode('utf-8'))
+                self.assertEqual(text, json_backend.dumps(json_backend.loads(text.encode('utf-8'))).decode('utf-8'))
+            finally:
+                json_backend.configure(previous)
+
+        # saved, indexed and returned exactly as sent
+        headers, _ = self._headers(self.users[0])
+        response = self.app.post("/api/v1.0/json/save", headers=headers, content_type="application/json",
+                                 data=json.dumps({"data": text}))
+        self.assertEqual(200, response.status_code)
+        json_id = json.loads(response.data)['id']
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers)
+        self.assertEqual(text, json.loads(response.data)['data'])
+        response = self.app.get("/api/v1.0/json/search?value=123456789012345678901234567890", headers=headers)
+        self.assertEqual([json_id], [row['id'] for row in json.loads(response.data)['json']])
+
+    def test_query_document(self):
+        headers, _ = self._headers(self.users[0])
+        other_headers, _ = self._headers(self.users[1])
+        items = [{"id": i, "tag": "even" if i % 2 else "odd"} for i in range(10)]
+        document = {"owner": {"name": fake.first_name()}, "items": items}
+        json_id = self._save(headers, document)
+        url = "/api/v1.0/json/{}/query".format(json_id)
+
+        response = self.app.get(url + "?expr=owner.name", headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(document['owner']['name'], json.loads(response.data)['result'])
+
+        response = self.app.get(url, headers=headers, query_string={'expr': "items[?tag=='odd'].id"})
+        self.assertEqual([0, 2, 4, 6, 8], json.loads(response.data)['result'])
+
+        response = self.app.get(url + "?expr=missing.field", headers=headers)
+        self.assertIsNone(json.loads(response.data)['result'])
+
+        response = self.app.get(url + "?expr=items[", headers=headers)
+        self.assertEqual(422, response.status_code)
+        response = self.app.get(url, headers=headers)
+        self.assertEqual(422, response.status_code)
+
+        response = self.app.get(url + "?expr=owner", headers=other_headers)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(permission, json.loads(response.data)['message'])
+
+    def test_document_cache(self):
+        headers, _ = self._headers(self.users[0])
+        json_ids = [self._save(headers, {"items": [fake.first_name() for _ in range(100)]}) for _ in range(2)]
+
+        for json_id in json_ids + json_ids:
+            response = self.app.get("/api/v1.0/json/{}/query?expr=items[0]".format(json_id), headers=headers)
+            self.assertEqual(200, response.status_code)
+
+        stats = json.loads(self.app.get("/api/v1.0/stats", headers=headers).data)['cache']['document']
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(2, stats['size'])
+        self.assertGreater(stats['bytes'], 0)
+
+        # bounded by bytes, the least recently used document goes first
+        document_cache.configure(stats['bytes'] - 1)
+        for json_id in json_ids:
+            Json.query.get(json_id).parsed()
+        stats = document_cache.stats()
+        self.assertEqual(1, stats['size'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertLessEqual(stats['bytes'], stats['maxbytes'])
+
+    def test_patch_document(self):
+        headers, _ = self._headers(self.users[0])
+        other_headers, other_uid = self._headers(self.users[1])
+        document = {"name": "before", "items": [1, 2, 3], "meta": {"a": 1, "b": 2}}
+        json_id = self._save(headers, document)
+        url = "/api/v1.0/json/{}".format(json_id)
+        body = Json.query.get(json_id).body
+
+        operations = [{"op": "replace", "path": "/name", "value": "after"},
+                      {"op": "add", "path": "/items/-", "value": 4},
+                      {"op": "remove", "path": "/meta/a"}]
+        response = self.app.patch(url, headers=headers, content_type="application/json-patch+json",
+                                  data=json.dumps(operations))
+        self.assertEqual(200, response.status_code)
+        etag = response.headers['ETag']
+
+        response = self.app.get(url, headers=headers)
+        expected = {"name": "after", "items": [1, 2, 3, 4], "meta": {"b": 2}}
+        self.assertEqual(expected, json.loads(json.loads(response.data)['data']))
+        self.assertEqual(etag, response.headers['ETag'])
+        # the previous body is only kept for the first version
+        self.assertEqual(1, JsonBody.query.get(body).ref_count)
+
+        response = self.app.patch(url, headers=dict(headers, **{'If-Match': etag}),
+                                  content_type="application/merge-patch+json",
+                                  data=json.dumps({"meta": {"b": None, "c": [5]}, "name": None}))
+        self.assertEqual(200, response.status_code)
+        response = self.app.get(url, headers=headers)
+        self.assertEqual({"items": [1, 2, 3, 4], "meta": {"c": [5]}}, json.loads(json.loads(response.data)['data']))
+
+        # stale If-Match, failed test operation and unsupported media type leave the document as it is
+        response = self.app.patch(url, headers=dict(headers, **{'If-Match': etag}),
+                                  content_type="application/merge-patch+json", data=json.dumps({"x": 1}))
+        self.assertEqual(412, response.status_code)
+        response = self.app.patch(url, headers=headers, content_type="application/json-patch+json",
+                                  data=json.dumps([{"op": "add", "path": "/x", "value": 1},
+                                                   {"op": "test", "path": "/items/0", "value": 9}]))
+        self.assertEqual(422, response.status_code)
+        response = self.app.patch(url, headers=headers, content_type="application/json", data=json.dumps({"x": 1}))
+        self.assertEqual(415, response.status_code)
+        response = self.app.get(url, headers=headers)
+        self.assertNotIn("x", json.loads(json.loads(response.data)['data']))
+
+        # a scalar merge patch replaces the whole document
+        scalar_id = self._save(headers, {"a": 1})
+        response = self.app.patch("/api/v1.0/json/{}".format(scalar_id), headers=headers,
+                                  content_type="application/merge-patch+json", data=json.dumps(5))
+        self.assertEqual(200, response.status_code)
+        response = self.app.get("/api/v1.0/json/{}".format(scalar_id), headers=headers)
+        self.assertEqual(5, json.loads(json.loads(response.data)['data']))
+
+        # writers may patch, readers may not
+        response = self.app.patch(url, headers=other_headers, content_type="application/merge-patch+json",
+                                  data=json.dumps({"x": 1}))
+        self.assertEqual(404, response.status_code)
+        with unit_of_work():
+            JsonAccessMap(other_uid, json_id, JsonAccessMapType.WRITE.value).create()
+        response = self.app.patch(url, headers=other_headers, content_type="application/merge-patch+json",
+                                  data=json.dumps({"x": 1}))
+        self.assertEqual(200, response.status_code)
+
+    def test_versions(self):
+        headers, uid = self._headers(self.users[0])
+        json_version.configure(3)
+        documents = [{"name": fake.first_name(), "items": list(range(20))}]
+        json_id = self._save(headers, documents[0])
+        url = "/api/v1.0/json/{}".format(json_id)
+        for i in range(6):
+            document = dict(documents[-1], items=documents[-1]['items'] + [i], step=i)
+            self.app.patch(url, headers=headers, content_type="application/merge-patch+json",
+                           data=json.dumps({"items": document['items'], "step": i}))
+            documents.append(document)
+
+        response = self.app.get(url + "/versions?limit=5", headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([7, 6, 5, 4, 3], [v['version'] for v in data['version']])
+        self.assertEqual([True, False, False, True, False], [v['snapshot'] for v in data['version']])
+        self.assertTrue(all(isinstance(v['snapshot'], bool) for v in data['version']))
+        self.assertEqual(uid, data['version'][0]['author'])
+        response = self.app.get(url + "/versions?cursor=" + data['pagination']['next'], headers=headers)
+        self.assertEqual([2, 1], [v['version'] for v in json.loads(response.data)['version']])
+
+        for version, document in enumerate(documents, 1):
+            response = self.app.get(url + "/versions/{}".format(version), headers=headers)
+            data = json.loads(response.data)
+            self.assertEqual(document, json.loads(data['data']))
+            self.assertEqual(json_backend.canonical(json.loads(data['data'])).decode('utf-8'), data['data'])
+        self.assertEqual(404, self.app.get(url + "/versions/8", headers=headers).status_code)
+
+        # compaction drops old deltas and keeps every remaining version intact
+        db.session.query(JsonVersion).filter(JsonVersion.json == json_id, JsonVersion.version <= 5)\
+            .update({'created': datetime(2000, 1, 1)}, synchronize_session=False)
+        db.session.commit()
+        self.assertEqual(3, JsonVersion.compact(json_id, datetime(2001, 1, 1)))
+        response = self.app.get(url + "/versions", headers=headers)
+        self.assertEqual([7, 6, 4, 1], [v['version'] for v in json.loads(response.data)['version']])
+        document_cache.clear()
+        for version in (1, 4, 6, 7):
+            response = self.app.get(url + "/versions/{}".format(version), headers=headers)
+            self.assertEqual(documents[version - 1], json.loads(json.loads(response.data)['data']))
+        json_version.configure(20)
+
+    def test_search(self):
+        headers_0, _ = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        marker = fake.uuid4()
+        first = self._save(headers_0, {"tag": marker, "items": [{"name": "a", "price": 1.0}]})
+        second = self._save(headers_0, {"tag": marker, "items": [{"name": "b", "price": 2}]})
+        other = self._save(headers_1, {"tag": marker})
+
+        def found(headers, query):
+            response = self.app.get("/api/v1.0/json/search?" + query, headers=headers)
+            self.assertEqual(200, response.status_code)
+            return [row['id'] for row in json.loads(response.data)['json']]
+
+        self.assertEqual([second, first], found(headers_0, "value=" + marker))
+        self.assertEqual([other], found(headers_1, "value=" + marker))
+        self.assertEqual([first], found(headers_0, "path=/items/*/name&value=\"a\""))
+        self.assertEqual([first], found(headers_0, "value=" + marker + "&value=1"))
+        self.assertEqual([second], found(headers_0, "path=/items/*/price&value=2.0"))
+        self.assertEqual([second, first], found(headers_0, "key=price&path=/tag"))
+        self.assertEqual([], found(headers_0, "key=price&key=missing"))
+
+        # the index follows updates
+        self.app.patch("/api/v1.0/json/{}".format(first), headers=headers_0,
+                       content_type="application/merge-patch+json", data=json.dumps({"tag": None}))
+        self.assertEqual([second], found(headers_0, "value=" + marker))
+        self.assertEqual([first], found(headers_0, "value=\"a\""))
+
+        # documents shared with a team are found by its members
+        response = self.app.post("/api/v1.0/team", headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"name": fake.company()}))
+        team_id = json.loads(response.data)['team']['id']
+        self.app.post("/api/v1.0/team/{}/access".format(team_id), headers=headers_0,
+                      content_type="application/json", data=json.dumps({"user": uid_1}))
+        self.app.post("/api/v1.0/json/{}/team/{}".format(second, team_id), headers=headers_0)
+        response = self.app.get("/api/v1.0/json/search?limit=1&value=" + marker, headers=headers_1)
+        data = json.loads(response.data)
+        self.assertEqual([(other, JsonAccessMapType.OWNER.value)],
+                         [(row['id'], row['permission']) for row in data['json']])
+        response = self.app.get("/api/v1.0/json/search?value={}&cursor={}".format(marker, data['pagination']['next']),
+                                headers=headers_1)
+        self.assertEqual([(second, JsonAccessMapType.READ.value)],
+                         [(row['id'], row['permission']) for row in json.loads(response.data)['json']])
+
+        self.assertEqual(422, self.app.get("/api/v1.0/json/search", headers=headers_0).status_code)
+        self.assertEqual(422, self.app.get("/api/v1.0/json/search?value=[1]", headers=headers_0).status_code)
+
+    def test_schema(self):
+        headers_0, _ = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        schema = {"type": "object", "required": ["items"],
+                  "properties": {"items": {"type": "array", "items": {"type": "integer"}}}}
+
+        def save(document, schema):
+            return self.app.post("/api/v1.0/json/save", headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"data": json.dumps(document), "schema": json.dumps(schema)}))
+
+        response = save({"items": [1, "two", 3, None]}, schema)
+        data = json.loads(response.data)
+        self.assertEqual(422, response.status_code)
+        self.assertEqual(["/items/1", "/items/3"], [error['path'] for error in data['errors']])
+        self.assertEqual("/properties/items/items/type", data['errors'][0]['schema_path'])
+        self.assertEqual(422, save({"items": []}, {"type": 5}).status_code)
+
+        # a schema may also be sent as an object, anything but text, an object or a boolean is invalid
+        for sent, status in ((schema, 422), (5, 422), ([schema], 422), (True, 200)):
+            response = self.app.post("/api/v1.0/json/save", headers=headers_0, content_type="application/json",
+                                     data=json.dumps({"data": json.dumps({"items": ["x"]}), "schema": sent}))
+            self.assertEqual(status, response.status_code)
+        self.assertEqual("/items/0", json.loads(save({"items": ["x"]}, schema).data)['errors'][0]['path'])
+        response = self.app.post("/api/v1.0/json/validate", headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"data": json.dumps({"items": ["x"]}), "schema": schema}))
+        self.assertEqual((200, False), (response.status_code, json.loads(response.data)['valid']))
+        response = self.app.post("/api/v1.0/json/validate", headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"data": "{}", "schema": 5}))
+        self.assertEqual(422, response.status_code)
+
+        json_id = json.loads(save({"items": [1, 2]}, schema).data)['id']
+        url = "/api/v1.0/json/{}".format(json_id)
+        response = self.app.get(url + "/schema", headers=headers_0)
+        self.assertEqual(schema, json.loads(json.loads(response.data)['schema']))
+
+        # updates are validated
+        response = self.app.patch(url, headers=headers_0, content_type="application/json-patch+json",
+                                  data=json.dumps([{"op": "add", "path": "/items/-", "value": "x"}]))
+        self.assertEqual(422, response.status_code)
+        self.assertEqual("/items/2", json.loads(response.data)['errors'][0]['path'])
+        response = self.app.patch(url, headers=headers_0, content_type="application/json-patch+json",
+                                  data=json.dumps([{"op": "add", "path": "/items/-", "value": 3}]))
+        self.assertEqual(200, response.status_code)
+
+        # standalone validation, against a schema or the schemas of a json
+        response = self.app.post("/api/v1.0/json/validate?limit=1", headers=headers_0,
+                                 content_type="application/json",
+                                 data=json.dumps({"data": json.dumps({"items": ["a", "b"]}), "json": json_id}))
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((False, ["/items/0"]), (data['valid'], [error['path'] for error in data['errors']]))
+        response = self.app.post("/api/v1.0/json/validate?raw=true&json={}".format(json_id), headers=headers_0,
+                                 content_type="application/json", data=json.dumps({"items": [1]}))
+        self.assertEqual({"valid": True, "errors": []},
+                         {k: v for k, v in json.loads(response.data).items() if k in ('valid', 'errors')})
+        response = self.app.post("/api/v1.0/json/validate", headers=headers_1, content_type="application/json",
+                                 data=json.dumps({"data": "{}", "json": json_id}))
+        self.assertEqual(404, response.status_code)
+
+        # a team schema applies to the jsons shared with the team
+        response = self.app.put(url + "/schema", headers=headers_0, data=json.dumps({"type": "object"}))
+        self.assertEqual(200, response.status_code)
+        response = self.app.post("/api/v1.0/team", headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"name": fake.company()}))
+        team_id = json.loads(response.data)['team']['id']
+        response = self.app.put("/api/v1.0/team/{}/schema".format(team_id), headers=headers_0,
+                                data=json.dumps({"properties": {"items": {"maxItems": 2}}}))
+        self.assertEqual(200, response.status_code)
+        response = self.app.post("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_0)
+        self.assertEqual(422, response.status_code)
+        self.app.delete(url + "/schema", headers=headers_0)
+        self.app.patch(url, headers=headers_0, content_type="application/merge-patch+json",
+                       data=json.dumps({"items": [1]}))
+        response = self.app.post("/api/v1.0/json/{}/team/{}".format(json_id, team_id), headers=headers_0)
+        self.assertEqual(200, response.status_code)
+        response = self.app.patch(url, headers=headers_0, content_type="application/merge-patch+json",
+                                  data=json.dumps({"items": [1, 2, 3]}))
+        self.assertEqual(422, response.status_code)
+        self.assertEqual(404, self.app.get(url + "/schema", headers=headers_0).status_code)
+
+    def test_bulk_save(self):
+        headers, uid = self._headers(self.users[0])
+        marker = fake.uuid4()
+        documents = [{"tag": marker, "n": i} for i in range(30)] + [{"tag": marker, "n": 0}]
+
+        response = self.app.post("/api/v1.0/json/bulk", headers=headers, content_type="application/json",
+                                 data=json.dumps(documents))
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((31, 0), (data['saved'], data['failed']))
+        ids = [result['id'] for result in data['json']]
+        self.assertEqual(list(range(31)), [result['index'] for result in data['json']])
+
+        for json_id, document in zip(ids, documents):
+            response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers)
+            self.assertEqual(JsonAccessMapType.OWNER.value, json.loads(response.data)['permission'])
+            self.assertEqual(document, json.loads(json.loads(response.data)['data']))
+        # identical documents share a body referenced by both jsons and their first versions
+        body = db.session.query(Json.body).filter(Json.id == ids[0]).scalar()
+        self.assertEqual(body, db.session.query(Json.body).filter(Json.id == ids[-1]).scalar())
+        self.assertEqual(4, JsonBody.query.get(body).ref_count)
+        response = self.app.get("/api/v1.0/json/{}/versions".format(ids[0]), headers=headers)
+        self.assertEqual([1], [v['version'] for v in json.loads(response.data)['version']])
+        response = self.app.get("/api/v1.0/user/{}".format(uid), headers=headers)
+        self.assertEqual(31, json.loads(response.data)['json_count'])
+        response = self.app.get("/api/v1.0/json/search?limit=100&value=" + marker, headers=headers)
+        self.assertEqual(sorted(ids, reverse=True), [row['id'] for row in json.loads(response.data)['json']])
+
+        # NDJSON reports invalid lines and saves the others
+        lines = '{"a": 1}\n\nnot json\n{"a": 2}\n'
+        response = self.app.post("/api/v1.0/json/bulk", headers=headers, content_type="application/x-ndjson",
+                                 data=lines)
+        data = json.loads(response.data)
+        self.assertEqual((2, 1), (data['saved'], data['failed']))
+        self.assertEqual([0, 1, 2], [result['index'] for result in data['json']])
+        self.assertIn('error', data['json'][1])
+        response = self.app.get("/api/v1.0/json/{}".format(data['json'][2]['id']), headers=headers)
+        self.assertEqual({"a": 2}, json.loads(json.loads(response.data)['data']))
+
+        response = self.app.post("/api/v1.0/json/bulk", headers=headers, content_type="application/json",
+                                 data=json.dumps({"a": 1}))
+        self.assertEqual(422, response.status_code)
+
+        # a body released by a concurrent request once looked up is stored again
+        document = {"released": marker}
+        digest = hashlib.sha256(json_backend.canonical(document)).hexdigest()
+        with mock.patch('api.models.json_body._stored_hashes', side_effect=[{digest}, set()]):
+            response = self.app.post("/api/v1.0/json/bulk", headers=headers, content_type="application/json",
+                                     data=json.dumps([document]))
+        json_id = json.loads(response.data)['json'][0]['id']
+        self.assertEqual(2, JsonBody.query.get(Json.query.get(json_id).body).ref_count)
+        response = self.app.get("/api/v1.0/json/{}".format(json_id), headers=headers)
+        self.assertEqual(document, json.loads(json.loads(response.data)['data']))
+
+    def test_bulk_share(self):
+        headers_0, uid_0 = self._headers(self.users[0])
+        headers_1, uid_1 = self._headers(self.users[1])
+        json_ids = [self._save(headers_0, {"name": fake.first_name()}) for _ in range(3)]
+        json_ids.append(self._save(headers_0, {"title": fake.first_name()}))
+
+        team_ids = []
+        for _ in range(2):
+            response = self.app.post("/api/v1.0/team", headers=headers_0, content_type="application/json",
+                                     data=json.dumps({"name": fake.company()}))
+            team_id = json.loads(response.data)['team']['id']
+            self.app.post("/api/v1.0/team/{}/access".format(team_id), headers=headers_0,
+                          content_type="application/json", data=json.dumps({"user": uid_1}))
+            team_ids.append(team_id)
+        self.app.put("/api/v1.0/team/{}/schema".format(team_ids[1]), headers=headers_0,
+                     data=json.dumps({"required": ["name"]}))
+        self.app.post("/api/v1.0/json/{}/team/{}".format(json_ids[0], team_ids[0]), headers=headers_0)
+        url = "/api/v1.0/json/team/bulk"
+        body = json.dumps({"json": json_ids, "team": team_ids})
+
+        def readable(uid):
+            response = self.app.get("/api/v1.0/user/{}".format(uid), headers=headers_0)
+            self.assertEqual(Json.count_json(uid), json.loads(response.data)['json_count'])
+            return json.loads(response.data)['json_count']
+
+        response = self.app.post(url, headers=headers_0, content_type="application/json", data=body)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(6, len(data['shared']))
+        self.assertEqual([{'json': json_ids[0], 'team': team_ids[0]}], data['unchanged'])
+        # the document without a name is rejected by the second team's schema only
+        self.assertEqual([(json_ids[3], team_ids[1])], [(f['json'], f['team']) for f in data['failed']])
+        self.assertEqual(4, readable(uid_1))
+        response = self.app.get("/api/v1.0/json/{}".format(json_ids[3]), headers=headers_1)
+        self.assertEqual(200, response.status_code)
+
+        # members keep reading the documents still shared with one of their teams
+        response = self.app.delete(url, headers=headers_0, content_type="application/json",
+                                   data=json.dumps({"json": json_ids, "team": team_ids[:1]}))
+        data = json.loads(response.data)
+        self.assertEqual(4, len(data['unshared']))
+        self.assertEqual(3, readable(uid_1))
+        response = self.app.get("/api/v1.0/json/{}".format(json_ids[3]), headers=headers_1)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(4, readable(uid_0))
+
+        # every document has to be owned and every team to exist
+        response = self.app.post(url, headers=headers_1, content_type="application/json", data=body)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(permission, json.loads(response.data)['message'])
+        self.assertEqual(json_ids, json.loads(response.data)['json'])
+        response = self.app.post(url, headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"json": json_ids, "team": [0]}))
+        self.assertEqual(404, response.status_code)
+        response = self.app.post(url, headers=headers_0, content_type="application/json",
+                                 data=json.dumps({"json": json_ids}))
+        self.assertEqual(422, response.status_code)
+
+        # a pair shared concurrently fails the insert, the request is rolled back
+        with mock.patch('api.models.team._insert_rows', side_effect=IntegrityError("INSERT", {}, Exception())):
+            response = self.app.post(url, headers=headers_0, content_type="application/json", data=body)
+        self.assertEqual(409, response.status_code)
+        self.assertEqual(3, readable(uid_1))
+
+    def test_diff_documents(self):
+        headers, uid = self._headers(self.users[0])
+        other_headers, other_uid = self._headers(self.users[1])
+        shared = [{"id": i, "tags": [fake.word() for _ in range(5)]} for i in range(200)]
+        source = {"name": "a", "items": shared, "meta": {"size": 1}}
+        target = {"name": "b", "items": shared[:50] + [{"id": -1}] + shared[50:], "meta": {"size": 1}}
+        source_id = self._save(headers, source)
+        target_id = self._save(headers, target)
+
+        url = "/api/v1.0/json/{}/diff/{}".format(source_id, target_id)
+        response = self.app.get(url, headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{"op": "replace", "path": "/name", "value": "b"},
+                          {"op": "add", "path": "/items/50", "value": {"id": -1}}], data['patch'])
+        self.assertEqual(target, patch.json_patch(source, data['patch']))
+        self.assertEqual(304, self.app.get(url, headers=dict(headers, **{'If-None-Match': response.headers['ETag']}))
+                         .status_code)
+
+        response = self.app.get(url + "?raw=true", headers=headers)
+        self.assertEqual("application/json-patch+json", response.mimetype)
+        self.assertEqual(data['patch'], json.loads(response.data))
+
+        # versions of the same document
+        url = "/api/v1.0/json/{}".format(source_id)
+        self.app.patch(url, headers=headers, content_type="application/merge-patch+json",
+                       data=json.dumps({"meta": {"size": 2}}))
+        response = self.app.get(url + "/diff/{}?from_version=1&to_version=2".format(source_id), headers=headers)
+        self.assertEqual([{"op": "replace", "path": "/meta/size", "value": 2}], json.loads(response.data)['patch'])
+        response = self.app.get(url + "/diff/{}?from_version=9".format(source_id), headers=headers)
+        self.assertEqual(404, response.status_code)
+
+        # scalar documents are replaced as a whole
+        scalar_id = self._save(headers, 42)
+        response = self.app.get("/api/v1.0/json/{}/diff/{}".format(source_id, scalar_id), headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{"op": "replace", "path": "", "value": 42}], json.loads(response.data)['patch'])
+        response = self.app.get("/api/v1.0/json/{}/diff/{}".format(scalar_id, scalar_id), headers=headers)
+        self.assertEqual([], json.loads(response.data)['patch'])
+        self.assertEqual([{"op": "replace", "path": "", "value": "x"}], diff(42, "x"))
+
+        # both documents have to be readable
+        other_id = self._save(other_headers, source)
+        response = self.app.get(url + "/diff/{}".format(other_id), headers=headers)
+        self.assertEqual(404, response.status_code)
+        response = self.app.get("/api/v1.0/json/{}/diff/{}".format(other_id, source_id), headers=headers)
+        self.assertEqual(404, response.status_code)
@@ -1,8 +1,11 @@
 import json
+from unittest import mock
+from sqlalchemy.exc import IntegrityError
 from api.models.user import User
 from api.routes.tests.utils.db_operation import create_users, delete_users, delete_team_members, delete_teams
 from api.utils.constants import permission, notFound
 from api.utils.database import db
+from api.utils.enums import TeamMemberType
 from api.utils.test_base import BaseTestCase
 from faker import Faker
 
@@ -210,6 +213,14 @@ class TestTeam(BaseTestCase):
         self.assertIn('message', data)
         self.assertEqual(team_data['name'], data['name'])
 
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.app.get(
+            "/api/v1.0/team/{}".format(data['id']),
+            headers=headers,
+            content_type="application/json"
+        )
+        self.assertEqual(304, response.status_code)
+
     def test_get_team_not_found(self):
         login = {
             "login": self.users[0]["login"],
@@ -975,3 +986,144 @@ class TestTeam(BaseTestCase):
         )
 
         self.assertEqual(404, response.status_code)
+
+    """
+    List Teams and Members
+    """
+    def test_list_teams_and_members(self):
+        headers = []
+        for user in self.users:
+            login = {
+                "login": user["login"],
+                "password": user["password"]
+            }
+            response = self.app.post(
+                "/api/v1.0/login",
+                data=json.dumps(login),
+                content_type="application/json",
+            )
+            headers.append({'Authorization': json.loads(response.data)['token']})
+        uid_1 = db.session.query(User.id).filter(User.login == self.users[1]['login']).scalar()
+
+        team_ids = []
+        for headers_owner in (headers[0], headers[0], headers[1]):
+            response = self.app.post(
+                "/api/v1.0/team",
+                headers=headers_owner,
+                content_type="application/json",
+                data=json.dumps({"name": fake.company()})
+            )
+            team_ids.append(json.loads(response.data)['team']['id'])
+        self.teams.extend(team_ids)
+
+        for team_id in team_ids[:2]:
+            self.app.post(
+                "/api/v1.0/team/{}/access".format(team_id),
+                headers=headers[0],
+                content_type="application/json",
+                data=json.dumps({"user": uid_1})
+            )
+
+        response = self.app.get("/api/v1.0/team?limit=2", headers=headers[1])
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(team_ids[:2], [team['id'] for team in data['team']])
+
+        response = self.app.get("/api/v1.0/team?limit=2&cursor={}".format(data['pagination']['next']),
+                                headers=headers[1])
+        data = json.loads(response.data)
+        self.assertEqual(team_ids[2:], [team['id'] for team in data['team']])
+        self.assertIsNone(data['pagination']['next'])
+
+        response = self.app.get("/api/v1.0/team?type=owner", headers=headers[1])
+        data = json.loads(response.data)
+        self.assertEqual(team_ids[2:], [team['id'] for team in data['team']])
+
+        response = self.app.get("/api/v1.0/team/{}/access".format(team_ids[0]), headers=headers[1])
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.users[0]['login'], self.users[1]['login']],
+                         [user['login'] for user in data['user']])
+        self.assertEqual(['OWNER', 'MEMBER'], [TeamMemberType.get_name(user['type']) for user in data['user']])
+
+        response = self.app.get("/api/v1.0/team/{}/access?type=member".format(team_ids[0]), headers=headers[1])
+        data = json.loads(response.data)
+        self.assertEqual([uid_1], [user['id'] for user in data['user']])
+
+        response = self.app.get("/api/v1.0/team/{}/access?type=invalid".format(team_ids[0]), headers=headers[1])
+        self.assertEqual(422, response.status_code)
+
+        response = self.app.get("/api/v1.0/team/{}/access".format(team_ids[2]), headers=headers[0])
+        data = json.loads(response.data)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(permission, data['message'])
+
+    def test_bulk_team_members(self):
+        self.users.extend(create_users(3))
+        headers = []
+        for user in self.users[:2]:
+            login = {
+                "login": user["login"],
+                "password": user["password"]
+            }
+            response = self.app.post(
+                "/api/v1.0/login",
+                data=json.dumps(login),
+                content_type="application/json",
+            )
+            headers.append({'Authorization': json.loads(response.data)['token']})
+        uids = [db.session.query(User.id).filter(User.login == user['login']).scalar() for user in self.users]
+
+        response = self.app.post(
+            "/api/v1.0/team",
+            headers=headers[0],
+            content_type="application/json",
+            data=json.dumps({"name": fake.company()})
+        )
+        team_id = json.loads(response.data)['team']['id']
+        self.teams.append(team_id)
+        url = "/api/v1.0/team/{}/access/bulk".format(team_id)
+
+        self.app.post(
+            "/api/v1.0/team/{}/access".format(team_id),
+            headers=headers[0],
+            content_type="application/json",
+            data=json.dumps({"user": uids[1]})
+        )
+        response = self.app.post(url, headers=headers[0], content_type="application/json",
+                                 data=json.dumps({"add": uids[1:] + [0]}))
+        data = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(uids[2:], data['added'])
+        self.assertEqual([uids[1]], data['unchanged'])
+        self.assertEqual([0], data['not_found'])
+        self.assertEqual([1] * 5, [db.session.query(User.team_count).filter(User.id == uid).scalar()
+                                   for uid in uids])
+
+        # members lose access once removed
+        response = self.app.get("/api/v1.0/team/{}".format(team_id), headers=headers[1])
+        self.assertEqual(200, response.status_code)
+        response = self.app.post(url, headers=headers[0], content_type="application/json",
+                                 data=json.dumps({"remove": uids[1:3]}))
+        data = json.loads(response.data)
+        self.assertEqual(uids[1:3], data['removed'])
+        response = self.app.get("/api/v1.0/team/{}".format(team_id), headers=headers[1])
+        self.assertEqual(404, response.status_code)
+        self.assertEqual([1, 0, 0, 1, 1], [db.session.query(User.team_count).filter(User.id == uid).scalar()
+                                           for uid in uids])
+
+        # only owners manage members
+        response = self.app.post(url, headers=headers[1], content_type="application/json",
+                                 data=json.dumps({"add": [uids[1]]}))
+        self.assertEqual(404, response.status_code)
+        for body in ({}, {"add": "1"}, {"add": [uids[1]], "remove": [uids[1]]}):
+            response = self.app.post(url, headers=headers[0], content_type="application/json", data=json.dumps(body))
+            self.assertEqual(422, response.status_code)
+
+        # a member added concurrently fails the insert, the request is rolled back
+        conflict = IntegrityError("INSERT", {}, Exception("duplicate"))
+        with mock.patch('api.models.team._insert_rows', side_effect=conflict):
+            response = self.app.post(url, headers=headers[0], content_type="application/json",
+                                     data=json.dumps({"add": [uids[1]]}))
+        self.assertEqual(409, response.status_code)
+        self.assertEqual(0, db.session.query(User.team_count).filter(User.id == uids[1]).scalar())
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from api.models.user import User
+from api.utils.database import db
+from api.utils.responses import response_with
+from api.utils import responses as resp
+from api.utils.test_base import BaseTestCase
+from api.utils.transaction import after_commit, unit_of_work
+from faker import Faker
+
+fake = Faker()
+
+
+class TestTransaction(BaseTestCase):
+    committed = None
+
+    def setUp(self):
+        super(TestTransaction, self).setUp()
+        self.committed = []
+
+        def stage(outcome, savepoint=False):
+            # stages two users, then succeeds, fails or raises
+            def view():
+                logins = [fake.user_name() + str(i) for i in range(2)]
+                for login in logins:
+                    User(name="n", surname="s", email=login + "@jsonx", login=login, password="p").create()
+                    after_commit(lambda login=login: self.committed.append(login))
+                if savepoint:
+                    # released savepoints leave the callbacks to the outer transaction
+                    with db.session.begin_nested():
+                        User(name="n", surname="s", email="savepoint@jsonx", login=fake.user_name(),
+                             password="p").create()
+                    self.assertEqual([], self.committed)
+                if outcome == 'raise':
+                    raise RuntimeError(outcome)
+                response = resp.SUCCESS_200 if outcome == 'success' else resp.INVALID_INPUT_422
+                return response_with(response, value={'logins': logins})
+            return view
+
+        application = self.app.application
+        for outcome in ('success', 'error', 'raise'):
+            application.add_url_rule('/test/transaction/' + outcome, 'transaction_' + outcome, stage(outcome),
+                                     methods=['POST'])
+            application.add_url_rule('/test/transaction/savepoint/' + outcome, 'transaction_savepoint_' + outcome,
+                                     stage(outcome, savepoint=True), methods=['POST'])
+
+    def _users(self):
+        return db.session.query(User.login).filter(User.login.in_(self.committed)).count()
+
+    def test_request_commits_once(self):
+        response = self.app.post('/test/transaction/success')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.committed))
+        self.assertEqual(2, self._users())
+
+    def test_failed_request_rolls_back(self):
+        response = self.app.post('/test/transaction/error')
+        self.assertEqual(422, response.status_code)
+        # testing propagates the exception, teardown still rolls back
+        with self.assertRaises(RuntimeError):
+            self.app.post('/test/transaction/raise')
+        self.assertEqual([], self.committed)
+        self.assertEqual(0, db.session.query(User.id).filter(User.email.like('%@jsonx')).count())
+
+    def test_savepoint_keeps_callbacks(self):
+        response = self.app.post('/test/transaction/savepoint/error')
+        self.assertEqual(422, response.status_code)
+        self.assertEqual([], self.committed)
+        self.assertEqual(0, db.session.query(User.id).filter(User.email.like('%@jsonx')).count())
+
+        response = self.app.post('/test/transaction/savepoint/success')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.committed))
+        self.assertEqual(3, db.session.query(User.id).filter(User.email.like('%@jsonx')).count())
+
+    def test_unit_of_work(self):
+        login = fake.user_name()
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                User(name="n", surname="s", email="e", login=login, password="p").create()
+                after_commit(lambda: self.committed.append(login))
+                raise RuntimeError("rolled back")
+        self.assertEqual([], self.committed)
+        self.assertIsNone(User.query.filter_by(login=login).first())
+
+        with unit_of_work():
+            User(name="n", surname="s", email="e", login=login, password="p").create()
+            after_commit(lambda: self.committed.append(login))
+        self.assertEqual([login], self.committed)
+        self.assertIsNotNone(User.query.filter_by(login=login).first())
@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 
 from api.models.json import Json, JsonSchema
+from api.models.json_body import JsonBody
+from api.models.json_term import JsonTerm
+from api.models.json_version import JsonVersion
 from api.models.team import Team
 from api.models.team_member_map import TeamMemberMap
 from api.models.user import User
 from api.utils.database import db
+from api.utils.transaction import unit_of_work
 from faker import Faker
 
 fake = Faker()
@@ -23,12 +27,13 @@ def create_users(num=1):
         "login": fake.user_name(),
         "password": fake.bban()
     } for _ in range(0, num)]
-    for user in users:
-        User(name=user["name"],
-             surname=user["surname"],
-             email=user["email"],
-             login=user["login"],
-             password=user["password"]).create()
+    with unit_of_work():
+        for user in users:
+            User(name=user["name"],
+                 surname=user["surname"],
+                 email=user["email"],
+                 login=user["login"],
+                 password=user["password"]).create()
     return users
 
 
@@ -39,17 +44,18 @@ def delete_users(users):
 
 def create_json():
     _json = [{
-        'data': fake.first_name()
+        'data': '{{"name":"{}"}}'.format(fake.first_name())
     }]
     for j in _json:
-        Json(data=j['data']).create()
-        j.update(get_json_id(j['data']))
+        with unit_of_work():
+            created = Json(data=j['data']).create()
+        j.update(get_json_id(created.id))
     return _json
 
 
-def get_json_id(data):
+def get_json_id(json_id):
     json_schema = JsonSchema()
-    _json = Json.query.filter_by(data=data).first()
+    _json = Json.query.filter_by(id=json_id).first()
     json_data, error = json_schema.dump(_json)
     val = {
         'id': json_data['id'],
@@ -61,7 +67,14 @@ def get_json_id(data):
 
 
 def delete_json(_json):
-    db.session.query(Json).filter(Json.id.in_([j['id'] for j in _json])).delete(synchronize_session=False)
+    ids = [j['id'] for j in _json]
+    bodies = db.session.query(Json.body).filter(Json.id.in_(ids)).all()
+    bodies += db.session.query(JsonVersion.body).filter(JsonVersion.json.in_(ids), JsonVersion.body.isnot(None)).all()
+    db.session.query(JsonVersion).filter(JsonVersion.json.in_(ids)).delete(synchronize_session=False)
+    db.session.query(JsonTerm).filter(JsonTerm.json.in_(ids)).delete(synchronize_session=False)
+    db.session.query(Json).filter(Json.id.in_(ids)).delete(synchronize_session=False)
+    for b in bodies:
+        JsonBody.release(b.body)
     db.session.commit()
 
 
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from functools import wraps
+from sqlalchemy import and_, exists, select
+from api.models.json import Json
+from api.models.json_access_map import JsonAccessMap
+from api.models.team import Team
+from api.models.team_json_map import TeamJsonMap
+from api.models.team_member_map import TeamMemberMap
+from api.models.user import User
+from api.utils.auth import JWT
+from api.utils.cache import MISSING, cache_key, json_access_cache, team_access_cache
+from api.utils.constants import notFound, permission
+from api.utils.database import db
+from api.utils.enums import JsonAccessMapType
+from api.utils.responses import response_with
+from api.utils import responses as resp
+
+ANY_ROLE = object()
+
+
+class Access(object):
+    """Existence of the requested resources and the caller's role on them"""
+
+    def __init__(self, json=None, team=None, user=None, **resolved):
+        self.json = json
+        self.team = team
+        self.user = user
+        self.json_exists = resolved.get('json_exists') is not None or resolved.get('json_type') is not None
+        self.team_exists = resolved.get('team_exists') is not None or resolved.get('team_type') is not None
+        self.user_exists = resolved.get('user_exists') is not None
+        self.json_type = resolved.get('json_type')
+        self.team_type = resolved.get('team_type')
+        self.member = resolved.get('member')
+        self.team_json = resolved.get('team_json')
+
+        # a document shared with one of the caller's teams is readable
+        if self.json_type is None and resolved.get('json_team_read'):
+            self.json_type = JsonAccessMapType.READ.value
+
+    def error(self, json_roles=ANY_ROLE, team_roles=ANY_ROLE):
+        """Response for the first failed check, None if the caller is allowed
+        :param json_roles: [int] JsonAccessMapType values allowed on the json, ANY_ROLE or None to skip
+        :param team_roles: [int] TeamMemberType values allowed on the team, ANY_ROLE or None to skip
+        :return: response or None
+        """
+        if self.json is not None and not self.json_exists:
+            return response_with(resp.NOT_FOUND_HANDLER_404, message=notFound.format("JSON"))
+        if self.team is not None and not self.team_exists:
+            return response_with(resp.NOT_FOUND_HANDLER_404, message=notFound.format("Team"))
+        if self.user is not None and not self.user_exists:
+            return response_with(resp.NOT_FOUND_HANDLER_404, message=notFound.format("User"))
+        if self.json is not None and not _allowed(self.json_type, json_roles):
+            return response_with(resp.NOT_FOUND_HANDLER_404, message=permission)
+        if self.team is not None and not _allowed(self.team_type, team_roles):
+            return response_with(resp.NOT_FOUND_HANDLER_404, message=permission)
+        return None
+
+
+def _allowed(role, roles):
+    if roles is None:
+        return True
+    if roles is ANY_ROLE:
+        return role is not None
+    return role in roles
+
+
+def _scalar(column, *criteria):
+    return select([column]).where(and_(*criteria)).limit(1).as_scalar()
+
+
+def resolve_access(uid, json=None, team=None, user=None):
+    """Resolve existence and the caller's role on a json, a team and a team member in one query.
+    Roles found in the permission caches are not queried again, a role implies the resource exists.
+    :param uid: caller id
+    :param json: json id
+    :param team: team id
+    :param user: id of a user whose membership of the team is checked
+    :return: Access
+    """
+    cached = {}
+    json_key = cache_key(uid, json) if json is not None else None
+    team_key = cache_key(uid, team) if team is not None else None
+    if json_key is not None:
+        json_type = json_access_cache.get(json_key)
+        if json_type is not MISSING:
+            cached['json_type'] = json_type
+    if team_key is not None:
+        team_type = team_access_cache.get(team_key)
+        if team_type is not MISSING:
+            cached['team_type'] = team_type
+
+    columns = []
+    if json is not None and 'json_type' not in cached:
+        columns.append(_scalar(Json.id, Json.id == json).label('json_exists'))
+        columns.append(_scalar(JsonAccessMap.type,
+                               JsonAccessMap.json == json, JsonAccessMap.user == uid).label('json_type'))
+        columns.append(exists().where(and_(TeamJsonMap.json == json,
+                                           TeamMemberMap.team == TeamJsonMap.team,
+                                           TeamMemberMap.user == uid)).label('json_team_read'))
+    if team is not None and 'team_type' not in cached:
+        columns.append(_scalar(Team.id, Team.id == team).label('team_exists'))
+        columns.append(_scalar(TeamMemberMap.type,
+                               TeamMemberMap.team == team, TeamMemberMap.user == uid).label('team_type'))
+    if user is not None:
+        columns.append(_scalar(User.id, User.id == user).label('user_exists'))
+    if user is not None and team is not None:
+        columns.append(_scalar(TeamMemberMap.id,
+                               TeamMemberMap.team == team, TeamMemberMap.user == user).label('member'))
+    if json is not None and team is not None:
+        columns.append(_scalar(TeamJsonMap.id,
+                               TeamJsonMap.team == team, TeamJsonMap.json == json).label('team_json'))
+
+    resolved = dict(cached)
+    if columns:
+        row = db.session.query(*columns).one()
+        resolved.update(zip(row.keys(), row))
+    access = Access(json=json, team=team, user=user, **resolved)
+
+    # cache hits are not re-set so that ttl still bounds their age
+    if json_key is not None and 'json_type' not in cached and access.json_type is not None:
+        json_access_cache.set(json_key, access.json_type)
+    if team_key is not None and 'team_type' not in cached and access.team_type is not None:
+        team_access_cache.set(team_key, access.team_type)
+    return access
+
+
+def authorize(json=None, team=None, user=None, json_roles=ANY_ROLE, team_roles=ANY_ROLE):
+    """Check the caller's access to the resources named by the route arguments
+    and pass the resolved Access to the view as ``access``
+    :param json: name of the route argument holding the json id
+    :param team: name of the route argument holding the team id
+    :param user: name of the route argument holding a team member id
+    :param json_roles: see Access.error
+    :param team_roles: see Access.error
+    :return:
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            access = resolve_access(JWT.details['user_id'],
+                                    json=kwargs.get(json) if json else None,
+                                    team=kwargs.get(team) if team else None,
+                                    user=kwargs.get(user) if user else None)
+            error = access.error(json_roles=json_roles, team_roles=team_roles)
+            if error is not None:
+                return error
+            return func(*args, access=access, **kwargs)
+        return wrapper
+    return decorator
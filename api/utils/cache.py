@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache(object):
+    """Thread-safe in-process LRU cache whose entries expire after ttl seconds.
+
+    Every worker process holds its own copy, writes invalidate the local copy
+    only, so ttl bounds how long another worker can serve a revoked entry.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize, ttl):
+        """Resize the cache and drop its entries and counters
+        :param maxsize: int, maximum number of entries
+        :param ttl: int, seconds an entry is served for, None to never expire
+        :return:
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key):
+        """
+        :param key:
+        :return: cached value or MISSING
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key matches the predicate
+        :param predicate: callable taking a key
+        :return:
+        """
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class SizedLRUCache(object):
+    """Thread-safe in-process LRU cache bounded by the total size of its values in bytes.
+
+    Entries do not expire, keys are expected to change with the value they
+    stand for. Values larger than the whole cache are not stored.
+    """
+
+    def __init__(self, maxbytes=268435456):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxbytes):
+        """Resize the cache and drop its entries and counters
+        :param maxbytes: int, maximum total size of the values
+        :return:
+        """
+        with self._lock:
+            self.maxbytes = maxbytes
+            self._data.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key:
+        :return: cached value or MISSING
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size):
+        """
+        :param key:
+        :param value:
+        :param size: int, bytes the value takes, see deep_size
+        :return:
+        """
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.maxbytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key matches the predicate
+        :param predicate: callable taking a key
+        :return:
+        """
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self.bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'bytes': self.bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def deep_size(value):
+    """Approximate memory taken by a parsed JSON document, objects shared between containers are counted each time
+    :param value: dict, list, str, int, float, bool or None
+    :return: int, bytes
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return size
+
+
+def cache_key(*ids):
+    """Normalize ids coming from urls, bodies and models to one key
+    :param ids:
+    :return: tuple of int or None when an id is not numeric
+    """
+    try:
+        return tuple(int(i) for i in ids)
+    except (TypeError, ValueError):
+        return None
+
+
+# (user id, json id) -> effective JsonAccessMapType value
+json_access_cache = LRUCache()
+
+# (user id, team id) -> TeamMemberType value
+team_access_cache = LRUCache()
+
+# JMESPath expression -> compiled expression
+query_expression_cache = LRUCache(maxsize=1000, ttl=None)
+
+# schema hash -> api.utils.validation.Validator
+schema_validator_cache = LRUCache(maxsize=1000, ttl=None)
+
+# (json id, updated, hash) -> parsed document, shared, never modified in place
+document_cache = SizedLRUCache()
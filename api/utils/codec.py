@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Codecs for stored documents.
+
+Every json_body row records the codec its data was written with, so the
+default can change without rewriting existing rows. Register other codecs
+with ``register_codec`` before create_app.
+"""
+import lzma
+import zlib
+
+CODECS = {}
+
+# HTTP Content-Encoding the stored bytes of a codec can be sent with as they are
+CONTENT_ENCODINGS = {}
+
+# codec -> factory of an object whose decompress(bytes) decodes a stream chunk by chunk
+DECOMPRESSORS = {}
+
+_default = {'codec': 'zlib', 'level': 6}
+
+
+def register_codec(name, compress, decompress, decompressor=None, content_encoding=None):
+    """
+    :param name: str, recorded on each row, at most 16 characters
+    :param compress: callable(bytes, level) -> bytes
+    :param decompress: callable(bytes) -> bytes
+    :param decompressor: callable() -> object with decompress(bytes) -> bytes, for streaming
+    :param content_encoding: str, HTTP Content-Encoding the compressed bytes are valid for
+    :return:
+    """
+    CODECS[name] = (compress, decompress)
+    if decompressor is not None:
+        DECOMPRESSORS[name] = decompressor
+    if content_encoding is not None:
+        CONTENT_ENCODINGS[name] = content_encoding
+
+
+def configure(codec, level):
+    """Codec and compression level used for new documents
+    :param codec: str, a registered codec name
+    :param level: int
+    :return:
+    """
+    if codec not in CODECS:
+        raise ValueError("unknown codec {}".format(codec))
+    _default['codec'] = codec
+    _default['level'] = level
+
+
+def default_codec():
+    return _default['codec']
+
+
+def encode(data, codec=None):
+    """
+    :param data: bytes
+    :param codec: str, default codec when None
+    :return: (codec, bytes)
+    """
+    codec = codec or _default['codec']
+    return codec, CODECS[codec][0](data, _default['level'])
+
+
+def decode(data, codec):
+    """
+    :param data: bytes
+    :param codec: str
+    :return: bytes
+    """
+    return CODECS[codec][1](data)
+
+
+def iter_decode(data, codec, chunk_size=65536):
+    """Decode stored data chunk by chunk
+    :param data: bytes
+    :param codec: str
+    :param chunk_size: int, bytes of stored data decoded at a time
+    :return: generator of bytes
+    """
+    if codec == 'identity':
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+        return
+    if codec not in DECOMPRESSORS:
+        yield decode(data, codec)
+        return
+    decompressor = DECOMPRESSORS[codec]()
+    for start in range(0, len(data), chunk_size):
+        chunk = decompressor.decompress(data[start:start + chunk_size])
+        if chunk:
+            yield chunk
+    tail = decompressor.flush() if hasattr(decompressor, 'flush') else b''
+    if tail:
+        yield tail
+
+
+def content_encoding(codec):
+    """
+    :param codec: str
+    :return: str, HTTP Content-Encoding stored data of the codec can be sent with, None if it has to be decoded
+    """
+    return CONTENT_ENCODINGS.get(codec)
+
+
+register_codec('identity', lambda data, level: data, lambda data: data)
+# zlib output is the zlib format HTTP calls deflate
+register_codec('zlib', zlib.compress, zlib.decompress, zlib.decompressobj, content_encoding='deflate')
+register_codec('lzma', lambda data, level: lzma.compress(data, preset=level), lzma.decompress,
+               lzma.LZMADecompressor)
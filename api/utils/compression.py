@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Negotiated compression of responses, applied by create_app's after_request hook.
+
+Brotli is used when the ``brotli`` package is installed and the client
+accepts it, gzip otherwise. Bodies under ``COMPRESSION_MIN_SIZE`` are sent
+as they are, bodies from ``COMPRESSION_STREAM_SIZE`` on and streamed
+responses are compressed chunk by chunk while they are sent.
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# supported encodings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+_settings = {
+    'min_size': 1024,
+    'stream_size': 1048576,
+    'level': 6,
+    'brotli_quality': 5,
+    'mimetypes': frozenset(['application/json'])
+}
+
+
+def configure(min_size, stream_size, level, brotli_quality, mimetypes):
+    """
+    :param min_size: int, smallest body compressed, in bytes
+    :param stream_size: int, smallest body compressed as a stream, in bytes
+    :param level: int, gzip level, 1 to 9
+    :param brotli_quality: int, brotli quality, 0 to 11
+    :param mimetypes: [str] compressed mimetypes
+    :return:
+    """
+    _settings.update({
+        'min_size': min_size,
+        'stream_size': stream_size,
+        'level': level,
+        'brotli_quality': brotli_quality,
+        'mimetypes': frozenset(mimetypes)
+    })
+
+
+def available_encodings():
+    """
+    :return: [str] encodings this process can produce, in order of preference
+    """
+    return [e for e in ENCODINGS if e != 'br' or brotli is not None]
+
+
+def encoded_etag(etag, encoding):
+    """Entity tag of the representation of etag compressed with encoding
+    :param etag: str, unquoted
+    :param encoding: str
+    :return: str
+    """
+    return '{}-{}'.format(etag, encoding)
+
+
+def negotiate():
+    """
+    :return: str, preferred encoding the client accepts, None if it accepts none
+    """
+    accepted = [(request.accept_encodings[e], -i, e) for i, e in enumerate(available_encodings())]
+    accepted = [a for a in accepted if a[0] > 0]
+    return max(accepted)[2] if accepted else None
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=_settings['brotli_quality'])
+        return compressor.process, compressor.finish
+    # wbits 16 + MAX_WBITS writes the gzip container
+    compressor = zlib.compressobj(_settings['level'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def compress(data, encoding):
+    """
+    :param data: bytes
+    :param encoding: str, one of available_encodings()
+    :return: bytes
+    """
+    process, finish = _compressor(encoding)
+    return process(data) + finish()
+
+
+def iter_compress(chunks, encoding):
+    """
+    :param chunks: iterable of bytes
+    :param encoding: str, one of available_encodings()
+    :return: generator of bytes
+    """
+    process, finish = _compressor(encoding)
+    for chunk in chunks:
+        out = process(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def _add_vary(response):
+    vary = response.headers.get('Vary')
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = vary + ', Accept-Encoding'
+
+
+def compress_response(response):
+    """Compress a response with the encoding negotiated with the client,
+    responses already encoded, not successful, of other mimetypes or too small are returned as they are
+    :param response:
+    :return: response
+    """
+    if response.status_code < 200 or response.status_code in (204, 206) or response.status_code >= 300:
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in _settings['mimetypes']:
+        return response
+
+    size = response.content_length
+    if not response.is_streamed and size is None:
+        size = len(response.get_data())
+    if size is not None and size < _settings['min_size']:
+        return response
+
+    _add_vary(response)
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed or size >= _settings['stream_size']:
+        response.response = iter_compress(response.iter_encoded(), encoding)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(encoded_etag(etag, encoding), weak)
+    return response
@@ -5,6 +5,20 @@ class Config(object):
     DEBUG = False
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PERMISSION_CACHE_SIZE = 10000
+    PERMISSION_CACHE_TTL = 60
+    QUERY_CACHE_SIZE = 1000
+    SCHEMA_CACHE_SIZE = 1000
+    DOCUMENT_CACHE_BYTES = 268435456
+    JSON_STORAGE_CODEC = 'zlib'
+    JSON_STORAGE_LEVEL = 6
+    JSON_BACKEND = None
+    JSON_VERSION_SNAPSHOT_INTERVAL = 20
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_STREAM_SIZE = 1048576
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 5
+    COMPRESSION_MIMETYPES = ('application/json', 'text/plain', 'text/html')
 
 
 class ProductionConfig(Config):
@@ -4,3 +4,4 @@ expired = "{} is expired"
 notFound = "{} is not found"
 permission = "You do not have permission"
 exists = "{} is already in use"
+tooMany = "At most {} {} are accepted at once"
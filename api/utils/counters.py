@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Maintenance of the denormalized ``user.json_count`` and ``user.team_count``.
+
+Single-row grants and memberships adjust the counters from mapper events, in
+the same transaction as the map row. Set-based writes (query deletes, bulk
+inserts) bypass mapper events and call the functions below themselves.
+``reconcile`` rebuilds the counters from the map tables.
+"""
+from sqlalchemy import and_, event, exists, func, not_, select
+from api.models.json_access_map import JsonAccessMap
+from api.models.team_json_map import TeamJsonMap
+from api.models.team_member_map import TeamMemberMap
+from api.models.user import User
+
+user = User.__table__
+json_access_map = JsonAccessMap.__table__
+team_json_map = TeamJsonMap.__table__
+team_member_map = TeamMemberMap.__table__
+
+
+def _direct(user_id, json_id):
+    direct = json_access_map.alias()
+    return exists([direct.c.id])\
+        .where(and_(direct.c.user == user_id, direct.c.json == json_id)).correlate_except(direct)
+
+
+def _through_team(user_id, json_id, excluded_team=None):
+    shared = team_json_map.alias()
+    member = team_member_map.alias()
+    criteria = [shared.c.json == json_id, member.c.team == shared.c.team, member.c.user == user_id]
+    if excluded_team is not None:
+        criteria.append(shared.c.team != excluded_team)
+    return exists([shared.c.id]).where(and_(*criteria)).correlate_except(shared, member)
+
+
+def _only_through(user_id, json_id, team):
+    """The user reaches the json through the team and no other path"""
+    return and_(not_(_direct(user_id, json_id)), not_(_through_team(user_id, json_id, excluded_team=team)))
+
+
+def _counter_update():
+    # counters are not profile changes, keep User.updated from firing its onupdate
+    return user.update().values(updated=user.c.updated)
+
+
+def _members(team):
+    return select([team_member_map.c.user]).where(team_member_map.c.team == team)
+
+
+def _team_only_jsons(user_id, team):
+    """Number of jsons shared with the team the user reaches through that team only"""
+    return select([func.count(team_json_map.c.json.distinct())])\
+        .where(and_(team_json_map.c.team == team, _only_through(user_id, team_json_map.c.json, team)))\
+        .as_scalar()
+
+
+def json_shared(connection, team, json, delta):
+    """Adjust the members of a team whose access to a json depends on that team only
+    :param connection:
+    :param team: team id
+    :param json: json id
+    :param delta: 1 when shared, -1 when unshared
+    :return:
+    """
+    connection.execute(_counter_update()
+                       .where(and_(user.c.id.in_(_members(team)), _only_through(user.c.id, json, team)))
+                       .values(json_count=user.c.json_count + delta))
+
+
+def members_changed(connection, users, team, delta):
+    """Adjust users joining or leaving a team
+    :param connection:
+    :param users: [int] user ids or a select of user ids
+    :param team: team id
+    :param delta: 1 when added, -1 when removed
+    :return:
+    """
+    connection.execute(_counter_update()
+                       .where(user.c.id.in_(users))
+                       .values(team_count=user.c.team_count + delta,
+                               json_count=user.c.json_count + delta * _team_only_jsons(user.c.id, team)))
+
+
+def team_deleted(connection, team):
+    """Adjust every member of a team about to be deleted, call before deleting its map rows
+    :param connection:
+    :param team: team id
+    :return:
+    """
+    members_changed(connection, _members(team), team, -1)
+
+
+def direct_access_changed(connection, user_id, json, delta):
+    """Adjust a user granted or revoked direct access to a json
+    :param connection:
+    :param user_id: user id
+    :param json: json id
+    :param delta: 1 when granted, -1 when revoked
+    :return:
+    """
+    connection.execute(_counter_update()
+                       .where(and_(user.c.id == user_id, not_(_through_team(user.c.id, json))))
+                       .values(json_count=user.c.json_count + delta))
+
+
+def jsons_created(connection, user_id, count):
+    """Adjust the owner of new jsons saved with a set-based insert, new jsons are not shared yet
+    :param connection:
+    :param user_id: user id
+    :param count: int, number of jsons
+    :return:
+    """
+    connection.execute(_counter_update().where(user.c.id == user_id).values(json_count=user.c.json_count + count))
+
+
+def teams_shared(connection, teams):
+    """Rebuild the members of teams jsons were shared with or unshared from in a set-based write,
+    a member reaching the same json through several of the teams counts it once
+    :param connection:
+    :param teams: [int] team ids
+    :return:
+    """
+    reconcile(connection, select([team_member_map.c.user]).where(team_member_map.c.team.in_(teams)))
+
+
+def reconcile(connection, users=None):
+    """Rebuild the counters from the map tables
+    :param connection:
+    :param users: [int] user ids or a select of user ids, all users when None
+    :return:
+    """
+    shared = team_json_map.alias()
+    member = team_member_map.alias()
+    direct_count = select([func.count(json_access_map.c.id)])\
+        .where(json_access_map.c.user == user.c.id).as_scalar()
+    team_path_count = select([func.count(shared.c.json.distinct())])\
+        .where(and_(member.c.user == user.c.id,
+                    shared.c.team == member.c.team,
+                    not_(_direct(user.c.id, shared.c.json)))).as_scalar()
+    team_count = select([func.count(team_member_map.c.id)])\
+        .where(team_member_map.c.user == user.c.id).as_scalar()
+
+    statement = _counter_update().values(json_count=direct_count + team_path_count, team_count=team_count)
+    if users is not None:
+        statement = statement.where(user.c.id.in_(users))
+    connection.execute(statement)
+
+
+@event.listens_for(JsonAccessMap, 'after_insert')
+def _json_access_inserted(mapper, connection, target):
+    direct_access_changed(connection, target.user, target.json, 1)
+
+
+@event.listens_for(JsonAccessMap, 'after_delete')
+def _json_access_deleted(mapper, connection, target):
+    direct_access_changed(connection, target.user, target.json, -1)
+
+
+@event.listens_for(TeamJsonMap, 'after_insert')
+def _team_json_inserted(mapper, connection, target):
+    json_shared(connection, target.team, target.json, 1)
+
+
+@event.listens_for(TeamJsonMap, 'after_delete')
+def _team_json_deleted(mapper, connection, target):
+    json_shared(connection, target.team, target.json, -1)
+
+
+@event.listens_for(TeamMemberMap, 'after_insert')
+def _team_member_inserted(mapper, connection, target):
+    members_changed(connection, [target.user], target.team, 1)
+
+
+@event.listens_for(TeamMemberMap, 'after_delete')
+def _team_member_deleted(mapper, connection, target):
+    members_changed(connection, [target.user], target.team, -1)
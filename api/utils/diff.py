@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Structural difference of two parsed documents as a JSON Patch (RFC 6902).
+
+Applying the patch to the first document with api.utils.patch gives a
+document whose canonical form is byte for byte the canonical form of the
+second one, member order included.
+
+Every object and array of both documents is hashed once, bottom up, so
+identical subtrees are recognised by comparing two digests and never
+walked; the comparison costs the size of the documents once plus the
+paths leading to differences.
+"""
+import hashlib
+from api.utils.patch import format_pointer
+
+
+def diff(source, target):
+    """
+    :param source: parsed document
+    :param target: parsed document
+    :return: [dict] JSON Patch operations turning source into target
+    """
+    hashes = {}
+    # a scalar root is compared as a whole value
+    for root in (source, target):
+        if isinstance(root, (dict, list)):
+            subtree_hash(root, hashes)
+    operations = []
+    _Differ(hashes, operations).diff(source, target, [])
+    return operations
+
+
+def subtree_hash(node, hashes):
+    """Digest of a container's canonical form, recorded with every container below it
+    :param node: dict or list
+    :param hashes: dict, id(container) -> digest, filled in
+    :return: bytes, digest of node
+    """
+    digest = hashes.get(id(node))
+    if digest is not None:
+        return digest
+    if isinstance(node, dict):
+        h = hashlib.blake2b(b'o', digest_size=16)
+        for key, value in node.items():
+            h.update(_token(key))
+            h.update(_token(value, hashes))
+    else:
+        h = hashlib.blake2b(b'a', digest_size=16)
+        for value in node:
+            h.update(_token(value, hashes))
+    digest = hashes[id(node)] = h.digest()
+    return digest
+
+
+def _token(value, hashes=None):
+    # containers are a tag and a fixed length digest, scalars a tag and their repr ended by a NUL,
+    # which repr never contains
+    if isinstance(value, (dict, list)):
+        return b'h' + subtree_hash(value, hashes)
+    return (type(value).__name__[0] + repr(value) + '\x00').encode('utf-8')
+
+
+class _Differ(object):
+
+    def __init__(self, hashes, operations):
+        self.hashes = hashes
+        self.operations = operations
+
+    def same(self, a, b):
+        if type(a) is not type(b):
+            return False
+        if isinstance(a, (dict, list)):
+            return a is b or self.hashes[id(a)] == self.hashes[id(b)]
+        return a == b
+
+    def diff(self, source, target, path):
+        if self.same(source, target):
+            return
+        if isinstance(source, dict) and isinstance(target, dict):
+            self.diff_object(source, target, path)
+        elif isinstance(source, list) and isinstance(target, list):
+            self.diff_array(source, target, path)
+        else:
+            self.operations.append({'op': 'replace', 'path': format_pointer(path), 'value': target})
+
+    def diff_object(self, source, target, path):
+        operations = self.operations
+        kept = [key for key in source if key in target]
+        added = [key for key in target if key not in source]
+        # added members are appended, so members have to stay in order and new ones come last
+        if kept != [key for key in target if key in source] or \
+                (added and kept and list(target).index(added[0]) < list(target).index(kept[-1])):
+            operations.append({'op': 'replace', 'path': format_pointer(path), 'value': target})
+            return
+
+        for key in source:
+            if key not in target:
+                operations.append({'op': 'remove', 'path': format_pointer(path + [key])})
+        for key in kept:
+            self.diff(source[key], target[key], path + [key])
+        for key in added:
+            operations.append({'op': 'add', 'path': format_pointer(path + [key]), 'value': target[key]})
+
+    def diff_array(self, source, target, path):
+        operations = self.operations
+        # common head and tail are left alone, the middle is compared index by index
+        start = 0
+        while start < len(source) and start < len(target) and self.same(source[start], target[start]):
+            start += 1
+        end = 0
+        while end < len(source) - start and end < len(target) - start and \
+                self.same(source[len(source) - 1 - end], target[len(target) - 1 - end]):
+            end += 1
+
+        source_middle = len(source) - start - end
+        target_middle = len(target) - start - end
+        for offset in range(min(source_middle, target_middle)):
+            self.diff(source[start + offset], target[start + offset], path + [start + offset])
+        for _ in range(source_middle - target_middle):
+            operations.append({'op': 'remove', 'path': format_pointer(path + [start + target_middle])})
+        for offset in range(source_middle, target_middle):
+            operations.append({'op': 'add', 'path': format_pointer(path + [start + offset]),
+                               'value': target[start + offset]})
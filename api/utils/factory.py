@@ -5,6 +5,10 @@ import logging
 import sys
 from flask import Flask
 from flask_cors import CORS
+from api.models import json_version
+from api.utils import codec, compression, json_backend, transaction
+from api.utils.cache import document_cache, json_access_cache, query_expression_cache, schema_validator_cache, \
+    team_access_cache
 from api.utils.database import db
 from api.utils.exception import AuthRequired, ExpiredSignatureError, DecodeError, BaseJWTError
 from api.utils.responses import response_with
@@ -18,12 +22,24 @@ def create_app(config):
 
     app.config.from_object(config)
 
+    json_access_cache.configure(app.config['PERMISSION_CACHE_SIZE'], app.config['PERMISSION_CACHE_TTL'])
+    team_access_cache.configure(app.config['PERMISSION_CACHE_SIZE'], app.config['PERMISSION_CACHE_TTL'])
+    query_expression_cache.configure(app.config['QUERY_CACHE_SIZE'], None)
+    schema_validator_cache.configure(app.config['SCHEMA_CACHE_SIZE'], None)
+    document_cache.configure(app.config['DOCUMENT_CACHE_BYTES'])
+    codec.configure(app.config['JSON_STORAGE_CODEC'], app.config['JSON_STORAGE_LEVEL'])
+    json_backend.configure(app.config['JSON_BACKEND'])
+    json_version.configure(app.config['JSON_VERSION_SNAPSHOT_INTERVAL'])
+    compression.configure(app.config['COMPRESSION_MIN_SIZE'], app.config['COMPRESSION_STREAM_SIZE'],
+                          app.config['COMPRESSION_LEVEL'], app.config['COMPRESSION_BROTLI_QUALITY'],
+                          app.config['COMPRESSION_MIMETYPES'])
+
     app.register_blueprint(route_path_general, url_prefix='/api')
 
     # START GLOBAL HTTP CONFIGURATIONS
     @app.after_request
     def add_header(response):
-        return response
+        return compression.compress_response(response)
 
     @app.errorhandler(400)
     def bad_request(e):
@@ -63,6 +79,7 @@ def create_app(config):
     # END GLOBAL HTTP CONFIGURATIONS
 
     db.init_app(app)
+    transaction.init_app(app)
     with app.app_context():
         # from api.models import *
         db.create_all()
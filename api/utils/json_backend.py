@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""JSON parsing and serialization of documents.
+
+orjson is used when it is installed, the standard library otherwise; select
+another backend with ``JSON_BACKEND`` or register one with
+``register_backend`` before create_app. The canonical form documents are
+stored and deduplicated in is the backend's compact output, so switching
+backends can only miss deduplication of documents with unusual numbers.
+orjson reads integers outside 64 bits as floats and cannot write them, the
+documents holding long digit runs are left to the standard library so that
+numbers are stored exactly as sent.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = {}
+
+_default = {'backend': 'stdlib'}
+
+
+def register_backend(name, loads, dumps):
+    """
+    :param name: str
+    :param loads: callable(bytes or str) -> document, raising ValueError on invalid JSON
+    :param dumps: callable(document) -> bytes, compact utf-8 keeping key order
+    :return:
+    """
+    BACKENDS[name] = (loads, dumps)
+
+
+def configure(backend=None):
+    """Backend used for documents
+    :param backend: str, a registered backend name, the fastest available when None
+    :return:
+    """
+    backend = backend or ('orjson' if 'orjson' in BACKENDS else 'stdlib')
+    if backend not in BACKENDS:
+        raise ValueError("unknown JSON backend {}".format(backend))
+    _default['backend'] = backend
+
+
+def backend():
+    return _default['backend']
+
+
+def loads(data):
+    """Parse a JSON document
+    :param data: str or bytes
+    :return: parsed document
+    :raises ValueError: if the document is not valid JSON
+    """
+    return BACKENDS[_default['backend']][0](data)
+
+
+def dumps(document):
+    """Compact serialization of a document
+    :param document: parsed document
+    :return: bytes, utf-8
+    """
+    return BACKENDS[_default['backend']][1](document)
+
+
+def canonical(document):
+    """Canonical form of a parsed document, the form documents are stored and hashed in:
+    compact separators, keys in document order, non-ASCII characters unescaped
+    :param document: parsed document
+    :return: bytes, utf-8
+    """
+    return dumps(document)
+
+
+def _stdlib_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def _stdlib_dumps(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+# 19 digits reach past the signed 64-bit range, strings with such runs take the slow path too
+_LONG_DIGITS = re.compile(r'\d{19}')
+_LONG_DIGITS_BYTES = re.compile(rb'\d{19}')
+
+
+def _orjson_loads(data):
+    pattern = _LONG_DIGITS_BYTES if isinstance(data, bytes) else _LONG_DIGITS
+    if pattern.search(data):
+        return _stdlib_loads(data)
+    return orjson.loads(data)
+
+
+def _orjson_dumps(document):
+    try:
+        return orjson.dumps(document)
+    except TypeError:
+        # orjson.JSONEncodeError, e.g. integers outside 64 bits
+        return _stdlib_dumps(document)
+
+
+register_backend('stdlib', _stdlib_loads, _stdlib_dumps)
+if orjson is not None:
+    register_backend('orjson', _orjson_loads, _orjson_dumps)
+configure()
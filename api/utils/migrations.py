@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Schema migrations for databases created before a model change.
+
+``db.create_all`` only creates missing tables, so any change to an existing
+table (new index, new column) is registered here as an ordered, idempotent
+step. Applied steps are recorded in ``schema_migration``; run them with
+``python manage.py migrate``.
+"""
+import hashlib
+import logging
+from sqlalchemy import exists, func, inspect
+from sqlalchemy.schema import CreateColumn
+from api.models.json import Json
+from api.models.json_access_map import JsonAccessMap
+from api.models.json_body import JsonBody
+from api.models.json_term import JsonTerm
+from api.models.json_version import JsonVersion
+from api.models.schema_migration import SchemaMigration
+from api.models.team import Team
+from api.models.team_json_map import TeamJsonMap
+from api.models.team_member_map import TeamMemberMap
+from api.models.user import User
+from api.utils import codec, counters, json_backend
+from api.utils.database import db
+from api.utils.search import document_terms
+
+MIGRATIONS = []
+
+
+def migration(name):
+    """Register a migration step, steps run in registration order
+    :param name: str, unique name recorded once the step is applied
+    :return:
+    """
+    def decorator(func):
+        MIGRATIONS.append((name, func))
+        return func
+    return decorator
+
+
+def upgrade():
+    """Apply every pending migration
+    :return: [str] names of the applied migrations
+    """
+    db.create_all()
+    applied = {m.name for m in SchemaMigration.query.all()}
+    done = []
+    for name, step in MIGRATIONS:
+        if name in applied:
+            continue
+        logging.info("applying migration %s", name)
+        with db.engine.begin() as connection:
+            step(connection)
+        db.session.add(SchemaMigration(name))
+        db.session.commit()
+        done.append(name)
+    return done
+
+
+def create_missing_indexes(connection, table, names=None):
+    """Create the indexes declared on a table that the database does not have yet
+    :param connection:
+    :param table: sqlalchemy.Table
+    :param names: [str] only these indexes, for steps running before the columns of later indexes exist
+    :return:
+    """
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing and (names is None or index.name in names):
+            index.create(connection)
+
+
+def add_missing_columns(connection, table):
+    """Add the columns declared on a table that the database does not have yet
+    :param connection:
+    :param table: sqlalchemy.Table
+    :return: [str] names of the added columns
+    """
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+    added = []
+    for column in table.columns:
+        if column.name not in existing:
+            connection.execute("ALTER TABLE {} ADD COLUMN {}".format(
+                preparer.format_table(table), CreateColumn(column).compile(dialect=connection.dialect)))
+            added.append(column.name)
+    return added
+
+
+def _collapse_duplicates(connection, table, columns, keep_min=None):
+    """Delete rows repeating a logically unique column pair, keeping the oldest row
+    :param connection:
+    :param table: sqlalchemy.Table
+    :param columns: [str] columns of the pair
+    :param keep_min: str, column whose smallest value in the group is kept on the surviving row
+    :return:
+    """
+    keys = [table.c[c] for c in columns]
+    selected = keys + [func.min(table.c.id)]
+    if keep_min:
+        selected.append(func.min(table.c[keep_min]))
+    groups = connection.execute(
+        db.select(selected).group_by(*keys).having(func.count(table.c.id) > 1)).fetchall()
+
+    for group in groups:
+        pair = [key == value for key, value in zip(keys, group)]
+        survivor = group[len(columns)]
+        connection.execute(table.delete().where(db.and_(table.c.id != survivor, *pair)))
+        if keep_min:
+            connection.execute(table.update()
+                               .where(table.c.id == survivor)
+                               .values({keep_min: group[len(columns) + 1]}))
+
+
+@migration('0001_access_map_indexes')
+def _access_map_indexes(connection):
+    # keep the strongest permission (lowest JsonAccessMapType value) of duplicated grants
+    _collapse_duplicates(connection, JsonAccessMap.__table__, ['user', 'json'], keep_min='type')
+    _collapse_duplicates(connection, TeamMemberMap.__table__, ['user', 'team'], keep_min='type')
+    _collapse_duplicates(connection, TeamJsonMap.__table__, ['team', 'json'])
+
+    for table in (JsonAccessMap.__table__, TeamMemberMap.__table__, TeamJsonMap.__table__):
+        create_missing_indexes(connection, table)
+
+
+@migration('0002_user_counters')
+def _user_counters(connection):
+    add_missing_columns(connection, User.__table__)
+    counters.reconcile(connection)
+
+
+@migration('0003_json_updated_index')
+def _json_updated_index(connection):
+    json = Json.__table__
+    connection.execute(json.update().where(json.c.updated.is_(None)).values(updated=json.c.created))
+    # json.body only exists from 0005 on, its index comes with 0007
+    create_missing_indexes(connection, json, names=['ix_json_updated_id'])
+
+
+@migration('0004_team_member_listing_index')
+def _team_member_listing_index(connection):
+    table = TeamMemberMap.__table__
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    if 'ix_team_member_map_team_type' in existing:
+        # superseded by (team, user, type), which also orders member listings
+        legacy = db.Table(table.name, db.MetaData(), db.Column('team'), db.Column('type'))
+        db.Index('ix_team_member_map_team_type', legacy.c.team, legacy.c.type).drop(connection)
+    create_missing_indexes(connection, table)
+
+
+@migration('0005_json_body')
+def _json_body(connection, batch=500):
+    json = Json.__table__
+    add_missing_columns(connection, json)
+    if 'data' not in {column['name'] for column in inspect(connection).get_columns(json.name)}:
+        return
+
+    # move documents out of json in id order, one batch at a time, into json_body as it was then
+    legacy = db.Table(json.name, db.MetaData(), db.Column('id', db.BigInteger), db.Column('data', db.Text))
+    legacy_body = db.Table(JsonBody.__tablename__, db.MetaData(),
+                           db.Column('id', db.BigInteger, primary_key=True), db.Column('data', db.Text))
+    last = 0
+    while True:
+        rows = connection.execute(db.select([legacy.c.id, legacy.c.data])
+                                  .where(legacy.c.id > last).order_by(legacy.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            if row.data is not None:
+                encoded = row.data.encode('utf-8')
+                body = connection.execute(legacy_body.insert(), data=row.data).inserted_primary_key[0]
+                connection.execute(json.update().where(json.c.id == row.id)
+                                   .values(body=body, size=len(encoded),
+                                           hash=hashlib.sha256(encoded).hexdigest(),
+                                           updated=json.c.updated))
+        last = rows[-1].id
+
+    connection.execute("ALTER TABLE {} DROP COLUMN data".format(
+        connection.dialect.identifier_preparer.format_table(json)))
+
+
+@migration('0006_json_body_codec')
+def _json_body_codec(connection):
+    body = JsonBody.__table__
+    add_missing_columns(connection, body)
+
+    # existing documents are kept uncompressed, `manage.py compress-bodies` re-encodes them
+    if connection.dialect.name == 'mysql':
+        connection.execute("ALTER TABLE json_body MODIFY data LONGBLOB")
+    elif connection.dialect.name == 'sqlite':
+        connection.execute("UPDATE json_body SET data = CAST(data AS BLOB) WHERE typeof(data) = 'text'")
+    connection.execute(body.update().where(body.c.size.is_(None))
+                       .values(codec='identity', size=func.length(body.c.data), stored_size=func.length(body.c.data)))
+
+
+@migration('0007_json_body_dedup')
+def _json_body_dedup(connection):
+    json = Json.__table__
+    body = JsonBody.__table__
+    add_missing_columns(connection, body)
+
+    # every json had a body of its own, hashed on the json row: point each json at the oldest body
+    # of its hash and drop the bodies left unreferenced before hashing bodies, json_body.hash may
+    # already be unique when create_all made the table
+    groups = connection.execute(db.select([json.c.hash, func.min(json.c.body)])
+                                .where(json.c.hash.isnot(None)).group_by(json.c.hash)
+                                .having(func.count(json.c.id) > 1)).fetchall()
+    for digest, oldest in groups:
+        connection.execute(json.update().where(db.and_(json.c.hash == digest, json.c.body != oldest))
+                           .values(body=oldest, updated=json.c.updated))
+    connection.execute(body.delete().where(~exists([json.c.id]).where(json.c.body == body.c.id)))
+    connection.execute(body.update().where(body.c.hash.is_(None))
+                       .values(hash=db.select([json.c.hash]).where(json.c.body == body.c.id).limit(1).as_scalar()))
+    connection.execute(body.update()
+                       .values(ref_count=db.select([func.count(json.c.id)]).where(json.c.body == body.c.id)
+                               .as_scalar()))
+    create_missing_indexes(connection, body)
+    create_missing_indexes(connection, json)
+
+
+@migration('0008_json_versions')
+def _json_versions(connection):
+    json = Json.__table__
+    body = JsonBody.__table__
+    version = JsonVersion.__table__
+    add_missing_columns(connection, json)
+
+    # the current document of every json becomes its first version, a snapshot sharing its body
+    connection.execute(version.insert().from_select(
+        ['json', 'version', 'body', 'size', 'hash', 'created'],
+        db.select([json.c.id, json.c.version, json.c.body, json.c.size, json.c.hash, json.c.updated])
+        .where(~exists([version.c.id]).where(version.c.json == json.c.id))))
+    connection.execute(body.update().values(
+        ref_count=db.select([func.count(json.c.id)]).where(json.c.body == body.c.id).as_scalar() +
+        db.select([func.count(version.c.id)]).where(version.c.body == body.c.id).as_scalar()))
+
+
+@migration('0009_json_terms')
+def _json_terms(connection, batch=500):
+    json = Json.__table__
+    body = JsonBody.__table__
+    term = JsonTerm.__table__
+
+    # index the jsons saved before the search index, one batch at a time in id order
+    last = 0
+    while True:
+        rows = connection.execute(db.select([json.c.id, body.c.codec, body.c.data])
+                                  .select_from(json.join(body, json.c.body == body.c.id))
+                                  .where(db.and_(json.c.id > last,
+                                                 ~exists([term.c.id]).where(term.c.json == json.c.id)))
+                                  .order_by(json.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            try:
+                document = json_backend.loads(codec.decode(row.data, row.codec))
+            except ValueError:
+                logging.warning("json %s is not valid JSON, not indexed", row.id)
+                continue
+            terms = sorted(document_terms(document))
+            if terms:
+                connection.execute(term.insert(), [{'term': t, 'json': row.id} for t in terms])
+        last = rows[-1].id
+
+
+@migration('0010_validation_schemas')
+def _validation_schemas(connection):
+    add_missing_columns(connection, Json.__table__)
+    add_missing_columns(connection, Team.__table__)
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def encode_cursor(*values):
+    """Opaque cursor pointing after the row holding the given sort key values
+    :param values: int, str or datetime
+    :return: str
+    """
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, *types):
+    """Sort key values of a cursor made by encode_cursor
+    :param cursor: str
+    :param types: type of each value, int, str or datetime
+    :return: list
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("invalid cursor")
+    return [_parse(value, _type) for value, _type in zip(values, types)]
+
+
+def _parse(value, _type):
+    if value is None:
+        return None
+    if _type is datetime:
+        for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.strptime(value, fmt)
+            except (TypeError, ValueError):
+                pass
+        raise ValueError("invalid cursor")
+    try:
+        return _type(value)
+    except (TypeError, ValueError, OverflowError):
+        # a crafted cursor may hold any JSON value
+        raise ValueError("invalid cursor")
+
+
+def page_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Validated page size of a request argument
+    :param value: str or None
+    :param default: int
+    :param maximum: int
+    :return: int
+    :raises ValueError: if the value is not a positive integer
+    """
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("invalid limit")
+    return min(limit, maximum)
+
+
+def pagination(rows, limit, key):
+    """Split a page fetched with limit + 1 rows into the page and its pagination details
+    :param rows: rows ordered by the cursor sort key
+    :param limit: int, page size
+    :param key: callable returning the sort key values of a row
+    :return: (rows, dict)
+    """
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return rows, {
+        'limit': limit,
+        'next': encode_cursor(*key(rows[-1])) if has_next else None
+    }
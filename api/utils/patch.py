@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""JSON Patch (RFC 6902), JSON Merge Patch (RFC 7396) and JSON Pointer (RFC 6901).
+
+Patches never modify the document they are given: containers on the
+patched paths are copied and everything else is shared with the original,
+so patching a cached document costs the depth of the edit, not its size.
+"""
+import re
+
+JSON_PATCH = 'application/json-patch+json'
+MERGE_PATCH = 'application/merge-patch+json'
+MEDIA_TYPES = (JSON_PATCH, MERGE_PATCH)
+
+_ARRAY_INDEX = re.compile(r'^(0|[1-9][0-9]*)$')
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_pointer(pointer):
+    """
+    :param pointer: str, JSON Pointer
+    :return: [str] reference tokens
+    :raises PatchError: if the pointer is malformed
+    """
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise PatchError("invalid pointer {!r}".format(pointer))
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def format_pointer(tokens):
+    """
+    :param tokens: [str or int] reference tokens
+    :return: str, JSON Pointer
+    """
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1') for token in tokens)
+
+
+def _index(array, token, end=False):
+    if end and token == '-':
+        return len(array)
+    if not _ARRAY_INDEX.match(token) or int(token) > len(array) - (0 if end else 1):
+        raise PatchError("index {} out of range".format(token))
+    return int(token)
+
+
+def _child(container, token):
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError("member {} not found".format(token))
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token)]
+    raise PatchError("{} is not in a container".format(token))
+
+
+def resolve(document, tokens):
+    """
+    :param document: parsed document
+    :param tokens: [str] reference tokens
+    :return: the value the tokens point to
+    :raises PatchError: if it does not exist
+    """
+    for token in tokens:
+        document = _child(document, token)
+    return document
+
+
+def _update(document, tokens, change):
+    """Copy of the document where change(copy of the parent container, last token) is applied,
+    only the containers on the path are copied"""
+    if not isinstance(document, (dict, list)):
+        raise PatchError("{} is not in a container".format(tokens[0]))
+    copy = dict(document) if isinstance(document, dict) else list(document)
+    if len(tokens) == 1:
+        change(copy, tokens[0])
+    else:
+        key = tokens[0] if isinstance(copy, dict) else _index(copy, tokens[0])
+        copy[key] = _update(_child(document, tokens[0]), tokens[1:], change)
+    return copy
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+
+    def change(parent, token):
+        if isinstance(parent, dict):
+            parent[token] = value
+        else:
+            parent.insert(_index(parent, token, end=True), value)
+    return _update(document, tokens, change)
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise PatchError("the document root cannot be removed")
+
+    def change(parent, token):
+        if isinstance(parent, dict):
+            _child(parent, token)
+            del parent[token]
+        else:
+            del parent[_index(parent, token)]
+    return _update(document, tokens, change)
+
+
+def _replace(document, tokens, value):
+    if not tokens:
+        return value
+
+    def change(parent, token):
+        _child(parent, token)
+        parent[token if isinstance(parent, dict) else _index(parent, token)] = value
+    return _update(document, tokens, change)
+
+
+def equal(a, b):
+    """JSON equality: numbers by value, booleans distinct from numbers"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(equal(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(equal(x, y) for x, y in zip(a, b))
+    return (type(a) is type(b) or isinstance(a, (int, float)) and isinstance(b, (int, float))) and a == b
+
+
+def _member(operation, name):
+    if name not in operation:
+        raise PatchError("{} operation without {}".format(operation.get('op'), name))
+    return operation[name]
+
+
+def json_patch(document, operations):
+    """Apply a JSON Patch, every operation or none
+    :param document: parsed document, not modified
+    :param operations: parsed RFC 6902 patch
+    :return: patched document
+    :raises PatchError: if the patch is malformed or an operation fails
+    """
+    if not isinstance(operations, list):
+        raise PatchError("a JSON Patch is an array of operations")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PatchError("a JSON Patch operation is an object")
+        op = operation.get('op')
+        path = parse_pointer(_member(operation, 'path'))
+        if op == 'add':
+            document = _add(document, path, _member(operation, 'value'))
+        elif op == 'remove':
+            document = _remove(document, path)
+        elif op == 'replace':
+            document = _replace(document, path, _member(operation, 'value'))
+        elif op == 'move':
+            source = parse_pointer(_member(operation, 'from'))
+            if path[:len(source)] == source and len(path) > len(source):
+                raise PatchError("cannot move {} into itself".format(operation['from']))
+            value = resolve(document, source)
+            document = _add(_remove(document, source), path, value)
+        elif op == 'copy':
+            document = _add(document, path, resolve(document, parse_pointer(_member(operation, 'from'))))
+        elif op == 'test':
+            if not equal(resolve(document, path), _member(operation, 'value')):
+                raise PatchError("test failed at {}".format(operation['path']))
+        else:
+            raise PatchError("unknown operation {!r}".format(op))
+    return document
+
+
+def merge_patch(document, patch):
+    """Apply a JSON Merge Patch
+    :param document: parsed document, not modified
+    :param patch: parsed RFC 7396 patch
+    :return: patched document
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(document) if isinstance(document, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def apply(media_type, document, patch):
+    """
+    :param media_type: str, one of MEDIA_TYPES
+    :param document: parsed document, not modified
+    :param patch: parsed patch
+    :return: patched document
+    :raises PatchError:
+    """
+    if media_type == JSON_PATCH:
+        return json_patch(document, patch)
+    return merge_patch(document, patch)
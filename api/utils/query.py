@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import jmespath
+from jmespath.exceptions import JMESPathError
+from api.utils.cache import MISSING, query_expression_cache
+
+
+def compile_expression(expr):
+    """Compiled JMESPath expression, compiled once per process
+    :param expr: str
+    :return: jmespath.parser.ParsedResult
+    :raises ValueError: if the expression is not valid JMESPath
+    """
+    compiled = query_expression_cache.get(expr)
+    if compiled is MISSING:
+        try:
+            compiled = jmespath.compile(expr)
+        except JMESPathError as e:
+            raise ValueError(str(e))
+        query_expression_cache.set(expr, compiled)
+    return compiled
+
+
+def search(expr, document):
+    """Part of a document matching a JMESPath expression
+    :param expr: str
+    :param document: parsed document
+    :return: matching subtree, None when nothing matches
+    :raises ValueError: if the expression is invalid or fails on the document
+    """
+    compiled = compile_expression(expr)
+    try:
+        return compiled.search(document)
+    except JMESPathError as e:
+        raise ValueError(str(e))
@@ -1,7 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from flask import make_response, jsonify
+import hashlib
+from flask import Response, make_response, request
+from api.utils import json_backend
+from api.utils.compression import ENCODINGS, encoded_etag
 
 INVALID_FIELD_NAME_SENT_422 = {
     "http_code": 422,
@@ -50,13 +53,51 @@ NOT_FOUND_HANDLER_404 = {
     "message": "There are no such handler"
 }
 
+CONFLICT_409 = {
+    "http_code": 409,
+    "code": "conflict",
+    "message": "A concurrent request changed the resource, retry"
+}
+
+PRECONDITION_FAILED_412 = {
+    "http_code": 412,
+    "code": "preconditionFailed",
+    "message": "The resource has changed"
+}
+
+UNSUPPORTED_MEDIA_TYPE_415 = {
+    "http_code": 415,
+    "code": "unsupportedMediaType",
+    "message": "Unsupported Content-Type"
+}
+
 SUCCESS_200 = {
     "http_code": 200,
     "message": "Success"
 }
 
 
-def response_with(response, value=None, message=None, error=None, headers={}, pagination=None):
+NOT_MODIFIED_304 = {
+    "http_code": 304
+}
+
+
+def response_with(response, value=None, message=None, error=None, headers={}, pagination=None,
+                  etag=None, last_modified=None):
+    if value is None and not message and error is None and pagination is None:
+        body = _static_body(response)
+    else:
+        body = json_backend.dumps(_result(response, value, message, error, pagination))
+
+    headers = dict(headers)
+    headers.update({'Access-Control-Allow-Origin': '*'})
+    headers.update({'server': 'JSONx'})
+
+    return _validators(Response(body, status=response['http_code'], headers=headers, mimetype='application/json'),
+                       etag, last_modified)
+
+
+def _result(response, value=None, message=None, error=None, pagination=None):
     result = {}
     if value is not None:
         result.update(value)
@@ -75,8 +116,94 @@ def response_with(response, value=None, message=None, error=None, headers={}, pa
 
     if pagination is not None:
         result.update({'pagination': pagination})
+    return result
+
+
+# bodies of responses sent without details, encoded once
+_static_bodies = {}
+
+
+def _static_body(response):
+    key = (response.get('code'), response.get('message'))
+    body = _static_bodies.get(key)
+    if body is None:
+        body = _static_bodies[key] = json_backend.dumps(_result(response))
+    return body
+
 
+def raw_response(body, headers=None, content_type='application/json; charset=utf-8', etag=None,
+                 last_modified=None):
+    """Response sending a body as it is, without the JSON envelope, X- headers are exposed to browsers
+    :param body: bytes or iterable of bytes
+    :param headers: dict
+    :param content_type: str
+    :param etag: str, see entity_tag
+    :param last_modified: datetime, UTC
+    :return:
+    """
+    headers = dict(headers or {})
     headers.update({'Access-Control-Allow-Origin': '*'})
+    headers.update({'Access-Control-Expose-Headers': ', '.join(sorted(k for k in headers if k.startswith('X-')))})
     headers.update({'server': 'JSONx'})
 
-    return make_response(jsonify(result), response['http_code'], headers)
+    return _validators(Response(body, status=SUCCESS_200['http_code'], headers=headers, content_type=content_type),
+                       etag, last_modified)
+
+
+def entity_tag(*parts):
+    """Strong entity tag of a representation identified by the given parts
+    :param parts: values the representation is built from, str() of each is hashed
+    :return: str, unquoted
+    """
+    return hashlib.sha256('\x00'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def not_modified(etag=None, last_modified=None):
+    """304 response when the request's If-None-Match or, without it, If-Modified-Since
+    matches the current validators, None when the full response has to be sent
+    :param etag: str, see entity_tag
+    :param last_modified: datetime, UTC
+    :return: response or None
+    """
+    if request.if_none_match:
+        # the client may hold the representation compressed by the compression middleware
+        tags = [etag] + [encoded_etag(etag, e) for e in ENCODINGS] if etag is not None else []
+        matched = [tag for tag in tags if request.if_none_match.contains_weak(tag)]
+        if not matched:
+            return None
+        etag = matched[0]
+    elif last_modified is None or request.if_modified_since is None or \
+            last_modified.replace(microsecond=0, tzinfo=None) > request.if_modified_since.replace(tzinfo=None):
+        return None
+
+    headers = {'Access-Control-Allow-Origin': '*', 'server': 'JSONx'}
+    return _validators(make_response('', NOT_MODIFIED_304['http_code'], headers), etag, last_modified)
+
+
+def precondition_failed(etag):
+    """412 response when the request's If-Match does not match the current entity tag, None otherwise
+    :param etag: str, see entity_tag
+    :return: response or None
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = [etag] + [encoded_etag(etag, e) for e in ENCODINGS]
+    if any(request.if_match.contains(tag) for tag in tags):
+        return None
+    return response_with(PRECONDITION_FAILED_412, etag=etag)
+
+
+def _validators(response, etag, last_modified):
+    if etag is not None:
+        response.set_etag(etag)
+        # polled responses are revalidated on every use
+        response.headers['Cache-Control'] = 'private, no-cache'
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+for _response in (INVALID_FIELD_NAME_SENT_422, INVALID_INPUT_422, MISSING_PARAMETERS_422, BAD_REQUEST_400,
+                  SERVER_ERROR_500, SERVER_ERROR_404, UNAUTHORIZED_403, NOT_FOUND_HANDLER_404, PRECONDITION_FAILED_412,
+                  UNSUPPORTED_MEDIA_TYPE_415, SUCCESS_200):
+    _static_body(_response)
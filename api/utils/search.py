@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Terms of the document search index.
+
+A document is indexed under every object key it contains, every key path
+(a JSON Pointer where array indexes are ``*``, e.g. ``/items/*/name``),
+every scalar value and every value at its path. Terms are stored as
+fixed-size digests, so any key or value fits the index whatever its length.
+"""
+import hashlib
+from api.utils import json_backend
+
+# longer strings are not indexed as values, the index is not a full-text index
+MAX_VALUE_LENGTH = 256
+
+KEY = 'key'
+PATH = 'path'
+VALUE = 'value'
+PATH_VALUE = 'path_value'
+
+
+def term(kind, text):
+    """
+    :param kind: str, KEY, PATH, VALUE or PATH_VALUE
+    :param text: str
+    :return: str, 32 hexadecimal characters
+    """
+    return hashlib.sha256((kind + '\x00' + text).encode('utf-8')).hexdigest()[:32]
+
+
+def value_text(value):
+    """Canonical text of a scalar, numbers equal in JSON have the same text
+    :param value: str, int, float, bool or None
+    :return: str
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        # integers of any size, not only those the JSON backend writes natively
+        return str(value)
+    return json_backend.dumps(value).decode('utf-8')
+
+
+def document_terms(document):
+    """
+    :param document: parsed document
+    :return: set of str, terms of the document
+    """
+    found = set()
+    _collect(document, '', found)
+    return found
+
+
+def _collect(node, path, found):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            child = path + '/' + key.replace('~', '~0').replace('/', '~1')
+            found.add(term(KEY, key))
+            found.add(term(PATH, child))
+            _collect(value, child, found)
+    elif isinstance(node, list):
+        child = path + '/*'
+        for value in node:
+            _collect(value, child, found)
+    elif not isinstance(node, str) or len(node) <= MAX_VALUE_LENGTH:
+        text = value_text(node)
+        found.add(term(VALUE, text))
+        found.add(term(PATH_VALUE, path + '\x00' + text))
+
+
+def query_terms(keys=(), paths=(), values=()):
+    """Terms a document has to contain to match a search
+    :param keys: [str] object keys
+    :param paths: [str] key paths, each paired with the value of the same position when values are given
+    :param values: [str] JSON texts of scalars, a text that is not JSON is searched as a string
+    :return: set of str
+    :raises ValueError: if paths and values are given in different numbers or a value is not a scalar
+    """
+    if paths and values and len(paths) != len(values):
+        raise ValueError("paths and values do not pair up")
+    texts = []
+    for value in values:
+        try:
+            parsed = json_backend.loads(value)
+        except ValueError:
+            parsed = value
+        if isinstance(parsed, (dict, list)):
+            raise ValueError("only scalar values are indexed")
+        texts.append(value_text(parsed))
+
+    found = {term(KEY, key) for key in keys}
+    if paths and texts:
+        found.update(term(PATH_VALUE, path + '\x00' + text) for path, text in zip(paths, texts))
+    else:
+        found.update(term(PATH, path) for path in paths)
+        found.update(term(VALUE, text) for text in texts)
+    return found
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Serializers of the read routes' responses.
+
+Each serializer is built once at import and turns a model instance or a
+query row into the dict the route sends, with the same values the model's
+marshmallow schema dumps, without building a schema per request.
+"""
+from operator import attrgetter
+
+
+def text(value):
+    """String field of a schema: str() of the value, None kept"""
+    return str(value) if value is not None else None
+
+
+def serializer(*names, **converted):
+    """
+    :param names: attributes copied as they are
+    :param converted: attribute -> callable applied to its value
+    :return: callable(obj) -> dict
+    """
+    fields = [(name, attrgetter(name), None) for name in names] + \
+             [(name, attrgetter(name), convert) for name, convert in sorted(converted.items())]
+
+    def serialize(obj):
+        return {name: convert(get(obj)) if convert is not None else get(obj) for name, get, convert in fields}
+    return serialize
+
+
+user_details = serializer('id', 'name', 'surname', 'email', 'login', 'json_count', 'team_count',
+                          created=text, updated=text)
+
+team_details = serializer('id', 'name', created=text, updated=text)
+
+json_details = serializer('id', 'data', 'version', created=text, updated=text)
+
+listed_json = serializer('id', 'permission', created=text, updated=text)
+
+listed_team = serializer('id', 'name', 'type', created=text, updated=text)
+
+listed_member = serializer('id', 'name', 'surname', 'login', 'type')
+
+listed_version = serializer('version', 'size', 'hash', 'author', created=text, snapshot=bool)
+
+version_details = serializer('json', 'version', 'size', 'hash', 'author', created=text)
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Request-scoped unit of work.
+
+Model methods only stage their changes, flushing them when a generated id or
+a constraint violation is needed right away. Each request commits once, after
+its view returned a successful response, and rolls back otherwise, so a
+request is applied entirely or not at all. Work that may only happen once the
+changes are durable, such as invalidating the permission caches, is
+registered with ``after_commit``. Code running outside a request (scripts,
+tests) commits with ``unit_of_work``.
+"""
+import logging
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.utils.database import db
+from api.utils.responses import response_with
+from api.utils import responses as resp
+
+_CALLBACKS = 'after_commit'
+
+
+def after_commit(callback):
+    """Call callback once the current transaction is committed, it is dropped if the transaction rolls back
+    :param callback: callable()
+    :return:
+    """
+    db.session().info.setdefault(_CALLBACKS, []).append(callback)
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    # releasing a savepoint fires after_commit too, the outer transaction may still roll back
+    if session.transaction is not None and session.transaction.nested:
+        return
+    for callback in session.info.pop(_CALLBACKS, []):
+        callback()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _rolled_back(session, previous_transaction):
+    # savepoints rolled back inside the transaction keep its callbacks
+    if previous_transaction.parent is None:
+        session.info.pop(_CALLBACKS, None)
+
+
+@contextmanager
+def unit_of_work():
+    """Commit the changes staged in the block, roll them back if it raises"""
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def init_app(app):
+    """Commit once per request, after the view and before the response is sent
+    :param app: Flask
+    :return:
+    """
+    @app.after_request
+    def commit(response):
+        # error responses and failed flushes leave nothing behind
+        if response.status_code >= 400 or not db.session.is_active:
+            db.session.rollback()
+            return response
+        try:
+            db.session.commit()
+        except Exception as e:
+            logging.error(e)
+            db.session.rollback()
+            return response_with(resp.SERVER_ERROR_500)
+        return response
+
+    @app.teardown_request
+    def rollback(exception):
+        if exception is not None:
+            db.session.rollback()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""JSON Schema validation of documents.
+
+A schema is checked and compiled once per process and kept in
+``schema_validator_cache`` under its hash. When ``fastjsonschema`` is
+installed the schema is also compiled to Python code, which accepts valid
+documents without interpreting the schema; only documents it rejects are
+walked by ``jsonschema`` to report their errors.
+"""
+import hashlib
+from itertools import chain, islice
+import jsonschema
+from jsonschema.exceptions import SchemaError
+from api.utils import json_backend
+from api.utils.cache import MISSING, schema_validator_cache
+from api.utils.patch import format_pointer
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# errors reported per validation unless asked otherwise
+MAX_ERRORS = 100
+
+
+class Validator(object):
+    """A checked schema and its compiled forms"""
+
+    def __init__(self, schema):
+        """
+        :param schema: parsed JSON Schema
+        :raises ValueError: if the schema is not a valid JSON Schema
+        """
+        if not isinstance(schema, (dict, bool)):
+            raise ValueError("a JSON Schema is an object or a boolean")
+        cls = jsonschema.validators.validator_for(schema)
+        try:
+            cls.check_schema(schema)
+        except SchemaError as e:
+            raise ValueError(e.message)
+        self.validator = cls(schema)
+        self.compiled = None
+        if fastjsonschema is not None:
+            try:
+                self.compiled = fastjsonschema.compile(schema)
+            except Exception:
+                # keywords it does not support, jsonschema alone validates
+                self.compiled = None
+
+    def is_valid(self, document):
+        if self.compiled is not None:
+            try:
+                self.compiled(document)
+                return True
+            except fastjsonschema.JsonSchemaException:
+                pass
+        return self.validator.is_valid(document)
+
+    def iter_errors(self, document):
+        """Errors of a document, produced one at a time while the document is walked
+        :param document: parsed document
+        :return: generator of {'path', 'schema_path', 'message'}, paths as JSON Pointers
+        """
+        if self.is_valid(document):
+            return
+        for error in self.validator.iter_errors(document):
+            yield {
+                'path': format_pointer(error.absolute_path),
+                'schema_path': format_pointer(error.absolute_schema_path),
+                'message': error.message
+            }
+
+
+def compile_schema(digest, load):
+    """Validator of a schema, compiled once per process
+    :param digest: str, SHA-256 hex digest of the schema's canonical form
+    :param load: callable() -> parsed schema, only called when the validator is not cached
+    :return: Validator
+    :raises ValueError: if the schema is not a valid JSON Schema
+    """
+    validator = schema_validator_cache.get(digest)
+    if validator is MISSING:
+        validator = Validator(load())
+        schema_validator_cache.set(digest, validator)
+    return validator
+
+
+def load_schema(data):
+    """Canonical form and validator of a schema sent by a client
+    :param data: str or bytes, JSON text of the schema, or the schema itself, a dict or a bool
+    :return: (bytes, Validator), the canonical utf-8 encoded schema and its validator
+    :raises ValueError: if data is not JSON or not a valid JSON Schema
+    """
+    if isinstance(data, (str, bytes)):
+        schema = json_backend.loads(data)
+    elif isinstance(data, (dict, bool)):
+        schema = data
+    else:
+        raise ValueError("a schema is JSON text, an object or a boolean")
+    canonical = json_backend.canonical(schema)
+    return canonical, compile_schema(hashlib.sha256(canonical).hexdigest(), lambda: schema)
+
+
+def errors(validators, document, limit=MAX_ERRORS):
+    """First errors of a document against every validator, validation stops once limit errors are found
+    :param validators: [Validator]
+    :param document: parsed document
+    :param limit: int
+    :return: [dict], empty when the document is valid
+    """
+    return list(islice(chain.from_iterable(v.iter_errors(document) for v in validators), limit))
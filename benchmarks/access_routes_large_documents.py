@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Access-management routes with large documents.
+
+Stores DOCUMENTS documents of SIZE bytes, then times sharing and unsharing
+them with a team through the routes, and the metadata lookup those routes
+rely on against loading the row together with its body (what
+``Json.query.filter_by(id=...).first()`` did while the body was a column of
+json).
+
+    python -m benchmarks.access_routes_large_documents --size 5000000
+"""
+import argparse
+import json
+import os
+import time
+from api.models.json import Json
+from api.utils.config import Config
+from api.utils.database import db
+from api.utils.factory import create_app
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/jsonx_bench.db")
+
+
+def document(size):
+    item = {"id": 0, "name": "x" * 40, "tags": ["a", "b", "c"], "active": True}
+    items = max(size // len(json.dumps(item)), 1)
+    return json.dumps({"items": [dict(item, id=i) for i in range(items)]})
+
+
+def timed(label, func, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print("  {:<34} p50 {:9.3f} ms   max {:9.3f} ms".format(label, timings[len(timings) // 2], timings[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000000)
+    parser.add_argument('--documents', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    user = {"name": "bench", "surname": "bench", "email": "bench@jsonx", "login": "bench", "password": "bench"}
+    client.post("/api/v1.0/user", data=json.dumps(user), content_type="application/json")
+    response = client.post("/api/v1.0/login", data=json.dumps(user), content_type="application/json")
+    headers = {'Authorization': json.loads(response.data)['token']}
+    response = client.post("/api/v1.0/team", headers=headers,
+                           data=json.dumps({"name": "bench"}), content_type="application/json")
+    team = json.loads(response.data)['team']['id']
+
+    body = document(args.size)
+    ids = []
+    for _ in range(args.documents):
+        response = client.post("/api/v1.0/json/save", headers=headers,
+                               data=json.dumps({"data": body}), content_type="application/json")
+        ids.append(json.loads(response.data)['id'])
+    print("{} documents of {} bytes".format(len(ids), len(body)))
+
+    def share():
+        for json_id in ids:
+            client.post("/api/v1.0/json/{}/team/{}".format(json_id, team), headers=headers)
+
+    def unshare():
+        for json_id in ids:
+            client.delete("/api/v1.0/json/{}/team/{}".format(json_id, team), headers=headers)
+
+    def metadata():
+        db.session.expunge_all()
+        for json_id in ids:
+            Json.query.filter_by(id=json_id).first()
+
+    def with_body():
+        db.session.expunge_all()
+        for json_id in ids:
+            Json.query.options(db.joinedload(Json.content)).filter_by(id=json_id).first()
+
+    with app.app_context():
+        print("per {} documents".format(len(ids)))
+        timed("POST json/<id>/team/<id>", share, args.samples)
+        timed("DELETE json/<id>/team/<id>", unshare, args.samples)
+        timed("existence check, metadata row", metadata, args.samples)
+        timed("existence check, row and body", with_body, args.samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Requests per second of the hot read routes.
+
+Serves GET user/<id>, team/<id>, json/<id>, json and team through the test
+client, then times building the user details response the way the routes
+did before (a UserSchema per request, dumped and passed to Flask's jsonify,
+pretty-printed with sorted keys) against the compiled serializer and
+response_with.
+
+    python -m benchmarks.read_routes_throughput --requests 2000
+"""
+import argparse
+import json
+import os
+import time
+from flask import jsonify
+from api.models.user import User, UserSchema
+from api.utils import serializers
+from api.utils.config import Config
+from api.utils.database import db
+from api.utils.factory import create_app
+from api.utils.responses import response_with
+from api.utils import responses as resp
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/jsonx_bench.db")
+
+
+def throughput(label, func, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        func()
+    elapsed = time.perf_counter() - start
+    print("  {:<34} {:9.0f} requests/s".format(label, requests / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    user = {"name": "bench", "surname": "bench", "email": "bench@jsonx", "login": "bench", "password": "bench"}
+    client.post("/api/v1.0/user", data=json.dumps(user), content_type="application/json")
+    response = client.post("/api/v1.0/login", data=json.dumps(user), content_type="application/json")
+    data = json.loads(response.data)
+    headers = {'Authorization': data['token']}
+    uid = data['user']['id']
+    response = client.post("/api/v1.0/team", headers=headers,
+                           data=json.dumps({"name": "bench"}), content_type="application/json")
+    team = json.loads(response.data)['team']['id']
+    response = client.post("/api/v1.0/json/save", headers=headers,
+                           data=json.dumps({"data": json.dumps({"name": "bench", "items": list(range(50))})}),
+                           content_type="application/json")
+    json_id = json.loads(response.data)['id']
+
+    print("routes, {} requests each".format(args.requests))
+    for label, url in [("GET user/<id>", "/api/v1.0/user/{}".format(uid)),
+                       ("GET team/<id>", "/api/v1.0/team/{}".format(team)),
+                       ("GET json/<id>", "/api/v1.0/json/{}".format(json_id)),
+                       ("GET json", "/api/v1.0/json"),
+                       ("GET team", "/api/v1.0/team")]:
+        throughput(label, lambda: client.get(url, headers=headers), args.requests)
+
+    with app.test_request_context():
+        fetched = User.query.get(uid)
+
+        def before():
+            user_data, error = UserSchema().dump(fetched)
+            jsonify({k: user_data[k] for k in
+                     ('id', 'name', 'surname', 'email', 'login', 'created', 'updated', 'json_count', 'team_count')})
+
+        def after():
+            response_with(resp.SUCCESS_200, value=serializers.user_details(fetched))
+
+        def error_before():
+            jsonify({'message': resp.SERVER_ERROR_500['message'], 'code': resp.SERVER_ERROR_500['code']})
+
+        def error_after():
+            response_with(resp.SERVER_ERROR_500)
+
+        print("user details response, {} builds each".format(args.requests))
+        throughput("schema and jsonify", before, args.requests)
+        throughput("serializer and response_with", after, args.requests)
+        print("SERVER_ERROR_500 response")
+        throughput("jsonify", error_before, args.requests)
+        throughput("pre-encoded", error_after, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Saving many small documents one request at a time against POST /v1.0/json/bulk.
+
+    python -m benchmarks.save_json_bulk --documents 1000
+"""
+import argparse
+import json
+import os
+import time
+from api.utils.config import Config
+from api.utils.database import db
+from api.utils.factory import create_app
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/jsonx_bench.db")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    user = {"name": "bench", "surname": "bench", "email": "bench@jsonx", "login": "bench", "password": "bench"}
+    client.post("/api/v1.0/user", data=json.dumps(user), content_type="application/json")
+    response = client.post("/api/v1.0/login", data=json.dumps(user), content_type="application/json")
+    headers = {'Authorization': json.loads(response.data)['token']}
+    documents = [{"fixture": i, "name": "x" * 40, "tags": ["a", "b", "c"]} for i in range(args.documents)]
+
+    print("{} documents".format(args.documents))
+    start = time.perf_counter()
+    for document in documents:
+        client.post("/api/v1.0/json/save", headers=headers, content_type="application/json",
+                    data=json.dumps({"data": json.dumps(document)}))
+    print("  {:<34} {:9.3f} s".format("POST json/save per document", time.perf_counter() - start))
+
+    for label, content_type, body in [
+            ("POST json/bulk, array", "application/json", json.dumps(documents)),
+            ("POST json/bulk, NDJSON", "application/x-ndjson", "\n".join(json.dumps(d) for d in documents))]:
+        start = time.perf_counter()
+        client.post("/api/v1.0/json/bulk", headers=headers, content_type=content_type, data=body)
+        print("  {:<34} {:9.3f} s".format(label, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
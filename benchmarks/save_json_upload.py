@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Parsing of uploaded documents at 1KB, 1MB and 20MB.
+
+Times the enveloped upload as save_json handled it (parse the envelope, parse
+the document again to validate it, store the string as sent) against the raw
+upload with every available JSON backend (parse the body once, store its
+compact serialization), then both through POST /v1.0/json/save.
+
+    python -m benchmarks.save_json_upload --samples 5
+"""
+import argparse
+import json
+import os
+from api.utils import json_backend
+from api.utils.config import Config
+from api.utils.database import db
+from api.utils.factory import create_app
+from benchmarks.access_routes_large_documents import document, timed
+
+SIZES = [('1KB', 1000), ('1MB', 1000000), ('20MB', 20000000)]
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/jsonx_bench.db")
+
+
+def parsing(body, samples):
+    envelope = json.dumps({"data": body}).encode('utf-8')
+    raw = body.encode('utf-8')
+
+    def enveloped():
+        json.loads(json.loads(envelope.decode('utf-8'))['data'])
+
+    timed("envelope, parsed twice", enveloped, samples)
+    for name in sorted(json_backend.BACKENDS):
+        json_backend.configure(name)
+        timed("raw, {} parse and minify".format(name),
+              lambda: json_backend.canonical(json_backend.loads(raw)), samples)
+    json_backend.configure()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    user = {"name": "bench", "surname": "bench", "email": "bench@jsonx", "login": "bench", "password": "bench"}
+    client.post("/api/v1.0/user", data=json.dumps(user), content_type="application/json")
+    response = client.post("/api/v1.0/login", data=json.dumps(user), content_type="application/json")
+    headers = {'Authorization': json.loads(response.data)['token']}
+
+    for label, size in SIZES:
+        body = document(size)
+        print("{} ({} bytes), JSON backend {}".format(label, len(body), json_backend.backend()))
+        parsing(body, args.samples)
+
+        envelope = json.dumps({"data": body})
+        timed("POST json/save, envelope", lambda: client.post(
+            "/api/v1.0/json/save", headers=headers, data=envelope, content_type="application/json"), args.samples)
+        timed("POST json/save?raw=true", lambda: client.post(
+            "/api/v1.0/json/save?raw=true", headers=headers, data=body, content_type="application/json"),
+            args.samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""JSON Schema validation of a document holding a 10k-element array.
+
+Times checking and building a validator on every request against the
+validator cached by schema hash, validating a valid document with jsonschema
+alone and with the fastjsonschema fast path, and reporting the first errors
+of an invalid document; then POST /v1.0/json/validate with both documents.
+
+    python -m benchmarks.validate_large_array --elements 10000
+"""
+import argparse
+import json
+import os
+from api.utils import validation
+from api.utils.cache import schema_validator_cache
+from api.utils.config import Config
+from api.utils.database import db
+from api.utils.factory import create_app
+from benchmarks.access_routes_large_documents import timed
+
+SCHEMA = {
+    "type": "object",
+    "required": ["items"],
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["id", "name", "tags", "active"],
+                "properties": {
+                    "id": {"type": "integer", "minimum": 0},
+                    "name": {"type": "string", "maxLength": 64},
+                    "tags": {"type": "array", "items": {"type": "string"}, "uniqueItems": True},
+                    "active": {"type": "boolean"}
+                }
+            }
+        }
+    }
+}
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/jsonx_bench.db")
+
+
+def documents(elements):
+    item = {"id": 0, "name": "x" * 40, "tags": ["a", "b", "c"], "active": True}
+    valid = {"items": [dict(item, id=i) for i in range(elements)]}
+    # every tenth element has a wrong type
+    invalid = {"items": [dict(item, id=str(i)) if i % 10 == 0 else dict(item, id=i) for i in range(elements)]}
+    return valid, invalid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elements', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    valid, invalid = documents(args.elements)
+    schema = json.dumps(SCHEMA)
+
+    def uncached():
+        schema_validator_cache.clear()
+        validation.load_schema(schema)
+
+    print("validator, {} samples".format(args.samples))
+    timed("checked and built per request", uncached, args.samples)
+    timed("cached by schema hash", lambda: validation.load_schema(schema), args.samples)
+
+    validator = validation.load_schema(schema)[1]
+    compiled, validator.compiled = validator.compiled, None
+    print("valid document, {} elements".format(args.elements))
+    timed("jsonschema", lambda: validation.errors([validator], valid), args.samples)
+    validator.compiled = compiled
+    if compiled is not None:
+        timed("fastjsonschema fast path", lambda: validation.errors([validator], valid), args.samples)
+
+    print("invalid document, {} errors".format(args.elements // 10))
+    timed("first {} errors".format(validation.MAX_ERRORS), lambda: validation.errors([validator], invalid),
+          args.samples)
+    timed("every error", lambda: validation.errors([validator], invalid, args.elements), args.samples)
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    user = {"name": "bench", "surname": "bench", "email": "bench@jsonx", "login": "bench", "password": "bench"}
+    client.post("/api/v1.0/user", data=json.dumps(user), content_type="application/json")
+    response = client.post("/api/v1.0/login", data=json.dumps(user), content_type="application/json")
+    headers = {'Authorization': json.loads(response.data)['token']}
+
+    print("POST /v1.0/json/validate")
+    for label, document in [("valid", valid), ("invalid", invalid)]:
+        body = json.dumps({"data": json.dumps(document), "schema": schema})
+        timed(label, lambda: client.post("/api/v1.0/json/validate", headers=headers, data=body,
+                                         content_type="application/json"), args.samples)
+
+
+if __name__ == '__main__':
+    main()
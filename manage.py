@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import datetime, timedelta
+import click
+from api.utils.factory import create_app
+from api.utils.config import DevelopmentConfig, ProductionConfig
+from api.models.json_body import JsonBody
+from api.models.json_version import JsonVersion
+from api.models.user import User
+from api.utils import codec, counters, migrations
+from api.utils.database import db
+
+
+def _app():
+    if os.environ.get('WORK_ENV') == 'PROD':
+        return create_app(ProductionConfig)
+    return create_app(DevelopmentConfig)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+def migrate():
+    """Bring the schema of an existing database up to date."""
+    with _app().app_context():
+        applied = migrations.upgrade()
+    click.echo("applied: {}".format(", ".join(applied) if applied else "nothing, schema is up to date"))
+
+
+@cli.command('reconcile-counters')
+@click.option('--batch', default=1000, help='Users updated per transaction.')
+def reconcile_counters(batch):
+    """Rebuild user json_count and team_count from the access-map tables."""
+    with _app().app_context():
+        last = 0
+        while True:
+            ids = [row.id for row in db.session.query(User.id)
+                   .filter(User.id > last).order_by(User.id).limit(batch)]
+            if not ids:
+                break
+            counters.reconcile(db.session.connection(), ids)
+            db.session.commit()
+            last = ids[-1]
+            click.echo("reconciled users up to {}".format(last))
+
+
+@cli.command('compress-bodies')
+@click.option('--batch', default=100, help='Documents re-encoded per transaction.')
+def compress_bodies(batch):
+    """Re-encode stored documents with the configured codec."""
+    with _app().app_context():
+        last = 0
+        while True:
+            bodies = JsonBody.query.filter(JsonBody.id > last, JsonBody.codec != codec.default_codec())\
+                .order_by(JsonBody.id).limit(batch).all()
+            if not bodies:
+                break
+            for body in bodies:
+                raw = codec.decode(body.data, body.codec)
+                body.codec, body.data = codec.encode(raw)
+                body.stored_size = len(body.data)
+            db.session.commit()
+            last = bodies[-1].id
+            click.echo("re-encoded documents up to {}".format(last))
+
+
+@cli.command('gc-bodies')
+@click.option('--batch', default=1000, help='Documents deleted per transaction.')
+def gc_bodies(batch):
+    """Delete stored documents no json references anymore."""
+    with _app().app_context():
+        deleted = JsonBody.collect_garbage(batch)
+    click.echo("deleted {} unreferenced documents".format(deleted))
+
+
+@cli.command('compact-versions')
+@click.option('--days', default=90, help='Deltas older than this many days are dropped.')
+@click.option('--batch', default=100, help='Documents compacted per query.')
+def compact_versions(days, batch):
+    """Drop old deltas from version history, keeping snapshots and latest versions."""
+    with _app().app_context():
+        before = datetime.utcnow() - timedelta(days=days)
+        last = 0
+        while True:
+            ids = [row.json for row in db.session.query(JsonVersion.json)
+                   .filter(JsonVersion.json > last, JsonVersion.body.is_(None), JsonVersion.created < before)
+                   .group_by(JsonVersion.json).order_by(JsonVersion.json).limit(batch)]
+            if not ids:
+                break
+            dropped = sum(JsonVersion.compact(json_id, before) for json_id in ids)
+            last = ids[-1]
+            click.echo("dropped {} versions of documents up to {}".format(dropped, last))
+
+
+@cli.command('storage-report')
+def storage_report():
+    """Print the compression ratio and storage saved per codec."""
+    with _app().app_context():
+        rows = JsonBody.storage_report()
+    total_size = sum(row[2] or 0 for row in rows)
+    total_stored = sum(row[3] or 0 for row in rows)
+    for name, documents, size, stored in rows + [('total', sum(row[1] for row in rows), total_size, total_stored)]:
+        size, stored = size or 0, stored or 0
+        click.echo("{:<10} {:>9} documents {:>15} bytes stored as {:>15} ratio {:>6.2f}x saved {:>15} bytes".format(
+            name, documents, size, stored, size / stored if stored else 1.0, size - stored))
+
+
+if __name__ == '__main__':
+    cli()